@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+
+""" iso8601bench -- a micro-benchmark of readings timestamp parsing
+
+Compares foglamp.device.iso8601.parse, which the device service uses to parse
+the timestamp of each reading, with dateutil.parser.parse.
+
+iso8601bench
+
+        -h --help        Print this help
+        -n --number      The number of times each timestamp is parsed (default: 100000)
+
+ Example:
+
+     $ cd benchmarks
+     $ python -m iso8601bench
+
+ FogLAMP must be importable, for example after ``pip install -e src/python``.
+
+"""
+import argparse
+import timeit
+
+import dateutil.parser
+
+from foglamp.device import iso8601
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+_TIMESTAMPS = [
+    '2017-01-02T01:02:03.23232Z-05:00',  # CoAP payload documentation
+    '2017-08-04T06:59:57.503Z',  # fogbench sample
+    '2017-08-04 06:59:57.503123+00:00',  # fogbench (str(datetime.now(tz=timezone.utc)))
+    '2017-09-21 15:00:09.025655',  # storage
+    'Jan 2 2017 1:02:03',  # not ISO 8601, dateutil only
+]
+
+
+def _microseconds(function, timestamp, number):
+    return timeit.timeit(lambda: function(timestamp), number=number) / number * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='iso8601bench')
+    parser.add_argument('-n', '--number', type=int, default=100000,
+                        help='The number of times each timestamp is parsed')
+    namespace = parser.parse_args()
+
+    print("{:<36}{:>12}{:>12}{:>10}".format('timestamp', 'iso8601 us', 'dateutil us', 'speedup'))
+
+    for timestamp in _TIMESTAMPS:
+        fast = _microseconds(iso8601.parse, timestamp, namespace.number)
+        slow = _microseconds(dateutil.parser.parse, timestamp, namespace.number)
+        print("{:<36}{:>12.2f}{:>12.2f}{:>9.1f}x".format(timestamp, fast, slow, slow / fast))
+
+
+main()
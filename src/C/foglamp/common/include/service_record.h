@@ -19,7 +19,8 @@ class ServiceRecord : public JSONProvider {
 			      const std::string& protocol,
 			      const std::string& address,
 			      const unsigned short port,
-			      const unsigned short managementPort);
+			      const unsigned short managementPort,
+			      const std::string& socket = "");
 		void asJSON(std::string &) const;
 	private:
 		std::string		m_name;
@@ -28,6 +29,7 @@ class ServiceRecord : public JSONProvider {
 		std::string		m_address;
 		unsigned short		m_port;
 		unsigned short		m_managementPort;
+		std::string		m_socket;
 };
 
 #endif
@@ -21,12 +21,14 @@ ServiceRecord::ServiceRecord(const string& name,
 			     const string& protocol,
 			     const string& address,
 			     const unsigned short port,
-			     const unsigned short managementPort) : m_name(name),
+			     const unsigned short managementPort,
+			     const string& socket) : m_name(name),
 							  m_type(type),
 							  m_protocol(protocol),
 							  m_address(address),
 							  m_port(port),
-							  m_managementPort(managementPort)
+							  m_managementPort(managementPort),
+							  m_socket(socket)
 {
 }
 
@@ -43,6 +45,10 @@ ostringstream convert;
 	convert << "\"protocol\" : \"" << m_protocol << "\",";
 	convert << "\"address\" : \"" << m_address << "\",";
 	convert << "\"management_port\" : " << m_managementPort << ",";
+	if (!m_socket.empty())
+	{
+		convert << "\"service_socket\" : \"" << m_socket << "\",";
+	}
 	convert << "\"service_port\" : " << m_port << " ";
 	convert << "}";
 
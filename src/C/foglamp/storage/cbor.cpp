@@ -0,0 +1,382 @@
+/*
+ * FogLAMP storage service.
+ *
+ * Copyright (c) 2017 OSisoft, LLC
+ *
+ * Released under the Apache 2.0 Licence
+ *
+ * Author: Mark Riddoch
+ */
+#include <cbor.h>
+#include <rapidjson/reader.h>
+#include <rapidjson/writer.h>
+#include <rapidjson/stringbuffer.h>
+#include <cmath>
+#include <cstring>
+#include <limits>
+
+/**
+ * Conversion between JSON text and CBOR (RFC 7049).
+ *
+ * The storage plugins produce and consume JSON text. The API layer converts
+ * reading payloads to and from CBOR for clients that negotiate it, which
+ * makes those payloads smaller.
+ */
+
+using namespace std;
+using namespace rapidjson;
+
+#define CBOR_UINT	0
+#define CBOR_NEGINT	1
+#define CBOR_BYTES	2
+#define CBOR_TEXT	3
+#define CBOR_ARRAY	4
+#define CBOR_MAP	5
+#define CBOR_TAG	6
+#define CBOR_SIMPLE	7
+
+#define CBOR_INDEFINITE	31
+#define CBOR_BREAK	0xff
+
+#define CBOR_MAX_DEPTH	64
+
+/**
+ * A rapidjson SAX handler that writes CBOR. Arrays and objects are written
+ * with indefinite lengths as the number of members is not known when they start.
+ */
+class CBORWriter {
+	public:
+		CBORWriter(string& out) : m_out(out) {};
+		bool	Null() { m_out += (char)0xf6; return true; };
+		bool	Bool(bool b) { m_out += (char)(b ? 0xf5 : 0xf4); return true; };
+		bool	Int(int i) { return Int64(i); };
+		bool	Uint(unsigned u) { return Uint64(u); };
+		bool	Int64(int64_t i)
+			{
+				if (i < 0)
+					head(CBOR_NEGINT, (uint64_t)(-(i + 1)));
+				else
+					head(CBOR_UINT, (uint64_t)i);
+				return true;
+			};
+		bool	Uint64(uint64_t u) { head(CBOR_UINT, u); return true; };
+		bool	Double(double d)
+			{
+				uint64_t bits;
+				memcpy(&bits, &d, sizeof(bits));
+				m_out += (char)0xfb;
+				for (int shift = 56; shift >= 0; shift -= 8)
+					m_out += (char)((bits >> shift) & 0xff);
+				return true;
+			};
+		bool	RawNumber(const char *, SizeType, bool) { return false; };
+		bool	String(const char *str, SizeType length, bool)
+			{
+				head(CBOR_TEXT, length);
+				m_out.append(str, length);
+				return true;
+			};
+		bool	StartObject() { m_out += (char)((CBOR_MAP << 5) | CBOR_INDEFINITE); return true; };
+		bool	Key(const char *str, SizeType length, bool copy) { return String(str, length, copy); };
+		bool	EndObject(SizeType) { m_out += (char)CBOR_BREAK; return true; };
+		bool	StartArray() { m_out += (char)((CBOR_ARRAY << 5) | CBOR_INDEFINITE); return true; };
+		bool	EndArray(SizeType) { m_out += (char)CBOR_BREAK; return true; };
+	private:
+		void	head(unsigned int major, uint64_t value);
+		string&	m_out;
+};
+
+/**
+ * Write the initial bytes of a data item: the major type and
+ * a value or length in the shortest form
+ */
+void CBORWriter::head(unsigned int major, uint64_t value)
+{
+int	bytes;
+
+	major <<= 5;
+	if (value < 24)
+	{
+		m_out += (char)(major | value);
+		return;
+	}
+	if (value <= 0xff)
+	{
+		m_out += (char)(major | 24);
+		bytes = 1;
+	}
+	else if (value <= 0xffff)
+	{
+		m_out += (char)(major | 25);
+		bytes = 2;
+	}
+	else if (value <= 0xffffffff)
+	{
+		m_out += (char)(major | 26);
+		bytes = 4;
+	}
+	else
+	{
+		m_out += (char)(major | 27);
+		bytes = 8;
+	}
+	for (int shift = (bytes - 1) * 8; shift >= 0; shift -= 8)
+		m_out += (char)((value >> shift) & 0xff);
+}
+
+/**
+ * Convert a JSON document to CBOR
+ *
+ * @param json	The JSON text
+ * @param cbor	The CBOR encoding of json
+ * @return	False if json is not valid JSON
+ */
+bool jsonToCBOR(const string& json, string& cbor)
+{
+Reader		reader;
+StringStream	stream(json.c_str());
+CBORWriter	writer(cbor);
+
+	cbor.clear();
+	cbor.reserve(json.length());
+	return !reader.Parse(stream, writer).IsError();
+}
+
+/**
+ * A decoder of a CBOR buffer that writes the equivalent JSON
+ */
+class CBORReader {
+	public:
+		CBORReader(const string& cbor, Writer<StringBuffer>& writer) :
+			m_ptr((const unsigned char *)cbor.data()),
+			m_end((const unsigned char *)cbor.data() + cbor.length()),
+			m_writer(writer) {};
+		bool	decode();
+		bool	atEnd() { return m_ptr == m_end; };
+	private:
+		bool	item(int depth, bool key);
+		bool	argument(unsigned int info, uint64_t& value);
+		bool	text(unsigned int info, string& value);
+		bool	isBreak();
+		const unsigned char	*m_ptr;
+		const unsigned char	*m_end;
+		Writer<StringBuffer>&	m_writer;
+};
+
+/**
+ * Decode a single item, which must use the whole buffer
+ */
+bool CBORReader::decode()
+{
+	return item(0, false) && atEnd();
+}
+
+/**
+ * Read the value or length that follows the initial byte of an item
+ */
+bool CBORReader::argument(unsigned int info, uint64_t& value)
+{
+int	bytes;
+
+	if (info < 24)
+	{
+		value = info;
+		return true;
+	}
+	switch (info)
+	{
+		case 24: bytes = 1; break;
+		case 25: bytes = 2; break;
+		case 26: bytes = 4; break;
+		case 27: bytes = 8; break;
+		default: return false;
+	}
+	if (m_end - m_ptr < bytes)
+		return false;
+	value = 0;
+	while (bytes--)
+		value = (value << 8) | *m_ptr++;
+	return true;
+}
+
+/**
+ * Consume a break code if it is the next byte
+ */
+bool CBORReader::isBreak()
+{
+	if (m_ptr < m_end && *m_ptr == CBOR_BREAK)
+	{
+		m_ptr++;
+		return true;
+	}
+	return false;
+}
+
+/**
+ * Read a text string, which may be sent in chunks
+ */
+bool CBORReader::text(unsigned int info, string& value)
+{
+uint64_t	length;
+
+	if (info == CBOR_INDEFINITE)
+	{
+		while (!isBreak())
+		{
+			if (m_ptr >= m_end || (*m_ptr >> 5) != CBOR_TEXT)
+				return false;
+			unsigned int chunkInfo = *m_ptr++ & 0x1f;
+			if (chunkInfo == CBOR_INDEFINITE || !text(chunkInfo, value))
+				return false;
+		}
+		return true;
+	}
+	if (!argument(info, length) || length > (uint64_t)(m_end - m_ptr))
+		return false;
+	value.append((const char *)m_ptr, (size_t)length);
+	m_ptr += length;
+	return true;
+}
+
+/**
+ * Decode the next item and write it as JSON
+ *
+ * @param depth	The nesting level of the item
+ * @param key	The item is the key of a map member and must be text
+ */
+bool CBORReader::item(int depth, bool key)
+{
+uint64_t	value;
+
+	if (m_ptr >= m_end || depth > CBOR_MAX_DEPTH)
+		return false;
+
+	unsigned int major = *m_ptr >> 5;
+	unsigned int info = *m_ptr++ & 0x1f;
+
+	if (key && major != CBOR_TEXT)
+		return false;
+
+	switch (major)
+	{
+		case CBOR_UINT:
+			return argument(info, value) && m_writer.Uint64(value);
+		case CBOR_NEGINT:
+			if (!argument(info, value) || value > (uint64_t)numeric_limits<int64_t>::max())
+				return false;
+			return m_writer.Int64(-1 - (int64_t)value);
+		case CBOR_TEXT:
+		{
+			string str;
+			if (!text(info, str))
+				return false;
+			if (key)
+				return m_writer.Key(str.c_str(), (SizeType)str.length(), true);
+			return m_writer.String(str.c_str(), (SizeType)str.length(), true);
+		}
+		case CBOR_ARRAY:
+			m_writer.StartArray();
+			if (info == CBOR_INDEFINITE)
+			{
+				while (!isBreak())
+					if (!item(depth + 1, false))
+						return false;
+			}
+			else
+			{
+				if (!argument(info, value))
+					return false;
+				while (value--)
+					if (!item(depth + 1, false))
+						return false;
+			}
+			return m_writer.EndArray();
+		case CBOR_MAP:
+			m_writer.StartObject();
+			if (info == CBOR_INDEFINITE)
+			{
+				while (!isBreak())
+					if (!item(depth + 1, true) || !item(depth + 1, false))
+						return false;
+			}
+			else
+			{
+				if (!argument(info, value))
+					return false;
+				while (value--)
+					if (!item(depth + 1, true) || !item(depth + 1, false))
+						return false;
+			}
+			return m_writer.EndObject();
+		case CBOR_TAG:
+			// Tags such as date/time strings are written as the tagged item
+			return argument(info, value) && item(depth + 1, false);
+		case CBOR_SIMPLE:
+			switch (info)
+			{
+				case 20: return m_writer.Bool(false);
+				case 21: return m_writer.Bool(true);
+				case 22:
+				case 23: return m_writer.Null();
+				case 25:
+				{
+					if (!argument(info, value))
+						return false;
+					// Half precision
+					int exponent = (value >> 10) & 0x1f;
+					double mantissa = (double)(value & 0x3ff);
+					double d;
+					if (exponent == 0)
+						d = ldexp(mantissa, -24);
+					else if (exponent == 31)
+						return false;
+					else
+						d = ldexp(mantissa + 1024, exponent - 25);
+					return m_writer.Double(value & 0x8000 ? -d : d);
+				}
+				case 26:
+				{
+					float f;
+					uint32_t bits;
+					if (!argument(info, value))
+						return false;
+					bits = (uint32_t)value;
+					memcpy(&f, &bits, sizeof(f));
+					return m_writer.Double(f);
+				}
+				case 27:
+				{
+					double d;
+					if (!argument(info, value))
+						return false;
+					memcpy(&d, &value, sizeof(d));
+					return m_writer.Double(d);
+				}
+				default:
+					return false;
+			}
+		default:
+			// Byte strings have no JSON equivalent
+			return false;
+	}
+}
+
+/**
+ * Convert a CBOR data item to JSON
+ *
+ * @param cbor	The CBOR encoding
+ * @param json	The JSON text for cbor
+ * @return	False if cbor is not a single valid CBOR item that
+ *		can be expressed as JSON
+ */
+bool cborToJSON(const string& cbor, string& json)
+{
+StringBuffer		buffer;
+Writer<StringBuffer>	writer(buffer);
+CBORReader		reader(cbor, writer);
+
+	if (!reader.decode())
+		return false;
+	json = buffer.GetString();
+	return true;
+}
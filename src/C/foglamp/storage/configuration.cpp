@@ -12,17 +12,36 @@
 #include <rapidjson/istreamwrapper.h>
 #include <rapidjson/ostreamwrapper.h>
 #include <rapidjson/writer.h>
+#include <cstdlib>
 #include <fstream>
 #include <iostream>
 #include <unistd.h>
 
 static const char *defaultConfiguration = " { \"plugin\" : { "
 " \"value\" : \"postgres\" }, \"threads\" : { \"value\" : \"1\" },"
-"  \"port\" : { \"value\" : \"0\" }, \"managementPort\" : { \"value\" : \"0\" } }";
+"  \"port\" : { \"value\" : \"0\" }, \"managementPort\" : { \"value\" : \"0\" },"
+"  \"socket\" : { \"value\" : \"\" } }";
 
 using namespace std;
 using namespace rapidjson;
 
+/**
+ * The default path of the Unix domain socket of the storage API. It is in
+ * a directory that only the user of the service can write to:
+ * $FOGLAMP_DATA/run or, when FOGLAMP_DATA is not set, $XDG_RUNTIME_DIR/foglamp
+ * or /tmp/foglamp-<uid>. The directory is created when the service starts.
+ */
+static string defaultSocketPath()
+{
+const char	*dir;
+
+	if ((dir = getenv("FOGLAMP_DATA")) != NULL && *dir)
+		return string(dir) + "/run/foglamp-storage.sock";
+	if ((dir = getenv("XDG_RUNTIME_DIR")) != NULL && *dir)
+		return string(dir) + "/foglamp/foglamp-storage.sock";
+	return "/tmp/foglamp-" + to_string(getuid()) + "/foglamp-storage.sock";
+}
+
 /**
  * Constructor for storage service configuration class.
  */
@@ -86,6 +105,10 @@ void StorageConfiguration::readCache()
 		{
 			logger->error("Default configuration failed to parse.");
 		}
+		else
+		{
+			setValue("socket", defaultSocketPath());
+		}
 		writeCache();
 		return;
 	}
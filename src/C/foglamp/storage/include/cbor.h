@@ -0,0 +1,25 @@
+#ifndef _CBOR_H
+#define _CBOR_H
+/*
+ * FogLAMP storage service.
+ *
+ * Copyright (c) 2017 OSisoft, LLC
+ *
+ * Released under the Apache 2.0 Licence
+ *
+ * Author: Mark Riddoch
+ */
+#include <string>
+
+/*
+ * The media type of the compact binary encoding that clients may
+ * request with an Accept header or send with a Content-Type header
+ * in place of JSON
+ */
+#define CBOR_CONTENT_TYPE	"application/cbor"
+#define JSON_CONTENT_TYPE	"application/json"
+
+bool	jsonToCBOR(const std::string& json, std::string& cbor);
+bool	cborToJSON(const std::string& cbor, std::string& json);
+
+#endif
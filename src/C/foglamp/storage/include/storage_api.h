@@ -11,11 +11,12 @@
  */
 
 #include <server_http.hpp>
+#include <unix_socket_server.h>
 #include <storage_plugin.h>
 #include <storage_stats.h>
 
 using namespace std;
-using HttpServer = SimpleWeb::Server<SimpleWeb::HTTP>;
+using StorageHttpServer = UnixSocketServer;
 
 /*
  * The URL for each entry point
@@ -39,7 +40,7 @@ using HttpServer = SimpleWeb::Server<SimpleWeb::HTTP>;
 class StorageApi {
 
 public:
-	StorageApi(const unsigned short port, const int threads);
+	StorageApi(const unsigned short port, const int threads, const string& socketPath);
         static StorageApi *getInstance();
 	void	initResources();
 	void	setPlugin(StoragePlugin *);
@@ -48,28 +49,31 @@ public:
 	void	wait();
 	void	stopServer();
 	unsigned short getListenerPort();
-	void	commonInsert(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	commonSimpleQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	commonQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	commonUpdate(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	commonDelete(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	defaultResource(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	readingAppend(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	readingFetch(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	readingQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
-	void	readingPurge(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request);
+	string	getListenerSocket();
+	void	commonInsert(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	commonSimpleQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	commonQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	commonUpdate(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	commonDelete(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	defaultResource(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	readingAppend(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	readingFetch(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	readingQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
+	void	readingPurge(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request);
 
 private:
         static StorageApi       *m_instance;
-        HttpServer              *m_server;
+        UnixSocketServer        *m_server;
 	unsigned short          m_port;
 	int		        m_threads;
         thread                  *m_thread;
 	StoragePlugin		*plugin;
 	StorageStats		stats;
-	void			respond(shared_ptr<HttpServer::Response>, const string&);
-	void			respond(shared_ptr<HttpServer::Response>, SimpleWeb::StatusCode, const string&);
-	void			internalError(shared_ptr<HttpServer::Response>, const exception&);
+	void			respond(shared_ptr<StorageHttpServer::Response>, const string&);
+	void			respond(shared_ptr<StorageHttpServer::Response>, SimpleWeb::StatusCode, const string&);
+	void			respond(shared_ptr<StorageHttpServer::Response>, SimpleWeb::StatusCode, const string&, const char *);
+	void			respondReadings(shared_ptr<StorageHttpServer::Response>, shared_ptr<StorageHttpServer::Request>, const string&);
+	void			internalError(shared_ptr<StorageHttpServer::Response>, const exception&);
 	void			mapError(string&, PLUGIN_ERROR *);
 };
 
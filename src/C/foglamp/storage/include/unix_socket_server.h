@@ -0,0 +1,55 @@
+#ifndef _UNIX_SOCKET_SERVER_H
+#define _UNIX_SOCKET_SERVER_H
+/*
+ * FogLAMP storage service.
+ *
+ * Copyright (c) 2017 OSisoft, LLC
+ *
+ * Released under the Apache 2.0 Licence
+ *
+ * Author: Mark Riddoch
+ */
+#include <server_http.hpp>
+#include <memory>
+#include <string>
+
+/**
+ * A connection accepted on either the TCP port or the Unix domain socket.
+ *
+ * The HTTP server reads the remote endpoint of a connection as a TCP
+ * endpoint, which a Unix domain socket does not have, so the remote
+ * endpoint of a local connection is reported as an error.
+ */
+class StreamSocket : public boost::asio::generic::stream_protocol::socket {
+	public:
+		StreamSocket(boost::asio::io_service& io_service) :
+			boost::asio::generic::stream_protocol::socket(io_service) {};
+		StreamSocket&			lowest_layer() { return *this; };
+		boost::asio::ip::tcp::endpoint	remote_endpoint();
+};
+
+/**
+ * An HTTP server that, as well as the TCP port, listens on a Unix domain
+ * socket. Clients on the same host can use the socket to avoid the cost
+ * of the loopback TCP stack. Both listeners share the resources, the
+ * io_service and the threads of the server.
+ *
+ * The socket is created in a directory that only the user of the service
+ * can write to, and only that user can connect to it.
+ */
+class UnixSocketServer : public SimpleWeb::ServerBase<StreamSocket> {
+	public:
+		UnixSocketServer() : SimpleWeb::ServerBase<StreamSocket>(80) {};
+		std::string	socketPath;
+		void		stop();
+		std::string	getLocalSocket();
+	protected:
+		void		accept() override;
+	private:
+		void		acceptLocal();
+		bool		listenLocal();
+		bool		secureDirectory(const std::string& directory);
+		std::unique_ptr<boost::asio::local::stream_protocol::acceptor>	m_localAcceptor;
+};
+
+#endif
@@ -22,10 +22,34 @@
 #include <stdarg.h>
 #include <stdlib.h>
 #include <sstream>
+#include <algorithm>
+#include <vector>
+#include <strings.h>
+
+/*
+ * The number of statements each connection keeps prepared. Statements
+ * beyond this are still sent with parameters but are planned every time.
+ */
+#define MAX_PREPARED_STATEMENTS	100
+
+/*
+ * The largest number of readings a single statement appends, a power of two
+ */
+#define APPEND_BLOCK_SIZE	256
 
 using namespace std;
 using namespace rapidjson;
 
+/**
+ * Check if a string value is a function call rather than a literal
+ */
+static bool isFunction(const char *str)
+{
+static const regex function("[a-zA-Z][a-zA-Z0-9_]*\\(.*\\)");
+
+	return regex_match(str, function);
+}
+
 /**
  * Create a database connection
  */
@@ -61,11 +85,15 @@ Connection::~Connection()
 /**
  * Perform a query against a common table
  *
+ * The values of the where clause, skip and limit are passed as parameters
+ * of a prepared statement, so queries that differ only in those values
+ * are parsed and planned once per connection.
  */
 bool Connection::retrieve(const string& table, const string& condition, string& resultSet)
 {
 Document document;  // Default template parameter uses UTF8 and MemoryPoolAllocator.
 SQLBuffer	sql;
+vector<string>	params;
 
 	if (condition.empty())
 	{
@@ -174,7 +202,7 @@ SQLBuffer	sql;
 		 
 			if (document.HasMember("where"))
 			{
-				if (!jsonWhereClause(document["where"], sql))
+				if (!jsonWhereClause(document["where"], sql, &params))
 				{
 					return false;
 				}
@@ -185,7 +213,7 @@ SQLBuffer	sql;
 				return false;
 			}
 		}
-		if (!jsonModifiers(document, sql))
+		if (!jsonModifiers(document, sql, &params))
 		{
 			return false;
 		}
@@ -193,7 +221,7 @@ SQLBuffer	sql;
 	sql.append(';');
 
 	const char *query = sql.coalesce();
-	PGresult *res = PQexec(dbConnection, query);
+	PGresult *res = execPrepared(query, params);
 	delete[] query;
 	if (PQresultStatus(res) == PGRES_TUPLES_OK)
 	{
@@ -208,82 +236,224 @@ SQLBuffer	sql;
 
 /**
  * Insert data into a table
+ *
+ * The data is either a JSON object, which is inserted as a single row, or
+ * an array of JSON objects that are inserted by a single multi-row
+ * statement, so either every row is inserted or none are. The columns
+ * are those of every row; a row that does not have a column gets the
+ * column default.
+ *
+ * @return	The number of rows inserted or -1 on error. When a multi-row
+ *		insert fails the error message starts with the index of the
+ *		first row that could not be inserted.
  */
 int Connection::insert(const std::string& table, const std::string& data)
 {
-SQLBuffer	sql;
 Document	document;
-SQLBuffer	values;
-int		col = 0;
- 
+
 	if (document.Parse(data.c_str()).HasParseError())
 	{
 		raiseError("insert", "Failed to parse JSON payload\n");
 		return -1;
 	}
+	if (document.IsObject())
+	{
+		return insertRows(table, document, 1);
+	}
+	if (!document.IsArray() || document.Empty())
+	{
+		raiseError("insert", "Payload must be an object or a non-empty array of objects");
+		return -1;
+	}
+	for (Value::ConstValueIterator row = document.Begin(); row != document.End(); ++row)
+	{
+		if (!row->IsObject())
+		{
+			raiseError("insert", "Each row in the array must be an object");
+			return -1;
+		}
+	}
+
+	int rval = insertRows(table, document, document.Size());
+	if (rval == -1 && document.Size() > 1)
+	{
+		insertRowsError(table, document);
+	}
+	return rval;
+}
+
+/**
+ * Insert one row, given as an object, or an array of rows with a single statement
+ *
+ * @param table		The table to insert into
+ * @param rows		An object or an array of objects
+ * @param count		The number of rows
+ * @return		The number of rows inserted or -1 on error
+ */
+int Connection::insertRows(const string& table, const Value& rows, unsigned int count)
+{
+SQLBuffer	sql;
+vector<string>	columns;
+
+	// The columns are the members of every row in the order they are first seen
+	for (unsigned int i = 0; i < count; i++)
+	{
+		const Value& row = rows.IsArray() ? rows[i] : rows;
+		for (Value::ConstMemberIterator itr = row.MemberBegin(); itr != row.MemberEnd(); ++itr)
+		{
+			string name = itr->name.GetString();
+			if (find(columns.begin(), columns.end(), name) == columns.end())
+				columns.push_back(name);
+		}
+	}
+
  	sql.append("INSERT INTO ");
 	sql.append(table);
 	sql.append(" (");
-	for (Value::ConstMemberIterator itr = document.MemberBegin();
-		itr != document.MemberEnd(); ++itr)
+	for (auto column = columns.begin(); column != columns.end(); ++column)
 	{
-		if (col)
+		if (column != columns.begin())
 			sql.append(", ");
-		sql.append(itr->name.GetString());
- 
-		if (col)
-			values.append(", ");
-		if (itr->value.IsString())
+		sql.append(*column);
+	}
+	sql.append(") values ");
+
+	for (unsigned int i = 0; i < count; i++)
+	{
+		const Value& row = rows.IsArray() ? rows[i] : rows;
+		sql.append(i ? ", (" : "(");
+		for (auto column = columns.begin(); column != columns.end(); ++column)
 		{
-			const char *str = itr->value.GetString();
-			// Check if the string is a function
-			string s (str);
-  			regex e ("[a-zA-Z][a-zA-Z0-9_]*\\(.*\\)");
-  			if (regex_match (s,e))
-			{
-				values.append(str);
-			}
+			if (column != columns.begin())
+				sql.append(", ");
+			Value::ConstMemberIterator itr = row.FindMember(column->c_str());
+			if (itr == row.MemberEnd())
+				sql.append("DEFAULT");
 			else
-			{
-				values.append('\'');
-				values.append(str);
-				values.append('\'');
-			}
-		}
-		else if (itr->value.IsDouble())
-			values.append(itr->value.GetDouble());
-		else if (itr->value.IsNumber())
-			values.append(itr->value.GetInt());
-		else if (itr->value.IsObject())
-		{
-			StringBuffer buffer;
-			Writer<StringBuffer> writer(buffer);
-			itr->value.Accept(writer);
-			values.append('\'');
-			values.append(buffer.GetString());
-			values.append('\'');
+				appendValue(itr->value, sql);
 		}
-		col++;
+		sql.append(')');
 	}
-	sql.append(") values (");
-	const char *vals = values.coalesce();
-	sql.append(vals);
-	delete[] vals;
-	sql.append(");");
+	sql.append(';');
 
 	const char *query = sql.coalesce();
 	PGresult *res = PQexec(dbConnection, query);
 	delete[] query;
 	if (PQresultStatus(res) == PGRES_COMMAND_OK)
 	{
+		int inserted = atoi(PQcmdTuples(res));
 		PQclear(res);
-		return atoi(PQcmdTuples(res));
+		return inserted;
 	}
  	raiseError("insert", PQerrorMessage(dbConnection));
 	PQclear(res);
 	return -1;
 }
 
+/**
+ * Find the first row of a failed multi-row insert that can not be inserted
+ * and raise its error. The rows are inserted one at a time in a transaction
+ * that is rolled back, so nothing is inserted.
+ */
+void Connection::insertRowsError(const string& table, const Value& rows)
+{
+	string error = PQerrorMessage(dbConnection);
+
+	// Without a transaction the rows would be inserted; keep the original error
+	if (!execCommand("insert", "BEGIN;"))
+	{
+		raiseError("insert", "%s", error.c_str());
+		return;
+	}
+	for (SizeType i = 0; i < rows.Size(); i++)
+	{
+		if (insertRows(table, rows[i], 1) == -1)
+		{
+			string message = PQerrorMessage(dbConnection);
+			rollback();
+			raiseError("insert", "Row %u: %s", i, message.c_str());
+			return;
+		}
+	}
+	// Every row can be inserted on its own; keep the original error
+	rollback();
+	raiseError("insert", "%s", error.c_str());
+}
+
+/**
+ * Execute a statement that returns no rows, such as BEGIN or COMMIT
+ *
+ * @param operation	The operation to report if the statement fails
+ * @param sql		The statement
+ * @return		False if the statement failed, in which case the error has been raised
+ */
+bool Connection::execCommand(const char *operation, const char *sql)
+{
+	PGresult *res = PQexec(dbConnection, sql);
+	bool ok = PQresultStatus(res) == PGRES_COMMAND_OK;
+	if (!ok)
+	{
+ 		raiseError(operation, PQerrorMessage(dbConnection));
+	}
+	PQclear(res);
+	return ok;
+}
+
+/**
+ * Roll back the current transaction after an error. A failure to roll
+ * back is not raised, so that the error that caused the rollback is the
+ * one reported.
+ */
+void Connection::rollback()
+{
+	PGresult *res = PQexec(dbConnection, "ROLLBACK;");
+	if (PQresultStatus(res) != PGRES_COMMAND_OK)
+	{
+		// The transaction ends when the connection is reset, which
+		// also drops the prepared statements
+		PQreset(dbConnection);
+		m_statements.clear();
+	}
+	PQclear(res);
+}
+
+/**
+ * Append a JSON value to an SQL statement as a literal
+ */
+void Connection::appendValue(const Value& value, SQLBuffer& sql)
+{
+	if (value.IsString())
+	{
+		const char *str = value.GetString();
+		// Check if the string is a function
+		string s (str);
+		regex e ("[a-zA-Z][a-zA-Z0-9_]*\\(.*\\)");
+		if (regex_match (s,e))
+		{
+			sql.append(str);
+		}
+		else
+		{
+			sql.append('\'');
+			sql.append(str);
+			sql.append('\'');
+		}
+	}
+	else if (value.IsDouble())
+		sql.append(value.GetDouble());
+	else if (value.IsNumber())
+		sql.append(value.GetInt());
+	else if (value.IsObject())
+	{
+		StringBuffer buffer;
+		Writer<StringBuffer> writer(buffer);
+		value.Accept(writer);
+		sql.append('\'');
+		sql.append(buffer.GetString());
+		sql.append('\'');
+	}
+}
+
 /**
  * Perform an update against a common table
  *
@@ -622,12 +792,19 @@ SQLBuffer	sql;
 
 /**
  * Append a set of readings to the readings table
+ *
+ * The readings are inserted by prepared statements for blocks of
+ * APPEND_BLOCK_SIZE readings and smaller blocks whose sizes are powers of
+ * two, so a few statement shapes cover any number of readings. The values
+ * are passed as parameters rather than SQL text. When more than one
+ * statement is needed they run in a transaction, so either all of the
+ * readings are appended or none are.
  */
 int Connection::appendReadings(const char *readings)
 {
 Document 	doc;
-SQLBuffer	sql;
-int		row = 0;
+int		appended = 0;
+bool		transaction;
 
 	ParseResult ok = doc.Parse(readings);
 	if (!ok)
@@ -636,14 +813,12 @@ int		row = 0;
 		return -1;
 	}
 
-	sql.append("INSERT INTO readings ( asset_code, read_key, reading, user_ts ) VALUES ");
-
-	Value &rdings = doc["readings"];
-	if (!rdings.IsArray())
+	if (!doc.IsObject() || !doc.HasMember("readings") || !doc["readings"].IsArray())
 	{
 		raiseError("appendReadings", "Payload is missing the readings array");
 		return -1;
 	}
+	const Value &rdings = doc["readings"];
 	for (Value::ConstValueIterator itr = rdings.Begin(); itr != rdings.End(); ++itr)
 	{
 		if (!itr->IsObject())
@@ -652,47 +827,137 @@ int		row = 0;
 					"Each reading in the readings array must be an object");
 			return -1;
 		}
-		if (row)
-			sql.append(", (");
-		else
-			sql.append('(');
-		row++;
-		sql.append('\'');
-		sql.append((*itr)["asset_code"].GetString());
-		sql.append("', \'");
-		sql.append((*itr)["read_key"].GetString());
-		sql.append("', \'");
-		StringBuffer buffer;
-		Writer<StringBuffer> writer(buffer);
-		(*itr)["reading"].Accept(writer);
-		sql.append(buffer.GetString());
-		sql.append("\', ");
-		const char *str = (*itr)["user_ts"].GetString();
-		// Check if the string is a function
-		string s (str);
-		regex e ("[a-zA-Z][a-zA-Z0-9_]*\\(.*\\)");
-		if (regex_match (s,e))
+		if (!itr->HasMember("asset_code") || !(*itr)["asset_code"].IsString() ||
+				!itr->HasMember("reading"))
 		{
-			sql.append(str);
+			raiseError("appendReadings",
+					"Each reading must have an asset_code and a reading");
+			return -1;
 		}
-		else
+		if (itr->HasMember("read_key") && !(*itr)["read_key"].IsString() &&
+				!(*itr)["read_key"].IsNull())
 		{
-			sql.append('\'');
-			sql.append(str);
-			sql.append('\'');
+			raiseError("appendReadings", "The read_key of a reading must be a string");
+			return -1;
 		}
+		if (itr->HasMember("user_ts"))
+		{
+			const Value& userTs = (*itr)["user_ts"];
+			if (!userTs.IsString())
+			{
+				raiseError("appendReadings", "The user_ts of a reading must be a string");
+				return -1;
+			}
+			if (isFunction(userTs.GetString()) && strcasecmp(userTs.GetString(), "now()"))
+			{
+				raiseError("appendReadings", "Unsupported user_ts function %s",
+						userTs.GetString());
+				return -1;
+			}
+		}
+	}
 
-		sql.append(')');
+	SizeType total = rdings.Size();
+	if (total == 0)
+	{
+		return 0;
+	}
+
+	// A single statement is used for a block size or a smaller power of two
+	transaction = total > APPEND_BLOCK_SIZE || (total & (total - 1)) != 0;
+	if (transaction && !execCommand("appendReadings", "BEGIN;"))
+	{
+		return -1;
+	}
+	for (SizeType first = 0; first < total; )
+	{
+		unsigned int count = APPEND_BLOCK_SIZE;
+		while (count > total - first)
+		{
+			count >>= 1;
+		}
+		int rval = appendReadingRows(rdings, first, count);
+		if (rval == -1)
+		{
+			if (transaction)
+			{
+				rollback();
+			}
+			return -1;
+		}
+		appended += rval;
+		first += count;
+	}
+	if (transaction && !execCommand("appendReadings", "COMMIT;"))
+	{
+		return -1;
+	}
+	return appended;
+}
+
+/**
+ * Insert a block of readings with a single prepared statement. The
+ * statement text depends only on the number of readings.
+ *
+ * @param readings	The array of readings
+ * @param first		The index of the first reading of the block
+ * @param count		The number of readings in the block
+ * @return		The number of readings inserted or -1 on error
+ */
+int Connection::appendReadingRows(const Value& readings, SizeType first, unsigned int count)
+{
+SQLBuffer		sql;
+vector<string>		values;
+vector<const char *>	params;
+
+	sql.append("INSERT INTO readings ( asset_code, read_key, reading, user_ts ) VALUES ");
+	for (unsigned int i = 0; i < count; i++)
+	{
+		unsigned int param = i * 4;
+		if (i)
+			sql.append(", ");
+		sql.append("($");
+		sql.append(param + 1);
+		sql.append(", $");
+		sql.append(param + 2);
+		sql.append(", $");
+		sql.append(param + 3);
+		// A missing user_ts or now() is passed as NULL
+		sql.append(", COALESCE($");
+		sql.append(param + 4);
+		sql.append("::timestamptz, now()))");
+
+		StringBuffer buffer;
+		Writer<StringBuffer> writer(buffer);
+		readings[first + i]["reading"].Accept(writer);
+		values.push_back(buffer.GetString());
 	}
 	sql.append(';');
 
+	// The parameters point into the document and into values, which no longer changes
+	for (unsigned int i = 0; i < count; i++)
+	{
+		const Value& reading = readings[first + i];
+		params.push_back(reading["asset_code"].GetString());
+		if (reading.HasMember("read_key") && reading["read_key"].IsString())
+			params.push_back(reading["read_key"].GetString());
+		else
+			params.push_back(NULL);
+		params.push_back(values[i].c_str());
+		if (reading.HasMember("user_ts") && !isFunction(reading["user_ts"].GetString()))
+			params.push_back(reading["user_ts"].GetString());
+		else
+			params.push_back(NULL);
+	}
+
 	const char *query = sql.coalesce();
-	PGresult *res = PQexec(dbConnection, query);
+	PGresult *res = execPrepared(query, params);
 	delete[] query;
 	if (PQresultStatus(res) == PGRES_COMMAND_OK)
 	{
+		int inserted = atoi(PQcmdTuples(res));
 		PQclear(res);
-		return atoi(PQcmdTuples(res));
+		return inserted;
 	}
  	raiseError("appendReadings", PQerrorMessage(dbConnection));
 	PQclear(res);
@@ -704,12 +969,11 @@ int		row = 0;
  */
 bool Connection::fetchReadings(unsigned long id, unsigned int blksize, std::string& resultSet)
 {
-char	sqlbuffer[100];
+vector<string>	params;
 
-	snprintf(sqlbuffer, sizeof(sqlbuffer),
-		"SELECT * FROM readings WHERE id >= %ld LIMIT %d;", id, blksize);
-	
-	PGresult *res = PQexec(dbConnection, sqlbuffer);
+	params.push_back(to_string(id));
+	params.push_back(to_string(blksize));
+	PGresult *res = execPrepared("SELECT * FROM readings WHERE id >= $1 ORDER BY id LIMIT $2;", params);
 	if (PQresultStatus(res) == PGRES_TUPLES_OK)
 	{
 		mapResultSet(res, resultSet);
@@ -1134,8 +1398,11 @@ bool Connection::jsonAggregates(const Value& payload, const Value& aggregates, S
 
 /**
  * Process the modifers for limit, skip, sort and group
+ *
+ * @param params	If not NULL skip and limit are added to params and
+ *			written as parameter references
  */
-bool Connection::jsonModifiers(const Value& payload, SQLBuffer& sql)
+bool Connection::jsonModifiers(const Value& payload, SQLBuffer& sql, vector<string> *params)
 {
 	if (payload.HasMember("sort"))
 	{
@@ -1237,13 +1504,25 @@ bool Connection::jsonModifiers(const Value& payload, SQLBuffer& sql)
 	if (payload.HasMember("skip"))
 	{
 		sql.append(" OFFSET ");
-		sql.append(payload["skip"].GetInt());
+		if (params)
+		{
+			if (!appendParameter(payload["skip"], sql, *params))
+				return false;
+		}
+		else
+			sql.append(payload["skip"].GetInt());
 	}
 
 	if (payload.HasMember("limit"))
 	{
 		sql.append(" LIMIT ");
-		sql.append(payload["limit"].GetInt());
+		if (params)
+		{
+			if (!appendParameter(payload["limit"], sql, *params))
+				return false;
+		}
+		else
+			sql.append(payload["limit"].GetInt());
 	}
 	return true;
 }
@@ -1251,8 +1530,10 @@ bool Connection::jsonModifiers(const Value& payload, SQLBuffer& sql)
 /**
  * Convert a JSON where clause into a PostresSQL where clause
  *
+ * @param params	If not NULL the values are added to params and written
+ *			as parameter references rather than literals
  */
-bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql)
+bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql, vector<string> *params)
 {
 	if (!whereClause.IsObject())
 	{
@@ -1279,7 +1560,14 @@ bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql)
 	sql.append(' ');
 	sql.append(whereClause["condition"].GetString()); 
 	sql.append(' ');
-	if (whereClause["value"].IsInt())
+	if (params)
+	{
+		if (!appendParameter(whereClause["value"], sql, *params))
+		{
+			return false;
+		}
+	}
+	else if (whereClause["value"].IsInt())
 	{
 		sql.append(whereClause["value"].GetInt());
 	} else if (whereClause["value"].IsString())
@@ -1292,7 +1580,7 @@ bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql)
 	if (whereClause.HasMember("and"))
 	{
 		sql.append(" AND ");
-		if (!jsonWhereClause(whereClause["and"], sql))
+		if (!jsonWhereClause(whereClause["and"], sql, params))
 		{
 			return false;
 		}
@@ -1300,7 +1588,7 @@ bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql)
 	if (whereClause.HasMember("or"))
 	{
 		sql.append(" OR ");
-		if (!jsonWhereClause(whereClause["or"], sql))
+		if (!jsonWhereClause(whereClause["or"], sql, params))
 		{
 			return false;
 		}
@@ -1309,6 +1597,80 @@ bool Connection::jsonWhereClause(const Value& whereClause, SQLBuffer& sql)
 	return true;
 }
 
+/**
+ * Add a JSON string or number to the parameters of a statement and
+ * write the reference to the parameter
+ */
+bool Connection::appendParameter(const Value& value, SQLBuffer& sql, vector<string>& params)
+{
+	if (value.IsString())
+	{
+		params.push_back(value.GetString());
+	}
+	else if (value.IsNumber())
+	{
+		StringBuffer buffer;
+		Writer<StringBuffer> writer(buffer);
+		value.Accept(writer);
+		params.push_back(buffer.GetString());
+	}
+	else
+	{
+		raiseError("where clause", "Values must be strings or numbers");
+		return false;
+	}
+	sql.append('$');
+	sql.append((unsigned long)params.size());
+	return true;
+}
+
+/**
+ * Execute a statement with parameters as a prepared statement of the
+ * connection. The statement is prepared the first time its text is
+ * executed, so Postgres parses and plans it once.
+ *
+ * @param sql		The statement, with $n references to the parameters
+ * @param params	The parameter values as text, NULL for an SQL NULL
+ * @return		The result, which the caller must clear
+ */
+PGresult *Connection::execPrepared(const string& sql, const vector<const char *>& params)
+{
+	auto statement = m_statements.find(sql);
+	if (statement == m_statements.end())
+	{
+		if (m_statements.size() >= MAX_PREPARED_STATEMENTS)
+		{
+			return PQexecParams(dbConnection, sql.c_str(), (int)params.size(),
+					NULL, params.data(), NULL, NULL, 0);
+		}
+		string name = "foglamp_" + to_string(m_statements.size());
+		PGresult *res = PQprepare(dbConnection, name.c_str(), sql.c_str(),
+					(int)params.size(), NULL);
+		if (PQresultStatus(res) != PGRES_COMMAND_OK)
+		{
+			return res;
+		}
+		PQclear(res);
+		statement = m_statements.insert(make_pair(sql, name)).first;
+	}
+	return PQexecPrepared(dbConnection, statement->second.c_str(), (int)params.size(),
+				params.data(), NULL, NULL, 0);
+}
+
+/**
+ * Execute a statement as a prepared statement with parameters held as strings
+ */
+PGresult *Connection::execPrepared(const string& sql, const vector<string>& params)
+{
+vector<const char *>	values;
+
+	for (auto param = params.begin(); param != params.end(); ++param)
+	{
+		values.push_back(param->c_str());
+	}
+	return execPrepared(sql, values);
+}
+
 bool Connection::returnJson(const Value& json, SQLBuffer& sql)
 {
 	if (! json.IsObject())
@@ -12,6 +12,8 @@
 
 #include <sql_buffer.h>
 #include <string>
+#include <map>
+#include <vector>
 #include <rapidjson/document.h>
 #include <libpq-fe.h>
 
@@ -29,10 +31,25 @@ class Connection {
 		unsigned int	purgeReadings(unsigned long age, unsigned int flags, unsigned long sent, std::string& results);
 	private:
 		void		raiseError(const char *operation, const char *reason,...);
+		int		insertRows(const std::string& table, const rapidjson::Value& rows, unsigned int count);
+		void		insertRowsError(const std::string& table, const rapidjson::Value& rows);
+		bool		execCommand(const char *operation, const char *sql);
+		void		rollback();
+		void		appendValue(const rapidjson::Value& value, SQLBuffer& sql);
+		int		appendReadingRows(const rapidjson::Value& readings, rapidjson::SizeType first,
+					unsigned int count);
 		PGconn		*dbConnection;
+		std::map<std::string, std::string>
+				m_statements;
+		PGresult	*execPrepared(const std::string& sql, const std::vector<const char *>& params);
+		PGresult	*execPrepared(const std::string& sql, const std::vector<std::string>& params);
 		void		mapResultSet(PGresult *res, std::string& resultSet);
-		bool		jsonWhereClause(const rapidjson::Value& whereClause, SQLBuffer&);
-		bool		jsonModifiers(const rapidjson::Value&, SQLBuffer&);
+		bool		jsonWhereClause(const rapidjson::Value& whereClause, SQLBuffer&,
+					std::vector<std::string> *params = NULL);
+		bool		jsonModifiers(const rapidjson::Value&, SQLBuffer&,
+					std::vector<std::string> *params = NULL);
+		bool		appendParameter(const rapidjson::Value& value, SQLBuffer& sql,
+					std::vector<std::string>& params);
 		bool		jsonAggregates(const rapidjson::Value&, const rapidjson::Value&, SQLBuffer&);
 		bool		returnJson(const rapidjson::Value&, SQLBuffer&);
 		char		*trim(char *str);
@@ -105,6 +105,7 @@ pid_t pid;
 StorageService::StorageService(const string& myName) : m_name(myName), m_shutdown(false)
 {
 unsigned short servicePort;
+string         socketPath;
 
 	config = new StorageConfiguration();
 	logger = new Logger(SERVICE_NAME);
@@ -118,7 +119,12 @@ unsigned short servicePort;
 		servicePort = (unsigned short)atoi(config->getValue("port"));
 	}
 
-	api = new StorageApi(servicePort, 1);
+	if (config->getValue("socket") != NULL)
+	{
+		socketPath = config->getValue("socket");	// empty disables the socket
+	}
+
+	api = new StorageApi(servicePort, 1, socketPath);
 }
 
 /**
@@ -152,7 +158,8 @@ void StorageService::start(string& coreAddress, unsigned short corePort)
 		// TODO proper hostname lookup
 		unsigned short listenerPort = api->getListenerPort();
 		unsigned short managementListener = management.getListenerPort();
-		ServiceRecord record(m_name, "Storage", "http", "localhost", listenerPort, managementListener);
+		ServiceRecord record(m_name, "Storage", "http", "localhost", listenerPort, managementListener,
+				     api->getListenerSocket());
 		ManagementClient *client = new ManagementClient(coreAddress, corePort);
 		client->registerService(record);
 		client->registerCategory(STORAGE_CATEGORY);
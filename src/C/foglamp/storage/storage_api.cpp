@@ -11,6 +11,7 @@
 #include "server_http.hpp"
 #include "storage_api.h"
 #include "storage_stats.h"
+#include "cbor.h"
 #include "management_api.h"
 #include "logger.h"
 
@@ -30,7 +31,7 @@
 StorageApi *StorageApi::m_instance = 0;
 
 using namespace std;
-using HttpServer = SimpleWeb::Server<SimpleWeb::HTTP>;
+using StorageHttpServer = UnixSocketServer;
 using HttpClient = SimpleWeb::Client<SimpleWeb::HTTP>;
 
 /**
@@ -45,7 +46,7 @@ using HttpClient = SimpleWeb::Client<SimpleWeb::HTTP>;
 /**
  * Wrapper function for the common insert API call.
  */
-void commonInsertWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void commonInsertWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->commonInsert(response, request);
@@ -54,7 +55,7 @@ void commonInsertWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Wrapper function for the common update API call.
  */
-void commonUpdateWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void commonUpdateWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->commonUpdate(response, request);
@@ -63,7 +64,7 @@ void commonUpdateWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Wrapper function for the common delete API call.
  */
-void commonDeleteWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void commonDeleteWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->commonDelete(response, request);
@@ -72,7 +73,7 @@ void commonDeleteWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Wrapper function for the common simle query API call.
  */
-void commonSimpleQueryWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void commonSimpleQueryWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->commonSimpleQuery(response, request);
@@ -81,7 +82,7 @@ void commonSimpleQueryWrapper(shared_ptr<HttpServer::Response> response, shared_
 /**
  * Wrapper function for the common query API call.
  */
-void commonQueryWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void commonQueryWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->commonQuery(response, request);
@@ -91,7 +92,7 @@ void commonQueryWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<Ht
  * Wrapper function for the default resource API call. This is called whenever
  * an unrecognised API call is received.
  */
-void defaultWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void defaultWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->defaultResource(response, request);
@@ -100,13 +101,13 @@ void defaultWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpSe
 /**
  * Called when an error occurs
  */
-void on_error(__attribute__((unused)) shared_ptr<HttpServer::Request> request, __attribute__((unused)) const SimpleWeb::error_code &ec) {
+void on_error(__attribute__((unused)) shared_ptr<StorageHttpServer::Request> request, __attribute__((unused)) const SimpleWeb::error_code &ec) {
 }
 
 /**
  * Wrapper function for the reading appendAPI call.
  */
-void readingAppendWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void readingAppendWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->readingAppend(response, request);
@@ -115,7 +116,7 @@ void readingAppendWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<
 /**
  * Wrapper function for the reading fetch API call.
  */
-void readingFetchWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void readingFetchWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->readingFetch(response, request);
@@ -124,7 +125,7 @@ void readingFetchWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Wrapper function for the reading query API call.
  */
-void readingQueryWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void readingQueryWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->readingQuery(response, request);
@@ -133,7 +134,7 @@ void readingQueryWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Wrapper function for the reading purge API call.
  */
-void readingPurgeWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void readingPurgeWrapper(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 	StorageApi *api = StorageApi::getInstance();
 	api->readingPurge(response, request);
@@ -142,12 +143,13 @@ void readingPurgeWrapper(shared_ptr<HttpServer::Response> response, shared_ptr<H
 /**
  * Construct the singleton Storage API 
  */
-StorageApi::StorageApi(const unsigned short port, const int threads) {
+StorageApi::StorageApi(const unsigned short port, const int threads, const string& socketPath) {
 
 	m_port = port;
 	m_threads = threads;
-	m_server = new HttpServer();
+	m_server = new UnixSocketServer();
 	m_server->config.port = port;
+	m_server->socketPath = socketPath;
 	StorageApi::m_instance = this;
 }
 
@@ -158,7 +160,7 @@ StorageApi *StorageApi::getInstance()
 {
 	if (m_instance == NULL)
 	{
-		m_instance = new StorageApi(0, 1);
+		m_instance = new StorageApi(0, 1, "");
 	}
 	return m_instance;
 }
@@ -171,6 +173,15 @@ unsigned short StorageApi::getListenerPort()
 	return m_server->getLocalPort();
 }
 
+/**
+ * Return the path of the Unix domain socket for local clients,
+ * empty if the API is only available on the TCP port
+ */
+string StorageApi::getListenerSocket()
+{
+	return m_server->getLocalSocket();
+}
+
 /**
  * Initialise the API entry points for the common data resource and
  * the readings resource.
@@ -238,7 +249,7 @@ void StorageApi::setPlugin(StoragePlugin *plugin)
  * @param response The response stream to send the response on
  * @param payload  The payload to send
  */
-void StorageApi::respond(shared_ptr<HttpServer::Response> response, const string& payload)
+void StorageApi::respond(shared_ptr<StorageHttpServer::Response> response, const string& payload)
 {
 	*response << "HTTP/1.1 200 OK\r\nContent-Length: " << payload.length() << "\r\n"
 		 <<  "Content-type: application/json\r\n\r\n" << payload;
@@ -253,10 +264,50 @@ void StorageApi::respond(shared_ptr<HttpServer::Response> response, const string
  * @param code		The HTTP esponse code to send
  * @param payload  	The payload to send
  */
-void StorageApi::respond(shared_ptr<HttpServer::Response> response, SimpleWeb::StatusCode code, const string& payload)
+void StorageApi::respond(shared_ptr<StorageHttpServer::Response> response, SimpleWeb::StatusCode code, const string& payload)
+{
+	respond(response, code, payload, JSON_CONTENT_TYPE);
+}
+
+/**
+ * Construct an HTTP response with the specified return code and content type
+ * using the payload provided.
+ *
+ * @param response 	The response stream to send the response on
+ * @param code		The HTTP esponse code to send
+ * @param payload  	The payload to send
+ * @param contentType	The media type of the payload
+ */
+void StorageApi::respond(shared_ptr<StorageHttpServer::Response> response, SimpleWeb::StatusCode code, const string& payload,
+			 const char *contentType)
 {
 	*response << "HTTP/1.1 " << status_code(code) << "\r\nContent-Length: " << payload.length() << "\r\n"
-		 <<  "Content-type: application/json\r\n\r\n" << payload;
+		 <<  "Content-type: " << contentType << "\r\n\r\n" << payload;
+}
+
+/**
+ * Send a set of readings with the 200 OK return code. The readings are
+ * sent as CBOR if the Accept header of the request includes
+ * application/cbor, otherwise they are sent as JSON.
+ *
+ * @param response	The response stream to send the response on
+ * @param request	The HTTP request
+ * @param payload	The JSON encoded readings to send
+ */
+void StorageApi::respondReadings(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request,
+				 const string& payload)
+{
+	auto accept = request->header.find("Accept");
+	if (accept != request->header.end() && accept->second.find(CBOR_CONTENT_TYPE) != string::npos)
+	{
+		string cbor;
+		if (jsonToCBOR(payload, cbor))
+		{
+			respond(response, SimpleWeb::StatusCode::success_ok, cbor, CBOR_CONTENT_TYPE);
+			return;
+		}
+	}
+	respond(response, payload);
 }
 
 /**
@@ -265,7 +316,7 @@ void StorageApi::respond(shared_ptr<HttpServer::Response> response, SimpleWeb::S
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::commonInsert(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::commonInsert(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string  tableName;
 string	payload;
@@ -289,7 +340,6 @@ string  responsePayload;
 			mapError(responsePayload, plugin->lastError());
 			respond(response, SimpleWeb::StatusCode::client_error_bad_request, responsePayload);
 		}
-		respond(response, responsePayload);
 	} catch (exception ex) {
 		internalError(response, ex);
 	}
@@ -301,7 +351,7 @@ string  responsePayload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::commonUpdate(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::commonUpdate(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string  tableName;
 string	payload;
@@ -338,7 +388,7 @@ string	responsePayload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::commonSimpleQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::commonSimpleQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string  tableName;
 SimpleWeb::CaseInsensitiveMultimap	query;
@@ -388,7 +438,7 @@ string payload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::commonQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::commonQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string  tableName;
 string	payload;
@@ -424,7 +474,7 @@ string	payload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::commonDelete(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::commonDelete(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string  tableName;
 string	payload;
@@ -448,8 +498,6 @@ string  responsePayload;
 			mapError(responsePayload, plugin->lastError());
 			respond(response, SimpleWeb::StatusCode::client_error_bad_request, responsePayload);
 		}
-
-		respond(response, responsePayload);
 	} catch (exception ex) {
 		internalError(response, ex);
 	}
@@ -461,7 +509,7 @@ string  responsePayload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::readingAppend(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::readingAppend(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string payload;
 string  responsePayload;
@@ -469,6 +517,20 @@ string  responsePayload;
 	stats.readingAppend++;
 	try {
 		payload = request->content.string();
+
+		auto contentType = request->header.find("Content-Type");
+		if (contentType != request->header.end() && contentType->second.find(CBOR_CONTENT_TYPE) != string::npos)
+		{
+			string json;
+			if (!cborToJSON(payload, json))
+			{
+				string error = "{ \"error\" : \"Invalid CBOR payload\" }";
+				respond(response, SimpleWeb::StatusCode::client_error_bad_request, error);
+				return;
+			}
+			payload = json;
+		}
+
 		int rval = plugin->readingsAppend(payload);
 		if (rval)
 		{
@@ -482,8 +544,6 @@ string  responsePayload;
 			mapError(responsePayload, plugin->lastError());
 			respond(response, SimpleWeb::StatusCode::client_error_bad_request, responsePayload);
 		}
-
-		respond(response, responsePayload);
 	} catch (exception ex) {
 		internalError(response, ex);
 	}
@@ -495,7 +555,7 @@ string  responsePayload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::readingFetch(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::readingFetch(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 SimpleWeb::CaseInsensitiveMultimap query;
 unsigned long			   id = 0;
@@ -531,7 +591,7 @@ string				   responsePayload;
 
 		responsePayload = plugin->readingsFetch(id, count);
 
-		respond(response, responsePayload);
+		respondReadings(response, request, responsePayload);
 	} catch (exception ex) {
 		internalError(response, ex);
 	}
@@ -543,7 +603,7 @@ string				   responsePayload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::readingQuery(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::readingQuery(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string	payload;
 
@@ -554,7 +614,7 @@ string	payload;
 		char *resultSet = plugin->readingsRetrieve(payload);
 		string res = resultSet;
 
-		respond(response, res);
+		respondReadings(response, request, res);
 		free(resultSet);
 	} catch (exception ex) {
 		internalError(response, ex);
@@ -568,7 +628,7 @@ string	payload;
  * @param response	The response stream to send the response on
  * @param request	The HTTP request
  */
-void StorageApi::readingPurge(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::readingPurge(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 SimpleWeb::CaseInsensitiveMultimap query;
 unsigned long age = 0;
@@ -629,7 +689,7 @@ string        flags;
 /**
  * Handle a bad URL endpoint call
  */
-void StorageApi::defaultResource(shared_ptr<HttpServer::Response> response, shared_ptr<HttpServer::Request> request)
+void StorageApi::defaultResource(shared_ptr<StorageHttpServer::Response> response, shared_ptr<StorageHttpServer::Request> request)
 {
 string	payload;
 
@@ -640,7 +700,7 @@ string	payload;
 /**
  * Handle a exception by sendign back an internal error
  */
-void StorageApi::internalError(shared_ptr<HttpServer::Response> response, const exception& ex)
+void StorageApi::internalError(shared_ptr<StorageHttpServer::Response> response, const exception& ex)
 {
 string payload = "{ \"Exception\" : \"";
 
@@ -0,0 +1,46 @@
+/*
+ * FogLAMP storage service.
+ *
+ * Copyright (c) 2017 OSisoft, LLC
+ *
+ * Released under the Apache 2.0 Licence
+ *
+ * Author: Mark Riddoch
+ */
+#include <cbor.h>
+#include <cassert>
+#include <string>
+
+using namespace std;
+
+/**
+ * A CBOR item preceded by count tags
+ */
+static string tagged(int count, const string& item)
+{
+string	cbor;
+
+	for (int i = 0; i < count; i++)
+		cbor += (char)0xc1;	// Tag 1, epoch-based date/time
+	return cbor + item;
+}
+
+int main()
+{
+string	cbor, json;
+
+	assert(jsonToCBOR("{\"a\":[1,-2,\"x\",true,null,1.5]}", cbor));
+	assert(cborToJSON(cbor, json));
+	assert(json == "{\"a\":[1,-2,\"x\",true,null,1.5]}");
+
+	// A tagged item is written as the item
+	assert(cborToJSON(tagged(3, string(1, (char)0x0a)), json));
+	assert(json == "10");
+
+	// A long chain of tags counts towards the nesting limit
+	assert(!cborToJSON(tagged(100000, string(1, (char)0x0a)), json));
+
+	// Truncated and trailing input
+	assert(!cborToJSON(string(1, (char)0x82), json));
+	assert(!cborToJSON(string("\x0a\x0a", 2), json));
+}
@@ -0,0 +1,180 @@
+/*
+ * FogLAMP storage service.
+ *
+ * Copyright (c) 2017 OSisoft, LLC
+ *
+ * Released under the Apache 2.0 Licence
+ *
+ * Author: Mark Riddoch
+ */
+#include <unix_socket_server.h>
+#include <logger.h>
+#include <sys/stat.h>
+#include <cerrno>
+#include <cstring>
+#include <unistd.h>
+
+using namespace std;
+using namespace boost::asio;
+
+/**
+ * The remote endpoint of a TCP connection
+ *
+ * @throws boost::system::system_error	The connection is not a TCP connection
+ */
+ip::tcp::endpoint StreamSocket::remote_endpoint()
+{
+generic::stream_protocol::endpoint	endpoint = basic_stream_socket::remote_endpoint();
+ip::tcp::endpoint			tcpEndpoint;
+
+	if ((endpoint.protocol().family() != AF_INET && endpoint.protocol().family() != AF_INET6) ||
+			endpoint.size() > tcpEndpoint.capacity())
+	{
+		throw boost::system::system_error(error::address_family_not_supported);
+	}
+	memcpy(tcpEndpoint.data(), endpoint.data(), endpoint.size());
+	tcpEndpoint.resize(endpoint.size());
+	return tcpEndpoint;
+}
+
+/**
+ * Accept connections on the TCP port and, the first time the server
+ * accepts, start to listen on the Unix domain socket
+ */
+void UnixSocketServer::accept()
+{
+	auto session = make_shared<Session>(create_connection(*io_service));
+
+	acceptor->async_accept(*session->connection->socket, [this, session](const SimpleWeb::error_code &ec) {
+		auto lock = session->connection->handler_runner->continue_lock();
+		if (!lock)
+			return;
+		if (ec != error::operation_aborted)
+			accept();
+		if (!ec)
+		{
+			SimpleWeb::error_code optionError;
+			session->connection->socket->set_option(ip::tcp::no_delay(true), optionError);
+			read_request_and_content(session);
+		}
+		else if (on_error)
+		{
+			on_error(session->request, ec);
+		}
+	});
+
+	if (!m_localAcceptor && !socketPath.empty() && listenLocal())
+	{
+		acceptLocal();
+	}
+}
+
+/**
+ * Create the directory of the Unix domain socket if it is missing and
+ * check that only the user of the service can write to it, so that no
+ * one else can replace the socket
+ *
+ * @param directory	The directory of the socket
+ * @return		False if the directory is not safe to use
+ */
+bool UnixSocketServer::secureDirectory(const string& directory)
+{
+struct stat	st;
+
+	if (mkdir(directory.c_str(), S_IRWXU) != 0 && errno != EEXIST)
+	{
+		Logger::getLogger()->error("Unable to create %s: %s.",
+				directory.c_str(), strerror(errno));
+		return false;
+	}
+	if (lstat(directory.c_str(), &st) != 0 || !S_ISDIR(st.st_mode) ||
+			st.st_uid != geteuid() || (st.st_mode & (S_IWGRP | S_IWOTH)) != 0)
+	{
+		Logger::getLogger()->error("Not listening on %s because %s is not a directory "
+				"that only the user of the service can write to.",
+				socketPath.c_str(), directory.c_str());
+		return false;
+	}
+	return true;
+}
+
+/**
+ * Bind the Unix domain socket, removing the socket left
+ * by a previous instance of the service
+ *
+ * @return	False if the socket could not be created, in which
+ *		case only the TCP port is available
+ */
+bool UnixSocketServer::listenLocal()
+{
+SimpleWeb::error_code	ec;
+size_t			slash = socketPath.rfind('/');
+
+	if (!secureDirectory(slash == string::npos ? "." : slash == 0 ? "/" : socketPath.substr(0, slash)))
+	{
+		return false;
+	}
+
+	unlink(socketPath.c_str());
+	m_localAcceptor = unique_ptr<local::stream_protocol::acceptor>(
+				new local::stream_protocol::acceptor(*io_service));
+	local::stream_protocol::endpoint endpoint(socketPath);
+	m_localAcceptor->open(endpoint.protocol(), ec);
+	if (!ec)
+		m_localAcceptor->bind(endpoint, ec);
+	if (!ec && chmod(socketPath.c_str(), S_IRUSR | S_IWUSR) != 0)
+		ec = SimpleWeb::error_code(errno, boost::system::system_category());
+	if (!ec)
+		m_localAcceptor->listen(socket_base::max_connections, ec);
+	if (ec)
+	{
+		Logger::getLogger()->error("Unable to listen on %s: %s.",
+				socketPath.c_str(), ec.message().c_str());
+		m_localAcceptor->close(ec);
+		return false;
+	}
+	Logger::getLogger()->info("Listening on %s.", socketPath.c_str());
+	return true;
+}
+
+/**
+ * Accept a connection on the Unix domain socket
+ */
+void UnixSocketServer::acceptLocal()
+{
+	auto session = make_shared<Session>(create_connection(*io_service));
+
+	m_localAcceptor->async_accept(*session->connection->socket, [this, session](const SimpleWeb::error_code &ec) {
+		auto lock = session->connection->handler_runner->continue_lock();
+		if (!lock || ec == error::operation_aborted)
+			return;
+		acceptLocal();
+		if (!ec)
+			read_request_and_content(session);
+	});
+}
+
+/**
+ * Return the path of the Unix domain socket the server listens on,
+ * or an empty string if it only listens on the TCP port
+ */
+string UnixSocketServer::getLocalSocket()
+{
+	if (m_localAcceptor && m_localAcceptor->is_open())
+		return socketPath;
+	return "";
+}
+
+/**
+ * Stop both listeners and close current connections
+ */
+void UnixSocketServer::stop()
+{
+	if (m_localAcceptor)
+	{
+		SimpleWeb::error_code ec;
+		m_localAcceptor->close(ec);
+		unlink(socketPath.c_str());
+	}
+	SimpleWeb::ServerBase<StreamSocket>::stop();
+}
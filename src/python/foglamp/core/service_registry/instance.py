@@ -25,9 +25,9 @@ class Service(object):
         Core = 2
         Device = 3
 
-    __slots__ = ['_id', '_name', '_type', '_protocol', '_address', '_port', '_management_port']
+    __slots__ = ['_id', '_name', '_type', '_protocol', '_address', '_port', '_management_port', '_socket']
 
-    def __init__(self, s_id, s_name, s_type, s_protocol, s_address, s_port, m_port):
+    def __init__(self, s_id, s_name, s_type, s_protocol, s_address, s_port, m_port, s_socket=None):
         self._id = s_id
         self._name = s_name
         self._type = self.valid_type(s_type)  # check with Service.Type, if not a valid type raise error
@@ -35,6 +35,8 @@ class Service(object):
         self._address = s_address
         self._port = int(s_port)
         self._management_port = int(m_port)
+        # path of a Unix domain socket on which a local service also listens
+        self._socket = s_socket
         # TODO: MUST
         # well, reserve the self PORT?
 
@@ -77,7 +79,7 @@ class Service(object):
         _logger = logger.setup(__name__, level=20)
 
         @classmethod
-        def register(cls, name, s_type, address, port, management_port,  protocol='http'):
+        def register(cls, name, s_type, address, port, management_port,  protocol='http', socket=None):
             """ registers the service instance
            
             :param name: name of the service
@@ -86,6 +88,8 @@ class Service(object):
             :param port: a valid positive integer
             :param management_port: a valid positive integer for management operations e.g. ping, shutdown
             :param protocol: defaults to http
+            :param socket: optional path of a Unix domain socket that serves the same API as port,
+                for clients on the same host
             :return: registered services' uuid
             """
 
@@ -108,7 +112,8 @@ class Service(object):
                 raise Service.NonNumericPortError
 
             service_id = str(uuid.uuid4())
-            registered_service = Service(service_id, name, s_type, protocol, address, port, management_port)
+            registered_service = Service(service_id, name, s_type, protocol, address, port, management_port,
+                                         socket)
             cls._registry.append(registered_service)
             cls._logger.info("Registered {}".format(str(registered_service)))
             return service_id
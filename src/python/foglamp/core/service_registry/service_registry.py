@@ -41,6 +41,7 @@ async def register(request):
     :Example: curl -d '{"type": "Storage", "name": "Storage Services", "address": "127.0.0.1", "service_port": 8090,
             "management_port": 1090, "protocol": "https"}' -X POST http://localhost:8082/foglamp/service
     service_port is optional
+    service_socket is the optional path of a Unix domain socket that serves the same API as service_port
     """
 
     try:
@@ -52,6 +53,7 @@ async def register(request):
         service_port = data.get('service_port', 0)
         service_management_port = data.get('management_port', None)
         service_protocol = data.get('protocol', 'http')
+        service_socket = data.get('service_socket', None)
 
         # TODO: make service port optional? or it can point to mgt port if not provided?
         if not (service_name.strip() or service_type.strip() or service_address.strip()
@@ -67,7 +69,8 @@ async def register(request):
 
         try:
             registered_service_id = Service.Instances.register(service_name, service_type, service_address,
-                                                               service_port, service_management_port, service_protocol)
+                                                               service_port, service_management_port, service_protocol,
+                                                               service_socket)
         except Service.AlreadyExistsWithTheSameName:
             raise web.HTTPBadRequest(reason='A Service with the same name already exists')
         except Service.AlreadyExistsWithTheSameAddressAndPort:
@@ -151,6 +154,8 @@ async def get_service(request):
         svc["protocol"] = service._protocol
         if service._port:
             svc["service_port"] = service._port
+        if service._socket:
+            svc["service_socket"] = service._socket
         services.append(svc)
 
     return web.json_response({"services": services})
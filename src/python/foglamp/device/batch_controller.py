@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Adaptive sizing of readings insert batches"""
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+class BatchController(object):
+    """Tunes the readings insert batch size and the number of concurrent inserts
+
+    After each insert, :meth:`record` is called with the insert's latency and the
+    number of readings waiting in memory. The controller then:
+
+    - Shrinks the batch size while inserts take longer than the latency target
+    - Grows the batch size while readings accumulate faster than they are
+      inserted and inserts meet the latency target
+    - Adds concurrent inserts while readings accumulate and the batch size can
+      not grow, and removes them when fewer inserts can keep up
+
+    The batch size grows additively and shrinks multiplicatively so that the
+    controller backs off quickly when storage slows down.
+    """
+
+    _DECREASE_FACTOR = 0.75
+    """The batch size is multiplied by this factor when inserts are too slow"""
+
+    _INCREASE_STEPS = 10
+    """The number of steps from the minimum to the maximum batch size"""
+
+    _LATENCY_WEIGHT = 0.3
+    """Weight of the newest sample in the moving average of insert latency"""
+
+    def __init__(self, min_batch_size: int, max_batch_size: int, max_inserts: int,
+                 latency_target_seconds: float):
+        """
+        Args:
+            min_batch_size: The smallest batch size to use
+            max_batch_size: The largest batch size to use. This is also the initial size.
+            max_inserts: The largest number of concurrent inserts. The initial number is 1.
+            latency_target_seconds: The time an insert should take
+        """
+        self._min_batch_size = max(1, min(min_batch_size, max_batch_size))
+        self._max_batch_size = max_batch_size
+        self._max_inserts = max(1, max_inserts)
+        self._latency_target_seconds = latency_target_seconds
+        self._increase_step = max(1, (self._max_batch_size - self._min_batch_size) //
+                                  self._INCREASE_STEPS)
+
+        self.batch_size = max_batch_size
+        """The number of readings to insert at once"""
+
+        self.inserts = 1
+        """The number of inserts to run concurrently"""
+
+        self.latency_seconds = None
+        """Moving average of insert latency"""
+
+    def record(self, latency_seconds: float, waiting_readings: int) -> None:
+        """Adjusts :attr:`batch_size` and :attr:`inserts` after an insert
+
+        Args:
+            latency_seconds: The time the insert took
+            waiting_readings: The number of readings in memory that have not been inserted
+        """
+        if self.latency_seconds is None:
+            self.latency_seconds = latency_seconds
+        else:
+            self.latency_seconds += self._LATENCY_WEIGHT * (latency_seconds -
+                                                            self.latency_seconds)
+
+        # Readings arrive faster than they are inserted
+        backlog = waiting_readings >= self.batch_size * self.inserts
+
+        if self.latency_seconds > self._latency_target_seconds:
+            if self.batch_size > self._min_batch_size:
+                self.batch_size = max(self._min_batch_size,
+                                      int(self.batch_size * self._DECREASE_FACTOR))
+            elif backlog and self.inserts < self._max_inserts:
+                self.inserts += 1
+        elif backlog:
+            if self.batch_size < self._max_batch_size:
+                self.batch_size = min(self._max_batch_size,
+                                      self.batch_size + self._increase_step)
+            elif self.inserts < self._max_inserts:
+                self.inserts += 1
+        elif self.inserts > 1 and waiting_readings < self.batch_size * (self.inserts - 1):
+            # Fewer inserts can keep up
+            self.inserts -= 1
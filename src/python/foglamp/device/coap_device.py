@@ -7,13 +7,21 @@
 """CoAP handler for sensor readings"""
 
 import asyncio
+import collections
+import datetime
 import json
+import random
+import time
+import uuid
 
 import aiocoap.resource
 import cbor2
 
 from foglamp import logger
+from foglamp.device import iso8601
+from foglamp.device import validation
 from foglamp.device.ingest import Ingest
+from foglamp.device.validation import InvalidReading, ReadingsValidator
 
 
 __author__ = "Terris Linenbach"
@@ -38,13 +46,46 @@ _DEFAULT_CONFIG = {
         'description': 'URI to accept data on',
         'type': 'string',
         'default': 'sensor-values',
+    },
+    'session_uri': {
+        'description': 'URI to accept sessions and their compact frames on',
+        'type': 'string',
+        'default': 'sensor-session',
+    },
+    'session_idle_seconds': {
+        'description': 'Forget a session when no frame has arrived for this number of seconds',
+        'type': 'integer',
+        'default': '600',
+    },
+    'session_max': {
+        'description': 'The maximum number of sessions. A client that negotiates a session '
+                       'while there are this many is answered with 5.03.',
+        'type': 'integer',
+        'default': '1000',
+    },
+    'session_ack_frequency': {
+        'description': 'Acknowledge every n-th frame of a session. Other frames receive an '
+                       'empty response unless readings are rejected.',
+        'type': 'integer',
+        'default': '10',
     }
 }
+_DEFAULT_CONFIG.update(validation.DEFAULT_CONFIG)
+
+
+def _shares_port() -> bool:
+    """Whether aiocoap sets SO_REUSEPORT on its server socket so that several
+    device workers can listen on the same port. aiocoap 0.3 does not."""
+    try:
+        from aiocoap import defaults
+        return defaults.has_reuse_port()
+    except (ImportError, AttributeError):
+        return False
 
 
 def plugin_info():
     return {'name': 'CoAP Server', 'version': '1.0', 'mode': 'async', 'type': 'device',
-            'interface': '1.0', 'config': _DEFAULT_CONFIG}
+            'interface': '1.0', 'config': _DEFAULT_CONFIG, 'shared_port': _shares_port()}
 
 
 def plugin_init(config):
@@ -53,16 +94,23 @@ def plugin_init(config):
     uri = config['uri']['value']
     port = config['port']['value']
 
+    validator = validation.create_validator(config)
+
     root = aiocoap.resource.Site()
 
     root.add_resource(('.well-known', 'core'),
                       aiocoap.resource.WKCResource(root.get_resources_as_linkheader))
 
-    root.add_resource(('other', uri), CoAPIngest())
+    root.add_resource(('other', uri), CoAPIngest(validator))
+    root.add_resource(('other', config['session_uri']['value']),
+                      CoAPSession(int(config['session_idle_seconds']['value']),
+                                  int(config['session_ack_frequency']['value']), validator,
+                                  int(config['session_max']['value'])))
 
-    asyncio.ensure_future(aiocoap.Context.create_server_context(root, bind=('::', int(port))))
+    started = asyncio.ensure_future(
+        aiocoap.Context.create_server_context(root, bind=('::', int(port))))
 
-    return {}
+    return {'started': started}
 
 
 def plugin_run(data):
@@ -77,11 +125,109 @@ def plugin_shutdown(data):
     pass
 
 
+def _credits_payload(response: dict = None) -> bytes:
+    """Adds the credits from :meth:`Ingest.get_credits` to a response and encodes it
+
+    Clients may send up to "credits" more readings right away. They should wait
+    "backoff" seconds before sending more than that or, when credits is 0,
+    before trying again.
+    """
+    response = {} if response is None else response
+    response['credits'], response['backoff'] = Ingest.get_credits()
+    return json.dumps(response).encode('utf-8')
+
+
 class CoAPIngest(aiocoap.resource.Resource):
     """Handles incoming sensor readings from CoAP"""
 
+    def __init__(self, validator: ReadingsValidator = None):
+        """
+        Args:
+            validator: Checks readings before they are passed to Ingest
+        """
+        super().__init__()
+        self._validator = ReadingsValidator() if validator is None else validator
+
+    def _reading_item(self, reading) -> tuple:
+        """Converts a reading dictionary to an input to :meth:`Ingest.add_readings_many`
+
+        Raises:
+            ValueError: reading is not a dictionary
+            InvalidReading: reading does not match a schema
+        """
+        if not isinstance(reading, dict):
+            raise ValueError('Each reading must be a dictionary')
+
+        self._validator.validate(reading)
+
+        # readings and sensor_readings are optional
+        try:
+            readings = reading['readings']
+        except KeyError:
+            readings = reading.get('sensor_values')  # sensor_values is deprecated
+
+        return reading.get('asset'), reading.get('timestamp'), reading.get('key'), readings
+
+    def _sample_item(self, asset, sample) -> tuple:
+        """Converts a (timestamp, values) sample to an input to
+        :meth:`Ingest.add_readings_many`
+
+        Raises:
+            ValueError: sample is not a (timestamp, values) pair
+            InvalidReading: values does not match the asset's schema
+        """
+        if not isinstance(sample, (list, tuple)) or len(sample) != 2:
+            raise ValueError('Each sample must be a [timestamp, values] array')
+
+        self._validator.validate_readings(asset, sample[1])
+
+        return asset, sample[0], None, sample[1]
+
     @staticmethod
-    async def render_post(request):
+    async def _add_readings_many(readings: list) -> aiocoap.Message:
+        """Adds a batch of readings
+
+        Args:
+            readings:
+                A list of items for :meth:`Ingest.add_readings_many` or the
+                ValueError that rejected an item while decoding the payload
+
+        Returns:
+            A message whose payload reports the number of accepted readings
+            and, when there are any, [index, error] for each rejected reading
+        """
+        items = []
+        indexes = []
+        errors = []
+
+        for index, item in enumerate(readings):
+            if isinstance(item, Exception):
+                Ingest.increment_discarded_readings(getattr(item, 'reason', None))
+                errors.append([index, str(item)])
+            else:
+                items.append(item)
+                indexes.append(index)
+
+        results = await Ingest.add_readings_many(items)
+
+        for index, error in zip(indexes, results):
+            if error is not None:
+                errors.append([index, str(error)])
+
+        response = {'accepted': len(readings) - len(errors)}
+
+        if errors:
+            errors.sort()
+            response['errors'] = errors
+
+        if errors and not response['accepted']:
+            code = aiocoap.numbers.codes.Code.BAD_REQUEST
+        else:
+            code = aiocoap.numbers.codes.Code.VALID
+
+        return aiocoap.Message(payload=_credits_payload(response), code=code)
+
+    async def render_post(self, request):
         """Store sensor readings from CoAP to FogLAMP
 
         Args:
@@ -103,6 +249,32 @@ class CoAPIngest(aiocoap.resource.Resource):
                             }
                         }
                     }
+
+                The payload can also be an array of such dictionaries or a
+                dictionary of samples of the same asset:
+
+                .. code-block:: python
+
+                    {
+                        "asset": "vibration1",
+                        "samples": [
+                            ["2017-01-02T01:02:03.001Z", {"x": 0.51, "y": 0.02}],
+                            ["2017-01-02T01:02:03.002Z", {"x": 0.49, "y": 0.03}]
+                        ]
+                    }
+
+                Batches are added in one call to Ingest. The response payload
+                for a batch looks like ``{"accepted": 9, "errors": [[4, "message"]]}``
+                where 4 is the index of a rejected reading or sample. "errors"
+                is omitted when every reading is accepted.
+
+                Responses also have "credits" and "backoff" entries. See
+                :func:`_credits_payload`. When credits is 0, readings are not
+                accepted and the response code is 5.03.
+
+                Readings that do not match the configured schemas are rejected
+                with 4.00 or, in a batch, reported as errors. See
+                :mod:`foglamp.device.validation`.
         """
         # aiocoap handlers must be defensive about exceptions. If an exception
         # is raised out of a handler, it is permanently disabled by aiocoap.
@@ -114,27 +286,46 @@ class CoAPIngest(aiocoap.resource.Resource):
 
         code = aiocoap.numbers.codes.Code.INTERNAL_SERVER_ERROR
         increment_discarded_counter = True
+        reason = None
         message = ''
 
         try:
-            if not Ingest.is_available():
-                message = '{"busy": true}'
+            credits, backoff = Ingest.get_credits()
+
+            if not credits:
+                code = aiocoap.numbers.codes.Code.SERVICE_UNAVAILABLE
+                message = json.dumps({'credits': credits, 'backoff': backoff})
             else:
                 payload = cbor2.loads(request.payload)
 
+                if isinstance(payload, list) or (isinstance(payload, dict) and
+                                                 'samples' in payload):
+                    if isinstance(payload, list):
+                        readings = payload
+                        to_item = self._reading_item
+                    else:
+                        readings = payload['samples']
+                        if not isinstance(readings, list):
+                            raise ValueError('samples must be an array')
+                        asset = payload.get('asset')
+
+                        def to_item(sample):
+                            return self._sample_item(asset, sample)
+
+                    items = []
+                    for reading in readings:
+                        try:
+                            items.append(to_item(reading))
+                        except ValueError as e:
+                            items.append(e)
+
+                    increment_discarded_counter = False
+                    return await self._add_readings_many(items)
+
                 if not isinstance(payload, dict):
                     raise ValueError('Payload must be a dictionary')
 
-                asset = payload.get('asset')
-                timestamp = payload.get('timestamp')
-
-                key = payload.get('key')
-
-                # readings and sensor_readings are optional
-                try:
-                    readings = payload['readings']
-                except KeyError:
-                    readings = payload.get('sensor_values')  # sensor_values is deprecated
+                asset, timestamp, key, readings = self._reading_item(payload)
 
                 increment_discarded_counter = False
 
@@ -142,15 +333,254 @@ class CoAPIngest(aiocoap.resource.Resource):
                                           readings=readings)
 
                 # Success
-                code = aiocoap.numbers.codes.Code.VALID
+                return aiocoap.Message(payload=_credits_payload(),
+                                       code=aiocoap.numbers.codes.Code.VALID)
         except (ValueError, TypeError) as e:
             code = aiocoap.numbers.codes.Code.BAD_REQUEST
+            reason = getattr(e, 'reason', None)
             message = json.dumps({message: str(e)})
         except Exception:
             _LOGGER.exception('Add readings failed')
 
         if increment_discarded_counter:
-            Ingest.increment_discarded_readings()
+            Ingest.increment_discarded_readings(reason)
 
         return aiocoap.Message(payload=message.encode('utf-8'), code=code)
 
+
+class _Session(object):
+    """What a client negotiated with :class:`CoAPSession`"""
+
+    __slots__ = ['asset', 'schema', 'key_namespace', 'interval', 'expires']
+
+    def __init__(self, asset: str, schema: list, key_namespace: uuid.UUID,
+                 interval: datetime.timedelta):
+        self.asset = asset
+        self.schema = schema
+        self.key_namespace = key_namespace
+        self.interval = interval
+        self.expires = 0
+
+
+class CoAPSession(aiocoap.resource.Resource):
+    """Accepts sensor readings as compact frames of values
+
+    A client first POSTs a cbor-encoded dictionary that describes its readings:
+
+    .. code-block:: python
+
+        {
+            "asset": "vibration1",
+            "schema": ["x", "y", "z"],
+            "key_prefix": "80a43623-ebe5-40d6-8d80-3f892da9b3b4",
+            "interval_ms": 1
+        }
+
+    key_prefix and interval_ms are optional. The response payload is
+    ``{"session": 123, "ack_frequency": 10}``. When there are too many sessions,
+    negotiation is answered with 5.03.
+
+    The client then POSTs frames, which can be non-confirmable, to the same URI.
+    A frame is a cbor-encoded array:
+
+    .. code-block:: python
+
+        [session, sequence, timestamp, [0.51, 0.02, 0.98], [0.49, 0.03, 0.97]]
+
+    Each array after timestamp holds the values of one reading in schema
+    order. The n-th reading is taken interval_ms * n milliseconds after
+    timestamp, which is an ISO 8601 string, seconds since the epoch or
+    null for the time the frame arrived. When key_prefix is given, each reading's
+    key is derived from key_prefix, session, sequence and n so that frames that
+    are sent again in the same session are discarded. A new session can restart
+    sequence numbers with the same key_prefix.
+
+    Every ack_frequency-th frame and every frame with rejected readings is
+    answered with ``{"ack": sequence, "accepted": 2, "errors": [[1, "message"]]}``.
+    Other frames are answered with an empty payload. Unknown sessions are answered
+    with 4.04 and the client negotiates again. Acknowledgements and the response
+    to negotiation also carry credits; see :func:`_credits_payload`. When there
+    are no credits, frames are answered with 5.03.
+    """
+
+    def __init__(self, idle_seconds: int, ack_frequency: int,
+                 validator: ReadingsValidator = None, max_sessions: int = 1000):
+        """
+        Args:
+            idle_seconds: Forget a session when no frame has arrived for this long
+            ack_frequency: Acknowledge every n-th frame
+            validator: Checks the readings of each asset before they are passed to Ingest
+            max_sessions: The maximum number of sessions
+        """
+        super().__init__()
+        self._idle_seconds = idle_seconds
+        self._ack_frequency = max(1, ack_frequency)
+        self._validator = ReadingsValidator() if validator is None else validator
+        self._max_sessions = max_sessions
+        self._sessions = collections.OrderedDict()  # type: collections.OrderedDict
+        """Sessions by id. Ordered by expiration time."""
+
+    def _expire_sessions(self, now: float) -> None:
+        sessions = self._sessions
+        while sessions:
+            session_id, session = next(iter(sessions.items()))
+            if session.expires > now:
+                break
+            del sessions[session_id]
+
+    def _negotiate(self, payload: dict) -> aiocoap.Message:
+        """Creates a session
+
+        Raises:
+            ValueError, TypeError, OverflowError: The session description is invalid
+        """
+        asset = payload.get('asset')
+        if not isinstance(asset, str):
+            raise TypeError('asset must be a string')
+
+        schema = payload.get('schema')
+        if (not isinstance(schema, list) or not schema or
+                not all(isinstance(name, str) for name in schema)):
+            raise TypeError('schema must be an array of value names')
+
+        key_prefix = payload.get('key_prefix')
+        key_namespace = None if key_prefix is None else uuid.UUID(key_prefix)
+
+        interval_ms = payload.get('interval_ms', 0)
+        if not isinstance(interval_ms, (int, float)):
+            raise TypeError('interval_ms must be a number')
+
+        now = time.monotonic()
+        self._expire_sessions(now)
+
+        if len(self._sessions) >= self._max_sessions:
+            _LOGGER.warning('Rejected a session because there are %s sessions',
+                            len(self._sessions))
+            return aiocoap.Message(payload=_credits_payload(),
+                                   code=aiocoap.numbers.codes.Code.SERVICE_UNAVAILABLE)
+
+        session_id = random.getrandbits(31)
+        while session_id in self._sessions:
+            session_id = random.getrandbits(31)
+
+        session = _Session(asset, schema, key_namespace,
+                           datetime.timedelta(milliseconds=interval_ms))
+        session.expires = now + self._idle_seconds
+        self._sessions[session_id] = session
+
+        response = {'session': session_id, 'ack_frequency': self._ack_frequency}
+        return aiocoap.Message(payload=_credits_payload(response),
+                               code=aiocoap.numbers.codes.Code.CREATED)
+
+    async def _add_frame(self, frame: list) -> aiocoap.Message:
+        """Adds the readings in a frame
+
+        Raises:
+            ValueError, TypeError, OverflowError: The frame is invalid
+        """
+        if len(frame) < 3:
+            raise ValueError('A frame must be [session, sequence, timestamp, values...]')
+
+        session_id, sequence, timestamp = frame[:3]
+
+        now = time.monotonic()
+        self._expire_sessions(now)
+
+        try:
+            session = self._sessions[session_id]
+        except (KeyError, TypeError):
+            return aiocoap.Message(payload=b'', code=aiocoap.numbers.codes.Code.NOT_FOUND)
+
+        session.expires = now + self._idle_seconds
+        self._sessions.move_to_end(session_id)
+
+        if not isinstance(sequence, int):
+            raise TypeError('sequence must be an integer')
+
+        if timestamp is None:
+            timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+        elif isinstance(timestamp, (int, float)):
+            try:
+                timestamp = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+            except (OverflowError, OSError):
+                raise ValueError('timestamp is out of range')
+        else:
+            timestamp = iso8601.parse(timestamp)
+
+        schema = session.schema
+        items = []
+        indexes = []
+        errors = []
+
+        for index, values in enumerate(frame[3:]):
+            if not isinstance(values, list) or len(values) != len(schema):
+                errors.append([index, 'Expected {} values'.format(len(schema))])
+                Ingest.increment_discarded_readings()
+                continue
+
+            if session.key_namespace is None:
+                key = None
+            else:
+                key = uuid.uuid5(session.key_namespace,
+                                 '{}.{}.{}'.format(session_id, sequence, index))
+
+            readings = dict(zip(schema, values))
+
+            try:
+                self._validator.validate_readings(session.asset, readings)
+            except InvalidReading as e:
+                errors.append([index, str(e)])
+                Ingest.increment_discarded_readings(e.reason)
+                continue
+
+            items.append((session.asset, timestamp + session.interval * index, key,
+                          readings))
+            indexes.append(index)
+
+        accepted = len(items)
+
+        if items:
+            for index, error in zip(indexes, await Ingest.add_readings_many(items)):
+                if error is not None:
+                    accepted -= 1
+                    errors.append([index, str(error)])
+            errors.sort()
+
+        if errors or sequence % self._ack_frequency == 0:
+            response = {'ack': sequence, 'accepted': accepted}
+            if errors:
+                response['errors'] = errors
+            payload = _credits_payload(response)
+        else:
+            payload = b''
+
+        return aiocoap.Message(payload=payload, code=aiocoap.numbers.codes.Code.VALID)
+
+    async def render_post(self, request):
+        """Creates a session or adds the readings in a frame
+
+        See :class:`CoAPSession`
+        """
+        # See CoAPIngest.render_post about catching Exception
+        try:
+            if not Ingest.get_credits()[0]:
+                return aiocoap.Message(payload=_credits_payload(),
+                                       code=aiocoap.numbers.codes.Code.SERVICE_UNAVAILABLE)
+
+            payload = cbor2.loads(request.payload)
+
+            if isinstance(payload, dict):
+                return self._negotiate(payload)
+
+            if isinstance(payload, list):
+                return await self._add_frame(payload)
+
+            raise ValueError('Payload must be a dictionary or an array')
+        except (ValueError, TypeError, OverflowError) as e:
+            message = json.dumps({'': str(e)})
+            return aiocoap.Message(payload=message.encode('utf-8'),
+                                   code=aiocoap.numbers.codes.Code.BAD_REQUEST)
+        except Exception:
+            _LOGGER.exception('Add readings failed')
+            return aiocoap.Message(payload=b'',
+                                   code=aiocoap.numbers.codes.Code.INTERNAL_SERVER_ERROR)
@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""HTTP handler for sensor readings"""
+
+import asyncio
+import codecs
+import json
+import math
+import socket
+
+from aiohttp import web
+
+from foglamp import logger
+from foglamp.device import validation
+from foglamp.device.ingest import Ingest
+from foglamp.device.validation import ReadingsValidator
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_LOGGER = logger.setup(__name__)
+
+_DEFAULT_CONFIG = {
+    'plugin': {
+         'description': 'Python module name of the plugin to load',
+         'type': 'string',
+         'default': 'foglamp.device.http_device'
+    },
+    'port': {
+        'description': 'Port to listen on',
+        'type': 'integer',
+        'default': '6683',
+    },
+    'uri': {
+        'description': 'URI to accept data on',
+        'type': 'string',
+        'default': 'sensor-reading',
+    },
+    'batch_size': {
+        'description': 'The number of readings in a request body to add to the buffer at once',
+        'type': 'integer',
+        'default': '1000',
+    }
+}
+_DEFAULT_CONFIG.update(validation.DEFAULT_CONFIG)
+
+_CHUNK_SIZE = 65536
+"""Number of bytes to read from a request body at once"""
+
+_MAX_ELEMENT_SIZE = 1024*1024
+"""Number of characters in an element of a JSON array request body beyond which the
+body is rejected as invalid"""
+
+
+def plugin_info():
+    return {'name': 'HTTP Server', 'version': '1.0', 'mode': 'async', 'type': 'device',
+            'interface': '1.0', 'config': _DEFAULT_CONFIG,
+            'shared_port': hasattr(socket, 'SO_REUSEPORT')}
+
+
+def plugin_init(config):
+    """Registers HTTP handler to accept sensor readings"""
+
+    uri = config['uri']['value']
+    port = config['port']['value']
+
+    handler = HttpIngest(int(config['batch_size']['value']),
+                         validation.create_validator(config))
+
+    app = web.Application()
+    app.router.add_route('POST', '/{}'.format(uri), handler.render_post)
+
+    data = {'app': app, 'handler': app.make_handler(), 'server': None}
+
+    data['started'] = asyncio.ensure_future(_start_server(data, int(port)))
+
+    return data
+
+
+async def _start_server(data, port):
+    # Several device workers can listen on the same port
+    reuse_port = hasattr(socket, 'SO_REUSEPORT')
+    data['server'] = await asyncio.get_event_loop().create_server(
+        data['handler'], '0.0.0.0', port, reuse_port=reuse_port)
+
+
+def plugin_run(data):
+    pass
+
+
+def plugin_reconfigure(config):
+    pass
+
+
+def plugin_shutdown(data):
+    if data['server'] is not None:
+        data['server'].close()
+    asyncio.ensure_future(data['handler'].shutdown())
+
+
+class _LineIterator(object):
+    """Iterates over each value in a newline-delimited JSON stream"""
+
+    def __init__(self, content):
+        self._content = content
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            line = await self._content.readline()
+            if not line:
+                raise StopAsyncIteration
+            line = line.strip()
+            if line:
+                return json.loads(line.decode('utf-8'))
+
+
+class _ArrayIterator(object):
+    """Iterates over each value in a JSON array stream without reading the
+    entire stream
+
+    Raises:
+        ValueError: The stream is not a JSON array, or an element is longer
+            than max_element_size characters
+    """
+
+    def __init__(self, content, max_element_size: int = _MAX_ELEMENT_SIZE):
+        self._content = content
+        self._max_element_size = max_element_size
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._position = 0
+        self._started = False
+        self._first = True
+        self._expect_value = True  # An element rather than a separator is next
+        self._eof = False
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+
+        while True:
+            buffer = self._buffer
+            position = self._position
+
+            # Skip whitespace
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            self._position = position
+
+            if position < len(buffer):
+                char = buffer[position]
+
+                if not self._started:
+                    if char != '[':
+                        raise ValueError('The request body must be a JSON array')
+                    self._started = True
+                    self._position += 1
+                    continue
+
+                if char == ']' and (self._first or not self._expect_value):
+                    self._done = True
+                    raise StopAsyncIteration
+
+                if not self._expect_value:
+                    if char != ',':
+                        raise ValueError('Expected , or ] after an array element')
+                    self._expect_value = True
+                    self._position += 1
+                    continue
+
+                if char in ',]':
+                    raise ValueError('Expected an array element')
+
+                try:
+                    value, end = self._decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if self._eof:
+                        raise
+                else:
+                    # A number at the end of the buffer can continue in the next chunk
+                    if end < len(buffer) or self._eof:
+                        self._position = end
+                        self._expect_value = False
+                        self._first = False
+                        return value
+
+                if len(buffer) - position > self._max_element_size:
+                    raise ValueError('An array element is longer than {} characters'.format(
+                        self._max_element_size))
+
+            if self._eof:
+                raise ValueError('The JSON array is not terminated')
+
+            chunk = await self._content.read(_CHUNK_SIZE)
+            self._eof = not chunk
+            self._buffer = buffer[position:] + self._utf8.decode(chunk, final=self._eof)
+            self._position = 0
+
+
+class HttpIngest(object):
+    """Handles incoming sensor readings from HTTP"""
+
+    def __init__(self, batch_size: int, validator: ReadingsValidator = None):
+        """
+        Args:
+            batch_size: The number of readings to pass to Ingest at once
+            validator: Checks readings before they are passed to Ingest
+        """
+        self._batch_size = max(1, batch_size)
+        self._validator = ReadingsValidator() if validator is None else validator
+
+    def _reading_item(self, reading) -> tuple:
+        """Converts a reading dictionary to an input to :meth:`Ingest.add_readings_many`
+
+        Raises:
+            ValueError: reading is not a dictionary
+            InvalidReading: reading does not match a schema
+        """
+        if not isinstance(reading, dict):
+            raise ValueError('Each reading must be a dictionary')
+
+        self._validator.validate(reading)
+
+        return (reading.get('asset'), reading.get('timestamp'), reading.get('key'),
+                reading.get('readings'))
+
+    @staticmethod
+    def _response(response: dict, status: int = 200) -> web.Response:
+        """Adds the credits from :meth:`Ingest.get_credits` to a response
+
+        Clients may send up to "credits" more readings right away. They should wait
+        "backoff" seconds before sending more than that or, when credits is 0,
+        before trying again. Retry-After is backoff rounded up when the status is
+        429 or 503.
+        """
+        response['credits'], response['backoff'] = Ingest.get_credits()
+
+        headers = None
+        if status in (429, 503):
+            headers = {'Retry-After': str(max(1, math.ceil(response['backoff'])))}
+
+        return web.json_response(response, status=status, headers=headers)
+
+    async def _add_batch(self, batch: list, offset: int, errors: list) -> int:
+        """Adds a batch of readings and records the index of each rejected reading
+
+        Returns:
+            The number of accepted readings
+        """
+        items = []
+        indexes = []
+
+        for index, reading in enumerate(batch, offset):
+            try:
+                items.append(self._reading_item(reading))
+                indexes.append(index)
+            except ValueError as e:
+                Ingest.increment_discarded_readings(getattr(e, 'reason', None))
+                errors.append([index, str(e)])
+
+        accepted = len(items)
+
+        for index, error in zip(indexes, await Ingest.add_readings_many(items)):
+            if error is not None:
+                accepted -= 1
+                errors.append([index, str(error)])
+
+        return accepted
+
+    async def render_post(self, request):
+        """Store sensor readings from HTTP to FogLAMP
+
+        Args:
+            request:
+                The body is a JSON array of readings or, when the content type is
+                application/x-ndjson, one reading per line. A reading looks like:
+
+                .. code-block:: python
+
+                    {
+                        "timestamp": "2017-01-02T01:02:03.23232Z-05:00",
+                        "asset": "pump1",
+                        "key": "80a43623-ebe5-40d6-8d80-3f892da9b3b4",
+                        "readings": {
+                            "velocity": "500"
+                        }
+                    }
+
+                The body is read while readings are added to the buffer in batches.
+                When the buffer is full, reading the body waits for room.
+
+        Returns:
+            ``{"accepted": 9, "errors": [[4, "message"]]}`` where 4 is the index of a
+            rejected reading. "errors" is omitted when every reading is accepted.
+            The status is 400 when the body is not valid JSON; readings before the
+            invalid JSON are accepted. The status is 429 when there are no
+            credits before the body is read. The response also has "credits" and
+            "backoff" entries. See :meth:`_response`.
+
+        :Example:
+            curl -X POST -H 'Content-Type: application/x-ndjson' --data-binary @readings.ndjson
+            http://localhost:6683/sensor-reading
+        """
+        if not Ingest.get_credits()[0]:
+            return self._response({'accepted': 0}, 429)
+
+        if request.content_type == 'application/x-ndjson':
+            readings = _LineIterator(request.content)
+        else:
+            readings = _ArrayIterator(request.content)
+
+        accepted = 0
+        count = 0
+        errors = []
+        batch = []
+        status = 200
+
+        try:
+            try:
+                async for reading in readings:
+                    batch.append(reading)
+                    if len(batch) >= self._batch_size:
+                        accepted += await self._add_batch(batch, count, errors)
+                        count += len(batch)
+                        batch = []
+            except ValueError as e:
+                # Keep the readings before the invalid JSON
+                errors.append([count + len(batch), str(e)])
+                status = 400
+
+            if batch:
+                accepted += await self._add_batch(batch, count, errors)
+        except RuntimeError:
+            # The device server is stopping
+            status = 503
+
+        response = {'accepted': accepted}
+
+        if errors:
+            response['errors'] = sorted(errors)
+
+        return self._response(response, status)
@@ -7,21 +7,26 @@
 """FogLAMP Sensor Readings Ingest API"""
 
 import asyncio
+import collections
 import datetime
+import heapq
 import logging
 import os
+import random
 import time
 import uuid
-from random import randint
-from typing import List, Union
+from typing import List, Optional, Sequence, Tuple, Union
 
 import asyncpg
-import dateutil.parser
 import json
 
 from foglamp import logger
 from foglamp import statistics
 from foglamp import configuration_manager
+from foglamp.device import iso8601
+from foglamp.device.batch_controller import BatchController
+from foglamp.device.key_cache import KeyCache
+from foglamp.device.spill import SpillBuffer, SpilledReading
 
 
 __author__ = "Terris Linenbach"
@@ -50,12 +55,60 @@ class Ingest(object):
     _discarded_readings_stats = 0  # type: int
     """Number of readings rejected before statistics were written to storage"""
 
+    _connections_opened_stats = 0  # type: int
+    """Number of storage connections opened before statistics were written to storage"""
+
+    _insert_failures_stats = 0  # type: int
+    """Number of failed storage operations before statistics were written to storage"""
+
+    _discarded_reasons = collections.Counter()  # type: collections.Counter
+    """Number of readings rejected for each reason given to
+    :meth:`increment_discarded_readings` since the counts were last logged"""
+
+    _spill_depth_stats = 0  # type: int
+    """Change in the number of spilled readings before statistics were written to storage"""
+
+    _spill_depth_reported = 0  # type: int
+    """Number of spilled readings when statistics were last written to storage"""
+
+    _STATISTICS = (('READINGS', '_readings_stats'),
+                   ('DISCARDED', '_discarded_readings_stats'),
+                   ('INGESTCONN', '_connections_opened_stats'),
+                   ('INGESTFAIL', '_insert_failures_stats'),
+                   ('SPILLDEPTH', '_spill_depth_stats'))
+    """Statistics keys and the class attributes that count them"""
+
+    _STATISTICS_DESCRIPTIONS = {
+        'INGESTCONN': 'The number of storage connections opened by the device service '
+                      'to insert readings',
+        'INGESTFAIL': 'The number of failed attempts by the device service to insert '
+                      'readings into storage',
+        'SPILLDEPTH': 'The number of readings the device service has stored on disk '
+                      'because they did not fit in memory',
+    }
+    """Descriptions of the statistics rows that :meth:`_write_statistics` creates when
+    they are missing. They were added after the first release of the init data."""
+
     _write_statistics_task = None  # type: asyncio.Task
     """asyncio task for :meth:`_write_statistics`"""
 
     _write_statistics_sleep_task = None  # type: asyncio.Task
     """asyncio task for asyncio.sleep"""
 
+    _worker = 0  # type: int
+    """Index of this device service process. See :meth:`start`."""
+
+    _statistics_fd = None  # type: int
+    """Pipe to the first worker. Used instead of storage to write statistics when this
+    is not the first worker."""
+
+    _read_worker_statistics_tasks = None  # type: List[asyncio.Task]
+    """asyncio tasks for :meth:`_read_worker_statistics`"""
+
+    _WORKER_STATISTICS_TIMEOUT_SECONDS = 30
+    """Number of seconds the first worker waits for the other workers' final statistics
+    when stopping"""
+
     _stop = False
     """True when the server needs to stop"""
 
@@ -77,18 +130,88 @@ class Ingest(object):
     _readings_list_not_empty = None  # type: List[asyncio.Event]
     """Fired when a readings list transitions from empty to not empty"""
 
-    _readings_lists_not_full = None  # type: asyncio.Event
-    """Fired when items are removed from any readings list"""
+    _readings_free_slots = 0  # type: int
+    """Number of readings that can be added to the readings lists without waiting"""
+
+    _readings_slots_waiters = None  # type: collections.deque
+    """Futures of :meth:`add_readings` calls that are waiting for free slots"""
+
+    _lists_below_batch_size = None  # type: List[int]
+    """Heap of indexes of readings lists that have fewer than _readings_insert_batch_size
+    items. Entries can be stale."""
+
+    _lists_below_batch_size_queued = None  # type: List[bool]
+    """Whether each readings list is in :attr:`_lists_below_batch_size`"""
+
+    _lists_with_room = None  # type: List[int]
+    """Heap of indexes of readings lists that have fewer than _readings_list_size items.
+    Entries can be stale."""
+
+    _lists_with_room_queued = None  # type: List[bool]
+    """Whether each readings list is in :attr:`_lists_with_room`"""
 
     _insert_readings_wait_tasks = None  # type: List[asyncio.Task]
     """asyncio tasks blocking :meth:`_insert_readings` that can be canceled"""
 
+    _connection_pool = None  # type: asyncpg.pool.Pool
+    """Storage connections used by :meth:`_insert_readings`"""
+
+    _connection_pool_lock = None  # type: asyncio.Lock
+    """Held while :attr:`_connection_pool` is created"""
+
+    _check_connection_pool_task = None  # type: asyncio.Task
+    """asyncio task for :meth:`_check_connection_pool`"""
+
+    _check_connection_pool_sleep_task = None  # type: asyncio.Task
+    """asyncio task for asyncio.sleep"""
+
+    _batch_controller = None  # type: BatchController
+    """Tunes the batch size and the number of concurrent inserts when
+    readings_insert_adaptive is enabled"""
+
+    _insert_permits = None  # type: asyncio.Condition
+    """Limits the number of concurrent inserts to :attr:`_batch_controller`.inserts"""
+
+    _active_inserts = 0  # type: int
+    """Number of inserts in progress when readings_insert_adaptive is enabled"""
+
     _last_insert_time = 0  # type: int
     """epoch time of last insert"""
 
+    _insert_rate = None  # type: float
+    """Moving average of the number of readings removed from the buffer per second"""
+
+    _insert_rate_count = 0  # type: int
+    """Number of readings removed from the buffer since :attr:`_insert_rate_time`"""
+
+    _insert_rate_time = 0  # type: float
+    """time.monotonic() when :attr:`_insert_rate_count` was reset"""
+
+    _INSERT_RATE_WEIGHT = 0.3
+    """Weight of the newest sample in :attr:`_insert_rate`"""
+
+    _MAX_BACKOFF_SECONDS = 10
+    """The longest backoff suggested by :meth:`get_credits`"""
+
     _readings_list_size = 0  # type: int
     """Maximum number of readings items in each buffer"""
 
+    _read_key_cache = None  # type: KeyCache
+    """Keys of recently added readings. Used to discard duplicate readings."""
+
+    _spill_buffer = None  # type: SpillBuffer
+    """Readings that did not fit in the readings lists when
+    readings_spill_max_megabytes is not 0"""
+
+    _spill_not_empty = None  # type: asyncio.Event
+    """Fired when readings are added to :attr:`_spill_buffer`"""
+
+    _spill_taken = None  # type: asyncio.Event
+    """Fired when readings are read from or acknowledged in :attr:`_spill_buffer`"""
+
+    _drain_spill_task = None  # type: asyncio.Task
+    """asyncio task for :meth:`_drain_spill`"""
+
     # Configuration (begin)
     _write_statistics_frequency_seconds = 5
     """The number of seconds to wait before writing readings-related statistics to storage"""
@@ -105,11 +228,35 @@ class Ingest(object):
     _readings_insert_batch_timeout_seconds = 1
     """Number of seconds to wait for a readings list to reach the minimum batch size"""
 
+    _readings_insert_adaptive = False
+    """Whether to tune the batch size and the number of concurrent inserts while running"""
+
+    _min_readings_insert_batch_size = 10
+    """Minimum number of readings in a batch of inserts when _readings_insert_adaptive is True"""
+
+    _readings_insert_latency_target_milliseconds = 250
+    """Number of milliseconds an insert should take when _readings_insert_adaptive is True"""
+
+    _min_readings_insert_connections = 1
+    """Minimum number of connections to keep open to insert readings"""
+
     _max_readings_insert_batch_connection_idle_seconds = 60
     """Close connections used to insert readings when idle for this number of seconds"""
 
     _max_readings_insert_batch_reconnect_wait_seconds = 10
     """The maximum number of seconds to wait before reconnecting to storage when inserting readings"""
+
+    _read_key_cache_size = 10000
+    """Maximum number of readings keys to remember in order to discard duplicate readings"""
+
+    _read_key_cache_seconds = 300
+    """Number of seconds to remember a readings key in order to discard duplicate readings"""
+
+    _readings_spill_max_megabytes = 0
+    """Maximum size of the disk buffer for readings that do not fit in memory. 0 disables it."""
+
+    _readings_spill_directory = '~/var/spool/foglamp/readings'
+    """Where to store readings that do not fit in memory"""
     # Configuration (end)
 
     @classmethod
@@ -148,6 +295,31 @@ class Ingest(object):
                 "type": "integer",
                 "default": str(cls._readings_insert_batch_timeout_seconds)
             },
+            "readings_insert_adaptive": {
+                "description": "Tune the batch size and the number of concurrent inserts "
+                               "while running. readings_insert_batch_size and "
+                               "max_concurrent_readings_inserts become maximums.",
+                "type": "boolean",
+                "default": str(cls._readings_insert_adaptive)
+            },
+            "min_readings_insert_batch_size": {
+                "description": "The minimum number of readings in a batch of inserts when "
+                               "readings_insert_adaptive is enabled",
+                "type": "integer",
+                "default": str(cls._min_readings_insert_batch_size)
+            },
+            "readings_insert_latency_target_milliseconds": {
+                "description": "The number of milliseconds an insert should take when "
+                               "readings_insert_adaptive is enabled",
+                "type": "integer",
+                "default": str(cls._readings_insert_latency_target_milliseconds)
+            },
+            "min_readings_insert_connections": {
+                "description": "The minimum number of storage connections to keep open "
+                               "to insert readings",
+                "type": "integer",
+                "default": str(cls._min_readings_insert_connections)
+            },
             "max_readings_insert_batch_connection_idle_seconds": {
                 "description": "Close storage connections used to insert readings when idle for "
                             "this number of seconds",
@@ -160,6 +332,31 @@ class Ingest(object):
                 "type": "integer",
                 "default": str(cls._max_readings_insert_batch_reconnect_wait_seconds)
             },
+            "read_key_cache_size": {
+                "description": "The maximum number of readings keys to remember in order to "
+                               "discard duplicate readings. 0 disables the cache.",
+                "type": "integer",
+                "default": str(cls._read_key_cache_size)
+            },
+            "read_key_cache_seconds": {
+                "description": "The number of seconds to remember a readings key in order to "
+                               "discard duplicate readings",
+                "type": "integer",
+                "default": str(cls._read_key_cache_seconds)
+            },
+            "readings_spill_max_megabytes": {
+                "description": "The maximum size of the disk buffer for readings that do not "
+                               "fit in memory. 0 disables the disk buffer and readings are "
+                               "rejected when memory is full.",
+                "type": "integer",
+                "default": str(cls._readings_spill_max_megabytes)
+            },
+            "readings_spill_directory": {
+                "description": "The directory where readings that do not fit in memory "
+                               "are stored",
+                "type": "string",
+                "default": cls._readings_spill_directory
+            },
         }
 
         # Create configuration category and any new keys within it
@@ -178,18 +375,44 @@ class Ingest(object):
         cls._readings_insert_batch_timeout_seconds = int(config
                                                          ['readings_insert_batch_timeout_seconds']
                                                          ['value'])
+        cls._readings_insert_adaptive = config['readings_insert_adaptive']['value'] == 'True'
+        cls._min_readings_insert_batch_size = int(config['min_readings_insert_batch_size']
+                                                        ['value'])
+        cls._readings_insert_latency_target_milliseconds = int(
+            config['readings_insert_latency_target_milliseconds']['value'])
+        cls._min_readings_insert_connections = int(config['min_readings_insert_connections']
+                                                         ['value'])
         cls._max_readings_insert_batch_connection_idle_seconds = int(
                 config['max_readings_insert_batch_connection_idle_seconds']
                       ['value'])
         cls._max_readings_insert_batch_reconnect_wait_seconds = int(
             config['max_readings_insert_batch_reconnect_wait_seconds']['value'])
+        cls._read_key_cache_size = int(config['read_key_cache_size']['value'])
+        cls._read_key_cache_seconds = int(config['read_key_cache_seconds']['value'])
+        cls._readings_spill_max_megabytes = int(config['readings_spill_max_megabytes']['value'])
+        cls._readings_spill_directory = config['readings_spill_directory']['value']
 
     @classmethod
-    async def start(cls):
-        """Starts the server"""
+    async def start(cls, worker: int = 0, statistics_fd: int = None,
+                    worker_statistics_fds: Sequence[int] = ()):
+        """Starts the server
+
+        When the device service runs in several processes, each process starts its
+        own server. The first worker writes the statistics of all workers to storage.
+
+        Args:
+            worker: Index of this process. 0 for the first worker.
+            statistics_fd:
+                Write end of a pipe to the first worker. Required when worker is not 0.
+            worker_statistics_fds:
+                Read ends of the pipes from the other workers when worker is 0
+        """
         if cls._started:
             return
 
+        cls._worker = worker
+        cls._statistics_fd = statistics_fd
+
         await cls._read_config()
 
         cls._readings_list_size = int(cls._readings_buffer_size / (
@@ -205,10 +428,32 @@ class Ingest(object):
                             'to %s', cls._readings_buffer_size,
                             cls._readings_list_size * cls._max_concurrent_readings_inserts)
 
+        cls._read_key_cache = KeyCache(cls._read_key_cache_size, cls._read_key_cache_seconds)
+
+        if cls._readings_insert_adaptive:
+            cls._batch_controller = BatchController(
+                cls._min_readings_insert_batch_size, cls._readings_insert_batch_size,
+                cls._max_concurrent_readings_inserts,
+                cls._readings_insert_latency_target_milliseconds / 1000)
+            cls._insert_permits = asyncio.Condition()
+            cls._active_inserts = 0
+        else:
+            cls._batch_controller = None
+            cls._insert_permits = None
+
         # Start asyncio tasks
         cls._write_statistics_task = asyncio.ensure_future(cls._write_statistics())
+        cls._read_worker_statistics_tasks = [
+            asyncio.ensure_future(cls._read_worker_statistics(fd))
+            for fd in worker_statistics_fds]
 
         cls._last_insert_time = 0
+        cls._insert_rate = None
+        cls._insert_rate_count = 0
+        cls._insert_rate_time = time.monotonic()
+
+        cls._connection_pool_lock = asyncio.Lock()
+        cls._check_connection_pool_task = asyncio.ensure_future(cls._check_connection_pool())
 
         cls._insert_readings_tasks = []
         cls._insert_readings_wait_tasks = []
@@ -223,9 +468,30 @@ class Ingest(object):
             cls._readings_list_batch_size_reached.append(asyncio.Event())
             cls._readings_list_not_empty.append(asyncio.Event())
 
-        cls._readings_lists_not_full = asyncio.Event()
+        cls._readings_free_slots = cls._readings_list_size * cls._max_concurrent_readings_inserts
+        cls._readings_slots_waiters = collections.deque()
+        cls._current_readings_list_index = 0
+        cls._lists_below_batch_size = []
+        cls._lists_below_batch_size_queued = [False] * cls._max_concurrent_readings_inserts
+        cls._lists_with_room = []
+        cls._lists_with_room_queued = [False] * cls._max_concurrent_readings_inserts
+
+        for list_index in range(1, cls._max_concurrent_readings_inserts):
+            cls._queue_readings_list(list_index)
 
         cls._stop = False
+
+        if cls._readings_spill_max_megabytes > 0:
+            spill_directory = os.path.expanduser(cls._readings_spill_directory)
+            if worker:
+                spill_directory = os.path.join(spill_directory, 'worker-{}'.format(worker))
+            cls._spill_buffer = SpillBuffer(spill_directory,
+                                            cls._readings_spill_max_megabytes * 1024 * 1024)
+            cls._spill_depth_reported = cls._spill_buffer.depth
+            cls._spill_not_empty = asyncio.Event()
+            cls._spill_taken = asyncio.Event()
+            cls._drain_spill_task = asyncio.ensure_future(cls._drain_spill())
+
         cls._started = True
 
     @classmethod
@@ -239,6 +505,28 @@ class Ingest(object):
 
         cls._stop = True
 
+        # add_readings raises RuntimeError when woken
+        cls._wake_slots_waiters(len(cls._readings_slots_waiters))
+
+        if cls._drain_spill_task is not None:
+            # Readings that have not been moved to memory stay on disk
+            # until the next start
+            cls._spill_not_empty.set()
+            # add_readings raises RuntimeError when woken
+            cls._spill_taken.set()
+
+            try:
+                await cls._drain_spill_task
+            except Exception:
+                _LOGGER.exception('An exception was raised by Ingest._drain_spill')
+            finally:
+                cls._drain_spill_task = None
+                cls._spill_not_empty = None
+
+        if cls._insert_permits is not None:
+            async with cls._insert_permits:
+                cls._insert_permits.notify_all()
+
         for task in cls._insert_readings_wait_tasks:
             if task is not None:
                 task.cancel()
@@ -254,9 +542,37 @@ class Ingest(object):
         cls._readings_lists = None
         cls._readings_list_batch_size_reached = None
         cls._readings_list_not_empty = None
-        cls._readings_lists_not_full = None
+        cls._readings_slots_waiters = None
+        cls._lists_below_batch_size = None
+        cls._lists_below_batch_size_queued = None
+        cls._lists_with_room = None
+        cls._lists_with_room_queued = None
+        cls._read_key_cache = None
+
+        if cls._check_connection_pool_sleep_task is not None:
+            cls._check_connection_pool_sleep_task.cancel()
+            cls._check_connection_pool_sleep_task = None
+
+        try:
+            await cls._check_connection_pool_task
+        except Exception:
+            _LOGGER.exception('An exception was raised by Ingest._check_connection_pool')
+        finally:
+            cls._check_connection_pool_task = None
+
+        await cls._close_connection_pool()
+        cls._connection_pool_lock = None
+
+        # Write statistics, including the final spill depth and the other
+        # workers' final statistics. The other workers are stopping too.
+        if cls._read_worker_statistics_tasks:
+            _, pending = await asyncio.wait(cls._read_worker_statistics_tasks,
+                                            timeout=cls._WORKER_STATISTICS_TIMEOUT_SECONDS)
+            for task in pending:
+                _LOGGER.warning('Gave up waiting for statistics from a device worker')
+                task.cancel()
+        cls._read_worker_statistics_tasks = None
 
-        # Write statistics
         if cls._write_statistics_sleep_task is not None:
             cls._write_statistics_sleep_task.cancel()
             cls._write_statistics_sleep_task = None
@@ -267,36 +583,219 @@ class Ingest(object):
         except Exception:
             _LOGGER.exception('An exception was raised by Ingest._write_statistics')
 
+        if cls._spill_buffer is not None:
+            cls._spill_buffer.close()
+            cls._spill_buffer = None
+
         cls._started = False
 
     @classmethod
-    def increment_discarded_readings(cls):
-        """Increments the number of discarded sensor readings"""
+    def increment_discarded_readings(cls, reason: str = None):
+        """Increments the number of discarded sensor readings
+
+        Args:
+            reason:
+                Why the readings were discarded, for example a schema rule. The
+                number of readings discarded for each reason is logged when
+                statistics are written.
+        """
         cls._discarded_readings_stats += 1
 
+        if reason is not None:
+            cls._discarded_reasons[reason] += 1
+
+    @classmethod
+    async def _get_connection_pool(cls) -> asyncpg.pool.Pool:
+        """Returns the pool of connections used to insert readings
+
+        Creates the pool upon the first call
+        """
+        if cls._connection_pool is not None:
+            return cls._connection_pool
+
+        # Only one task creates the pool
+        async with cls._connection_pool_lock:
+            if cls._connection_pool is None:
+                connection_args = {'user': 'foglamp', 'database': 'foglamp'}
+
+                try:
+                    snap_user_common = os.environ['SNAP_USER_COMMON']
+                    unix_socket_dir = "{}/tmp/".format(snap_user_common)
+                    connection_args['host'] = unix_socket_dir
+                except KeyError:
+                    pass
+
+                cls._connection_pool = await asyncpg.create_pool(
+                    min_size=min(cls._min_readings_insert_connections,
+                                 cls._max_concurrent_readings_inserts),
+                    max_size=cls._max_concurrent_readings_inserts,
+                    max_inactive_connection_lifetime=(
+                        cls._max_readings_insert_batch_connection_idle_seconds),
+                    init=cls._init_connection,
+                    **connection_args)
+
+        return cls._connection_pool
+
     @classmethod
-    async def _close_connection(cls, connection: asyncpg.connection.Connection):
-        if connection is not None:
+    async def _close_connection_pool(cls):
+        if cls._connection_pool is not None:
             try:
-                await connection.close()
+                await cls._connection_pool.close()
             except Exception:
-                _LOGGER.exception('Closing connection failed')
+                _LOGGER.exception('Closing connection pool failed')
+            finally:
+                cls._connection_pool = None
+
+    @classmethod
+    async def _init_connection(cls, connection: asyncpg.connection.Connection):
+        """Prepares a new connection in the pool for :meth:`_insert_readings`"""
+        cls._connections_opened_stats += 1
+
+        # Create a temp table for 'copy' command
+        await connection.execute('create temp table t_readings '
+                                 'as select asset_code, user_ts, read_key, reading '
+                                 'from foglamp.readings where 1=0')
+
+    @classmethod
+    async def _check_connection_pool(cls):
+        """Creates the connection pool and then periodically runs a query on
+        the pool's idle connections
+
+        Keeps the minimum number of connections open and replaces
+        connections that storage has closed before they are needed
+        to insert readings
+        """
+        _LOGGER.info('Connection pool checker started')
+
+        while not cls._stop:
+            if cls._connection_pool is None:
+                try:
+                    # Open the minimum number of connections before readings arrive
+                    await cls._get_connection_pool()
+                except Exception:
+                    cls._insert_failures_stats += 1
+                    _LOGGER.exception('Unable to create the connection pool')
+
+            # stop() calls _check_connection_pool_sleep_task.cancel()
+            cls._check_connection_pool_sleep_task = asyncio.ensure_future(
+                asyncio.sleep(cls._max_readings_insert_batch_connection_idle_seconds / 2))
+
+            try:
+                await cls._check_connection_pool_sleep_task
+            except asyncio.CancelledError:
+                pass
+            finally:
+                cls._check_connection_pool_sleep_task = None
+
+            if cls._stop or cls._connection_pool is None:
+                continue  # The pool is created at the top of the loop
+
+            pool = cls._connection_pool
+            connections = []
+
+            try:
+                # Acquire the connections at the same time so that each
+                # query runs on a different connection
+                for _ in range(min(cls._min_readings_insert_connections,
+                                   cls._max_concurrent_readings_inserts)):
+                    connections.append(await pool.acquire(
+                        timeout=cls._readings_insert_batch_timeout_seconds))
+
+                for connection in connections:
+                    await connection.fetchval('select 1')
+            except asyncio.TimeoutError:
+                pass  # The connections are busy inserting readings
+            except Exception:
+                cls._insert_failures_stats += 1
+                _LOGGER.exception('Connection pool check failed')
+            finally:
+                for connection in connections:
+                    try:
+                        await pool.release(connection)
+                    except Exception:
+                        _LOGGER.exception('Releasing a connection failed')
+
+        _LOGGER.info('Connection pool checker stopped')
+
+    @classmethod
+    async def _reconnect_wait(cls, list_index, attempt):
+        """Waits before reconnecting to storage
+
+        The wait time grows with the number of failed attempts and is random
+        so that insert tasks do not reconnect at the same time
+        """
+        wait_seconds = random.uniform(
+            1, min(cls._max_readings_insert_batch_reconnect_wait_seconds, 2 ** attempt))
+
+        waiter = asyncio.ensure_future(asyncio.sleep(wait_seconds))
+        cls._insert_readings_wait_tasks[list_index] = waiter
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        finally:
+            cls._insert_readings_wait_tasks[list_index] = None
+
+    @classmethod
+    async def _acquire_insert_permit(cls):
+        """Waits until fewer than :attr:`_batch_controller`.inserts inserts are in progress"""
+        async with cls._insert_permits:
+            await cls._insert_permits.wait_for(
+                lambda: cls._stop or cls._active_inserts < cls._batch_controller.inserts)
+            cls._active_inserts += 1
+
+    @classmethod
+    async def _release_insert_permit(cls):
+        async with cls._insert_permits:
+            cls._active_inserts -= 1
+            # The controller may allow more than one insert to start
+            cls._insert_permits.notify(cls._batch_controller.inserts - cls._active_inserts)
+
+    @classmethod
+    def _tune_inserts(cls, latency_seconds: float):
+        """Passes the latency of an insert to :attr:`_batch_controller` and applies
+        the new batch size"""
+        waiting_readings = (cls._readings_list_size * cls._max_concurrent_readings_inserts -
+                            cls._readings_free_slots)
+
+        cls._batch_controller.record(latency_seconds, waiting_readings)
+        cls._readings_insert_batch_size = cls._batch_controller.batch_size
+
+        # _LOGGER.debug('Insert latency: %s Batch size: %s Inserts: %s', latency_seconds,
+        #               cls._batch_controller.batch_size, cls._batch_controller.inserts)
+
+    @staticmethod
+    def _may_conflict(records: List[Tuple]) -> bool:
+        """Indicates whether inserting records can violate the unique read_key index
+
+        Returns:
+            True - At least one record has a key
+            False - Otherwise
+        """
+        for record in records:
+            if record[2] is not None:
+                return True
+        return False
 
     @classmethod
     async def _insert_readings(cls, list_index):
         """Inserts rows into the readings table
 
-        Uses "copy" to load rows into a temp table and then
+        Connections are acquired from a pool shared by all instances of this task.
+
+        When no row in a batch has a key, uses "copy" to load the rows
+        directly into the readings table.
+
+        Otherwise uses "copy" to load rows into a temp table and then
         inserts the temp table into the readings table because
         "copy" does not support "on conflict ignore"
         """
         _LOGGER.info('Insert readings loop started')
 
-        connection = None  # type: asyncpg.connection.Connection
         readings_list = cls._readings_lists[list_index]
         min_readings_reached = cls._readings_list_batch_size_reached[list_index]
         list_not_empty = cls._readings_list_not_empty[list_index]
-        lists_not_full = cls._readings_lists_not_full
 
         while True:
             # Wait for enough items in the list to fill a batch
@@ -339,24 +838,13 @@ class Ingest(object):
                 # _LOGGER.debug('Waiting for first item: Queue index: %s', list_index)
 
                 try:
-                    if connection is None:
-                        await waiter
-                    else:
-                        await asyncio.wait_for(
-                                waiter,
-                                cls._max_readings_insert_batch_connection_idle_seconds)
+                    await waiter
                 except asyncio.CancelledError:
                     # Don't assume the list is empty
 
                     # _LOGGER.debug('Cancelled: Queue index: %s Size: %s',
                     #               list_index, len(list))
                     continue
-                except asyncio.TimeoutError:
-                    # _LOGGER.debug('Closing idle connection: Queue index: %s',
-                    #               list_index)
-                    await cls._close_connection(connection)
-                    connection = None
-                    continue
                 finally:
                     cls._insert_readings_wait_tasks[list_index] = None
 
@@ -366,10 +854,9 @@ class Ingest(object):
                     time.time() - cls._last_insert_time) <
                     cls._readings_insert_batch_timeout_seconds):
                 continue
-                
-            # inserts = list[:batch_size]
-            # inserts = [(item[0], item[1], item[2],
-            #           json.dumps(item[3])) for item in list[:batch_size]]
+
+            if cls._batch_controller is not None:
+                await cls._acquire_insert_permit()
 
             attempt = 0
             cls._last_insert_time = time.time()
@@ -380,37 +867,50 @@ class Ingest(object):
                 #               len(list))
 
                 try:
-                    if connection is None:
-                        __CONNECTION = {'user': 'foglamp', 'database': 'foglamp'}
-
-                        try:
-                            snap_user_common = os.environ['SNAP_USER_COMMON']
-                            unix_socket_dir = "{}/tmp/".format(snap_user_common)
-                            __CONNECTION['host'] = unix_socket_dir
-                        except KeyError:
-                            pass
-                        connection = await asyncpg.connect(**__CONNECTION)
-                        # Create a temp table for 'copy' command
-                        await connection.execute('create temp table t_readings '
-                                                 'as select asset_code, user_ts, read_key, reading '
-                                                 'from foglamp.readings where 1=0')
-                    else:
-                        await connection.execute('truncate table t_readings')
-
-                    result1 = await connection.copy_records_to_table(table_name='t_readings',
-                                                                     records=readings_list)
-
-                    result2 = await connection.execute('insert into foglamp.readings '
-                                                       '(asset_code,user_ts,read_key,reading) '
-                                                       'select * from t_readings '
-                                                       'on conflict do nothing')
-
-                    # result1 looks like COPY 10
-                    batch_size = int(result1[5:])
-
-                    # result2 looks like INSERT 0 10
-                    insert_index = result2.index(' ', 7)+1
-                    insert_rows = int(result2[insert_index:])
+                    pool = await cls._get_connection_pool()
+
+                    async with pool.acquire() as connection:
+                        # Snapshot the list because add_readings can append to it
+                        # while "copy" is awaited
+                        if cls._batch_controller is None:
+                            records = readings_list[:]
+                        else:
+                            records = readings_list[:cls._readings_insert_batch_size]
+
+                        insert_start_time = time.monotonic()
+
+                        if not cls._may_conflict(records):
+                            # No row carries a read_key so no row can conflict.
+                            # "copy" straight into the readings table.
+                            result1 = await connection.copy_records_to_table(
+                                table_name='readings', schema_name='foglamp',
+                                columns=('asset_code', 'user_ts', 'read_key', 'reading'),
+                                records=records)
+
+                            # result1 looks like COPY 10
+                            batch_size = int(result1[5:])
+                            insert_rows = batch_size
+                        else:
+                            await connection.execute('truncate table t_readings')
+
+                            result1 = await connection.copy_records_to_table(
+                                table_name='t_readings', records=records)
+
+                            result2 = await connection.execute(
+                                'insert into foglamp.readings '
+                                '(asset_code,user_ts,read_key,reading) '
+                                'select * from t_readings '
+                                'on conflict do nothing')
+
+                            # result1 looks like COPY 10
+                            batch_size = int(result1[5:])
+
+                            # result2 looks like INSERT 0 10
+                            insert_index = result2.index(' ', 7)+1
+                            insert_rows = int(result2[insert_index:])
+
+                    if cls._batch_controller is not None:
+                        cls._tune_inserts(time.monotonic() - insert_start_time)
 
                     cls._readings_stats += insert_rows
 
@@ -423,6 +923,7 @@ class Ingest(object):
                     break
                 except Exception:  # TODO: Catch exception from asyncpg
                     attempt += 1
+                    cls._insert_failures_stats += 1
 
                     # TODO logging each time is overkill
                     _LOGGER.exception('Insert failed on attempt #%s, list index: %s',
@@ -435,33 +936,19 @@ class Ingest(object):
                         # _LOGGER.debug('Insert failed: Queue index: %s Batch size: %s',
                         #               list_index, batch_size)
                         break
-                    else:
-                        if connection is None:
-                            if not cls._stop:
-                                # Connection failure
-                                waiter = asyncio.ensure_future(asyncio.sleep(
-                                    randint(1,
-                                            cls._max_readings_insert_batch_reconnect_wait_seconds)))
-
-                                cls._insert_readings_wait_tasks[list_index] = waiter
-
-                                try:
-                                    await waiter
-                                except asyncio.TimeoutError:
-                                    pass
-                                finally:
-                                    cls._insert_readings_wait_tasks[list_index] = None
-                        else:
-                            await cls._close_connection(connection)
-                            connection = None
+                    elif not cls._stop:
+                        # The pool replaces broken connections. Give storage
+                        # some time to recover first.
+                        await cls._reconnect_wait(list_index, attempt)
 
-            del readings_list[:batch_size]
+            if cls._spill_buffer is not None:
+                cls._acknowledge_spilled(readings_list, batch_size)
 
-            if not lists_not_full.is_set():
-                lists_not_full.set()
+            cls._remove_readings(list_index, batch_size)
+            cls._update_insert_rate(batch_size)
 
-        # End of the method
-        await cls._close_connection(connection)
+            if cls._batch_controller is not None:
+                await cls._release_insert_permit()
 
         _LOGGER.info('Insert readings loop stopped')
 
@@ -470,6 +957,8 @@ class Ingest(object):
         """Periodically commits collected readings statistics"""
         _LOGGER.info('Device statistics writer started')
 
+        statistics_created = False
+
         while not cls._stop:
             # stop() calls _write_statistics_sleep_task.cancel().
             # Tracking _write_statistics_sleep_task separately is cleaner than canceling
@@ -485,50 +974,515 @@ class Ingest(object):
             finally:
                 cls._write_statistics_sleep_task = None
 
-            readings = cls._readings_stats
-            cls._readings_stats = 0
+            if cls._spill_buffer is not None:
+                # SPILLDEPTH is the number of spilled readings rather than a count
+                # of events. Write the change since the last time.
+                depth = cls._spill_buffer.depth
+                cls._spill_depth_stats += depth - cls._spill_depth_reported
+                cls._spill_depth_reported = depth
+
+            if cls._discarded_reasons:
+                _LOGGER.info('Discarded readings by reason: %s',
+                             ', '.join('{} ({})'.format(reason, count) for reason, count
+                                       in cls._discarded_reasons.most_common()))
+                cls._discarded_reasons.clear()
+
+            if cls._statistics_fd is not None:
+                cls._send_statistics()
+                continue
 
-            try:
-                await statistics.update_statistics_value('READINGS', readings)
-            except Exception:  # TODO catch real exception
-                cls._readings_stats += readings
-                _LOGGER.exception('An error occurred while writing readings statistics')
+            if not statistics_created:
+                try:
+                    for key, description in cls._STATISTICS_DESCRIPTIONS.items():
+                        await statistics.create_statistics(key, description)
+                    statistics_created = True
+                except Exception:  # TODO catch real exception
+                    _LOGGER.exception('An error occurred while creating statistics')
+
+            for key, attribute in cls._STATISTICS:
+                value = getattr(cls, attribute)
+                if not value:
+                    continue
 
-            readings = cls._discarded_readings_stats
-            cls._discarded_readings_stats = 0
-            try:
-                await statistics.update_statistics_value('DISCARDED', readings)
-            # TODO catch real exception
-            except Exception:  # TODO catch real exception
-                cls._discarded_readings_stats += readings
-                _LOGGER.exception('An error occurred while writing discarded statistics')
+                setattr(cls, attribute, 0)
+
+                try:
+                    await statistics.update_statistics_value(key, value)
+                except Exception:  # TODO catch real exception
+                    setattr(cls, attribute, getattr(cls, attribute) + value)
+                    _LOGGER.exception('An error occurred while writing %s statistics', key)
 
         _LOGGER.info('Device statistics writer stopped')
 
+    @classmethod
+    def _send_statistics(cls):
+        """Sends collected readings statistics to the first worker"""
+        values = {}
+
+        for key, attribute in cls._STATISTICS:
+            value = getattr(cls, attribute)
+            if value:
+                values[key] = value
+                setattr(cls, attribute, 0)
+
+        if not values:
+            return
+
+        try:
+            # One short line is written atomically
+            os.write(cls._statistics_fd, (json.dumps(values) + '\n').encode('utf-8'))
+        except OSError:
+            for key, attribute in cls._STATISTICS:
+                setattr(cls, attribute, getattr(cls, attribute) + values.get(key, 0))
+            _LOGGER.exception('An error occurred while sending statistics to the first worker')
+
+    @classmethod
+    async def _read_worker_statistics(cls, fd: int):
+        """Adds the statistics sent by another worker to this worker's statistics
+
+        Returns when the other worker exits
+        """
+        attributes = dict(cls._STATISTICS)
+        reader = asyncio.StreamReader()
+
+        transport, _ = await asyncio.get_event_loop().connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, 'rb', 0))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    for key, value in json.loads(line.decode('utf-8')).items():
+                        attribute = attributes[key]
+                        setattr(cls, attribute, getattr(cls, attribute) + value)
+                except (ValueError, KeyError, AttributeError, TypeError):
+                    _LOGGER.exception('Invalid statistics from a device worker: %s', line)
+        finally:
+            transport.close()
+
+    @classmethod
+    async def _drain_spill(cls):
+        """Moves spilled readings to the readings lists as slots become free"""
+        _LOGGER.info('Drain spilled readings loop started')
+
+        spill_buffer = cls._spill_buffer
+
+        while not cls._stop:
+            if not spill_buffer.depth:
+                cls._spill_not_empty.clear()
+                await cls._spill_not_empty.wait()
+                continue
+
+            if cls._readings_free_slots <= 0:
+                try:
+                    await cls._wait_for_free_slots()
+                except RuntimeError:
+                    break  # Stopping
+                continue
+
+            items = spill_buffer.read(min(cls._readings_free_slots,
+                                          cls._readings_insert_batch_size))
+            cls._append_readings(items)
+            cls._spill_taken.set()
+
+            # Let inserts begin
+            await asyncio.sleep(0)
+
+        _LOGGER.info('Drain spilled readings loop stopped')
+
+    @classmethod
+    def _acknowledge_spilled(cls, items: Sequence[Tuple], count: int) -> None:
+        """Lets the disk buffer delete the spilled readings among the first count
+        items of a readings list once they have been inserted or discarded"""
+        tokens = [item.token for item in items[:count] if isinstance(item, SpilledReading)]
+        if tokens:
+            cls._spill_buffer.acknowledge(tokens)
+            cls._spill_taken.set()
+
+    @classmethod
+    def _spill_readings(cls, items: Sequence[Tuple]) -> int:
+        """Appends validated readings to the disk buffer when memory is full
+
+        Once readings have been spilled, new readings are spilled behind them
+        until the disk buffer has been drained so that readings reach storage
+        in the order they were added.
+
+        Returns:
+            The number of items that were spilled
+        """
+        spill_buffer = cls._spill_buffer
+
+        if spill_buffer is None or (cls._readings_free_slots > 0 and not spill_buffer.depth):
+            return 0
+
+        try:
+            spilled = spill_buffer.append(items)
+        except OSError:
+            _LOGGER.exception('Unable to spill readings to disk')
+            return 0
+
+        if spilled:
+            cls._spill_not_empty.set()
+
+        return spilled
+
+    @classmethod
+    async def _wait_for_spill_taken(cls) -> None:
+        """Waits until readings are read from or acknowledged in the disk buffer
+
+        Readings that can not be spilled behind spilled readings wait here rather
+        than be added to memory ahead of them.
+
+        Raises:
+            RuntimeError:
+                The server is stopping
+        """
+        spill_taken = cls._spill_taken
+        spill_taken.clear()
+        await spill_taken.wait()
+
+        if cls._stop:
+            raise RuntimeError('The device server is stopping')
+
+    @classmethod
+    def _update_insert_rate(cls, count: int) -> None:
+        """Adds to the number of readings removed from the buffer and updates
+        :attr:`_insert_rate` once per second"""
+        cls._insert_rate_count += count
+
+        now = time.monotonic()
+        elapsed = now - cls._insert_rate_time
+
+        if elapsed < 1:
+            return
+
+        rate = cls._insert_rate_count / elapsed
+
+        if cls._insert_rate is None:
+            cls._insert_rate = rate
+        else:
+            cls._insert_rate += cls._INSERT_RATE_WEIGHT * (rate - cls._insert_rate)
+
+        cls._insert_rate_count = 0
+        cls._insert_rate_time = now
+
+    @classmethod
+    def get_credits(cls) -> Tuple[int, float]:
+        """Tells clients how many readings they may send and how fast
+
+        Returns:
+            (credits, backoff_seconds)
+
+            credits is the number of readings that can be added without waiting.
+            It is 0 when readings would be rejected or would wait for room.
+
+            backoff_seconds is how long a client should wait before it sends more
+            readings than it has credits for, or before it retries when credits is 0.
+            It is 0 while the buffer is less than half full. Otherwise it is the
+            time storage takes to insert the readings above the half way mark.
+        """
+        if cls._stop or not cls._started:
+            return 0, cls._MAX_BACKOFF_SECONDS
+
+        cls._update_insert_rate(0)
+
+        capacity = cls._readings_list_size * cls._max_concurrent_readings_inserts
+        credits = max(0, cls._readings_free_slots)
+        excess = capacity - credits - capacity // 2
+
+        if cls._spill_buffer is not None:
+            excess += cls._spill_buffer.depth
+            if not credits and cls._spill_buffer.has_room():
+                credits = cls._readings_insert_batch_size
+
+        if excess <= 0:
+            backoff = 0
+        elif cls._insert_rate is None:
+            # Nothing has been inserted yet
+            backoff = min(cls._MAX_BACKOFF_SECONDS, cls._readings_insert_batch_timeout_seconds)
+        elif cls._insert_rate > 0:
+            backoff = min(cls._MAX_BACKOFF_SECONDS, excess / cls._insert_rate)
+        else:
+            backoff = cls._MAX_BACKOFF_SECONDS
+
+        return credits, round(backoff, 3)
+
     @classmethod
     def is_available(cls) -> bool:
         """Indicates whether all lists are currently full
 
         Returns:
-            False - All of the lists are full
+            False - All of the lists and the disk buffer are full
             True - Otherwise
         """
         if cls._stop:
             return False
 
-        list_index = cls._current_readings_list_index
-        if len(cls._readings_lists[list_index]) < cls._readings_list_size:
+        if cls._readings_free_slots > 0:
             return True
 
-        if cls._max_concurrent_readings_inserts > 1:
-            for list_index in range(cls._max_concurrent_readings_inserts):
-                if len(cls._readings_lists[list_index]) < cls._readings_list_size:
-                    cls._current_readings_list_index = list_index
-                    return True
+        if cls._spill_buffer is not None and cls._spill_buffer.has_room():
+            return True
 
         _LOGGER.warning('The ingest service is unavailable')
         return False
 
+    @classmethod
+    def _queue_readings_list(cls, list_index: int) -> None:
+        """Adds a readings list to the heaps of lists that readings can be appended to
+
+        Does nothing for heaps that the list does not qualify for or is already in
+        """
+        list_size = len(cls._readings_lists[list_index])
+
+        if list_size < cls._readings_insert_batch_size:
+            if not cls._lists_below_batch_size_queued[list_index]:
+                heapq.heappush(cls._lists_below_batch_size, list_index)
+                cls._lists_below_batch_size_queued[list_index] = True
+
+        if list_size < cls._readings_list_size:
+            if not cls._lists_with_room_queued[list_index]:
+                heapq.heappush(cls._lists_with_room, list_index)
+                cls._lists_with_room_queued[list_index] = True
+
+    @classmethod
+    def _pop_readings_list(cls, heap: List[int], queued: List[bool], limit: int) -> Optional[int]:
+        """Removes the lowest index from a heap of readings lists, skipping stale entries
+
+        Returns:
+            The index of a list that has fewer than limit items, or None
+        """
+        while heap:
+            list_index = heapq.heappop(heap)
+            queued[list_index] = False
+            if len(cls._readings_lists[list_index]) < limit:
+                return list_index
+        return None
+
+    @classmethod
+    def _select_readings_list(cls) -> Optional[int]:
+        """Returns the index of the readings list to append to
+
+        Appends to the current list until it has a full batch. Then moves
+        to the list with the lowest index that does not have a full batch
+        to reduce the number of connections. When all lists have full batches,
+        appends to the current list until it is full and then moves to the
+        list with the lowest index that has room.
+
+        Must only be called when :attr:`_readings_free_slots` is not 0.
+
+        Returns:
+            None when no list has room. :attr:`_readings_free_slots` was wrong
+            and is recounted.
+        """
+        current_index = cls._current_readings_list_index
+        list_size = len(cls._readings_lists[current_index])
+
+        if list_size < cls._readings_insert_batch_size:
+            return current_index
+
+        list_index = cls._pop_readings_list(cls._lists_below_batch_size,
+                                            cls._lists_below_batch_size_queued,
+                                            cls._readings_insert_batch_size)
+
+        if list_index is None:
+            if list_size < cls._readings_list_size:
+                return current_index
+
+            list_index = cls._pop_readings_list(cls._lists_with_room,
+                                                cls._lists_with_room_queued,
+                                                cls._readings_list_size)
+            if list_index is None:
+                # Not reached while _readings_free_slots is right
+                cls._recount_free_slots()
+                return None
+
+        cls._queue_readings_list(current_index)
+        cls._current_readings_list_index = list_index
+        return list_index
+
+    @classmethod
+    def _recount_free_slots(cls) -> None:
+        """Sets :attr:`_readings_free_slots` from the sizes of the readings lists"""
+        free_slots = sum(cls._readings_list_size - len(readings_list)
+                         for readings_list in cls._readings_lists)
+
+        _LOGGER.error('Free readings slots were %s instead of %s',
+                      cls._readings_free_slots, free_slots)
+
+        cls._readings_free_slots = free_slots
+
+        for list_index in range(len(cls._readings_lists)):
+            if list_index != cls._current_readings_list_index:
+                cls._queue_readings_list(list_index)
+
+    @classmethod
+    def _remove_readings(cls, list_index: int, count: int) -> None:
+        """Removes inserted readings from the front of a readings list and
+        wakes up as many :meth:`add_readings` calls as there are freed slots
+        """
+        del cls._readings_lists[list_index][:count]
+
+        cls._readings_free_slots += count
+
+        if list_index != cls._current_readings_list_index:
+            cls._queue_readings_list(list_index)
+
+        cls._wake_slots_waiters(count)
+
+    @classmethod
+    def _wake_slots_waiters(cls, count: int) -> None:
+        """Wakes up to count calls that are waiting for free slots"""
+        waiters = cls._readings_slots_waiters
+
+        while count > 0 and waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                count -= 1
+
+    @classmethod
+    async def _wait_for_free_slots(cls) -> None:
+        """Waits until readings can be added to the readings lists
+
+        Raises:
+            RuntimeError:
+                The server is stopping
+        """
+        retry = False
+
+        while cls._readings_free_slots <= 0:
+            waiter = asyncio.get_event_loop().create_future()
+
+            if retry:
+                # Another call took the slot. Keep this call's place in line.
+                cls._readings_slots_waiters.appendleft(waiter)
+            else:
+                cls._readings_slots_waiters.append(waiter)
+
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Pass the wakeup on to the next waiter
+                    cls._wake_slots_waiters(1)
+                raise
+
+            if cls._stop:
+                raise RuntimeError('The device server is stopping')
+
+            retry = True
+
+    @classmethod
+    def _validate_readings(cls, asset: str, timestamp: Union[str, datetime.datetime],
+                           key: Union[str, uuid.UUID] = None, readings: dict = None) -> Tuple:
+        """Validates the inputs to :meth:`add_readings`
+
+        Returns:
+            A tuple (asset, timestamp, key, readings) ready to be appended to a
+            readings list. readings is JSON-encoded.
+
+        Raises:
+            ValueError, TypeError:
+                An invalid value was provided
+        """
+        if asset is None:
+            raise ValueError('asset can not be None')
+
+        if not isinstance(asset, str):
+            raise TypeError('asset must be a string')
+
+        if timestamp is None:
+            raise ValueError('timestamp can not be None')
+
+        if not isinstance(timestamp, datetime.datetime):
+            # validate
+            timestamp = iso8601.parse(timestamp)
+
+        if key is not None and not isinstance(key, uuid.UUID):
+            # Validate
+            if not isinstance(key, str):
+                raise TypeError('key must be a uuid.UUID or a string')
+            # If key is not a string, uuid.UUID throws an Exception that appears to
+            # be a TypeError but can not be caught as a TypeError
+            key = uuid.UUID(key)
+
+        if readings is None:
+            readings = dict()
+        elif not isinstance(readings, dict):
+            # Postgres allows values like 5 be converted to JSON
+            # Downstream processors can not handle this
+            raise TypeError('readings must be a dictionary')
+
+        return asset, timestamp, key, json.dumps(readings)
+
+    @classmethod
+    def _is_new_key(cls, key: Optional[uuid.UUID]) -> bool:
+        """Remembers a readings key
+
+        Returns:
+            False - The key was added recently
+            True - Otherwise, including when key is None
+        """
+        if key is None:
+            return True
+        return cls._read_key_cache.add(key)
+
+    @classmethod
+    def _forget_keys(cls, items: Sequence[Tuple]) -> None:
+        """Forgets the keys of readings that were not buffered so that they
+        are not discarded as duplicates when they are sent again"""
+        if cls._read_key_cache is None:
+            return  # Stopped
+        for item in items:
+            if item[2] is not None:
+                cls._read_key_cache.discard(item[2])
+
+    @classmethod
+    def _append_readings(cls, items: Sequence[Tuple]) -> int:
+        """Appends validated readings to the readings lists
+
+        See :meth:`_select_readings_list` for the order in which lists are filled.
+
+        Returns:
+            The number of items that were appended. This is less than len(items)
+            when all of the lists are full.
+        """
+        total = len(items)
+        appended = 0
+
+        while appended < total and cls._readings_free_slots > 0:
+            list_index = cls._select_readings_list()
+            if list_index is None:
+                continue  # The free slots were recounted
+
+            readings_list = cls._readings_lists[list_index]
+            list_size = len(readings_list)
+
+            if list_size < cls._readings_insert_batch_size:
+                room = cls._readings_insert_batch_size - list_size
+            else:
+                room = cls._readings_list_size - list_size
+
+            readings_list.extend(items[appended:appended + room])
+            count = len(readings_list) - list_size
+            appended += count
+            cls._readings_free_slots -= count
+
+            # _LOGGER.debug('Add readings list index: %s size: %s', list_index,
+            #               len(readings_list))
+
+            if not list_size:
+                cls._readings_list_not_empty[list_index].set()
+
+            if list_size < cls._readings_insert_batch_size <= len(readings_list):
+                cls._readings_list_batch_size_reached[list_index].set()
+
+        return appended
+
     @classmethod
     async def add_readings(cls, asset: str, timestamp: Union[str, datetime.datetime],
                            key: Union[str, uuid.UUID] = None, readings: dict = None)->None:
@@ -544,7 +1498,8 @@ class Ingest(object):
 
         Raises:
             If this method raises an Exception, the discarded readings counter is
-            also incremented.
+            also incremented. The key is not remembered, so the readings can be
+            added again.
 
             RuntimeError:
                 The server is stopping or has been stopped
@@ -560,71 +1515,104 @@ class Ingest(object):
             # cls._logger = logger.setup(__name__, destination=logger.CONSOLE, level=logging.DEBUG)
 
         try:
-            if asset is None:
-                raise ValueError('asset can not be None')
-
-            if not isinstance(asset, str):
-                raise TypeError('asset must be a string')
-
-            if timestamp is None:
-                raise ValueError('timestamp can not be None')
-
-            if not isinstance(timestamp, datetime.datetime):
-                # validate
-                timestamp = dateutil.parser.parse(timestamp)
-
-            if key is not None and not isinstance(key, uuid.UUID):
-                # Validate
-                if not isinstance(key, str):
-                    raise TypeError('key must be a uuid.UUID or a string')
-                # If key is not a string, uuid.UUID throws an Exception that appears to
-                # be a TypeError but can not be caught as a TypeError
-                key = uuid.UUID(key)
-
-            if readings is None:
-                readings = dict()
-            elif not isinstance(readings, dict):
-                # Postgres allows values like 5 be converted to JSON
-                # Downstream processors can not handle this
-                raise TypeError('readings must be a dictionary')
+            item = cls._validate_readings(asset, timestamp, key, readings)
         except Exception:
             cls.increment_discarded_readings()
             raise
 
+        if not cls._is_new_key(item[2]):
+            # Already added recently. Storage would discard it anyway.
+            cls.increment_discarded_readings()
+            return
+
         # Comment out to test IntegrityError
         # key = '123e4567-e89b-12d3-a456-426655440000'
 
-        # Wait for an empty slot in the list
-        while not cls.is_available():
-            cls._readings_lists_not_full.clear()
-            await cls._readings_lists_not_full.wait()
-            if cls._stop:
-                raise RuntimeError('The device server is stopping')
+        try:
+            while not cls._spill_readings((item,)):
+                if cls._spill_buffer is not None and cls._spill_buffer.depth:
+                    # The disk buffer is full. Stay behind the spilled readings.
+                    await cls._wait_for_spill_taken()
+                elif cls._append_readings((item,)):
+                    break
+                else:
+                    # Wait for an empty slot in the list
+                    await cls._wait_for_free_slots()
+        except BaseException:
+            # Includes asyncio.CancelledError
+            cls._forget_keys((item,))
+            raise
 
-        list_index = cls._current_readings_list_index
-        readings_list = cls._readings_lists[list_index]
+    @classmethod
+    async def add_readings_many(cls, items: Sequence[Tuple])->List[Optional[Exception]]:
+        """Adds many asset readings records to FogLAMP
+
+        Equivalent to calling :meth:`add_readings` for each item, except that all
+        items are validated in one pass and buffer space is reserved for as many
+        items as possible at once.
+
+        Args:
+            items:
+                A sequence of (asset, timestamp, key, readings) tuples. See
+                :meth:`add_readings`. key and readings may be None.
+
+        Returns:
+            A list with one entry per item: None when the item was accepted, otherwise
+            the ValueError or TypeError that rejected it. Rejected items and items
+            whose key was added recently are counted as discarded readings.
+
+        Raises:
+            RuntimeError:
+                The server is stopping or has been stopped
+        """
+        if cls._stop:
+            raise RuntimeError('The device server is stopping')
+
+        if not cls._started:
+            raise RuntimeError('The device server was not started')
 
-        readings = json.dumps(readings)
-        readings_list.append((asset, timestamp, key, readings))
+        results = [None] * len(items)  # type: List[Optional[Exception]]
+        validated = []
 
-        list_size = len(readings_list)
+        for index, item in enumerate(items):
+            try:
+                item = cls._validate_readings(*item)
+            except Exception as e:
+                cls.increment_discarded_readings()
+                results[index] = e
+                continue
 
-        # _LOGGER.debug('Add readings list index: %s size: %s', cls._current_readings_list_index,
-        #               list_size)
+            if cls._is_new_key(item[2]):
+                validated.append(item)
+            else:
+                cls.increment_discarded_readings()
 
-        if list_size == 1:
-            cls._readings_list_not_empty[list_index].set()
+        try:
+            while validated:
+                if cls._spill_buffer is not None:
+                    # Fill memory first. The rest go to disk.
+                    if not cls._spill_buffer.depth:
+                        del validated[:cls._append_readings(validated)]
+                    del validated[:cls._spill_readings(validated)]
+
+                    if not validated:
+                        break
 
-        if list_size == cls._readings_insert_batch_size:
-            cls._readings_list_batch_size_reached[list_index].set()
-            # _LOGGER.debug('Set event list index: %s size: %s',
-            #               cls._current_readings_list_index, len(list))
+                    if cls._spill_buffer.depth:
+                        # The disk buffer is full. Stay behind the spilled readings.
+                        await cls._wait_for_spill_taken()
+                        continue
 
-        # When the current list is full, move on to the next list
-        if cls._max_concurrent_readings_inserts > 1 and (
-                    list_size >= cls._readings_insert_batch_size):
-            # Start at the beginning to reduce the number of connections
-            for list_index in range(cls._max_concurrent_readings_inserts):
-                if len(cls._readings_lists[list_index]) < cls._readings_insert_batch_size:
-                    cls._current_readings_list_index = list_index
-                    break
+                # Wait for empty slots in the lists
+                if cls._readings_free_slots <= 0:
+                    await cls._wait_for_free_slots()
+                    continue
+
+                appended = cls._append_readings(validated)
+                del validated[:appended]
+        except BaseException:
+            # Includes asyncio.CancelledError. The items that are left were not buffered.
+            cls._forget_keys(validated)
+            raise
+
+        return results
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Fast parsing of sensor readings timestamps
+
+Devices and fogbench send timestamps in a handful of ISO 8601 shapes such as
+``2017-01-02T01:02:03.23232Z-05:00`` and ``2017-08-04 06:59:57.503123+00:00``.
+:func:`parse` handles these shapes directly and passes anything else to
+dateutil, which accepts many more formats but is much slower.
+"""
+
+import datetime
+import re
+from typing import Dict
+
+import dateutil.parser
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_ISO8601 = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)'
+                      r'(?:\.(\d{1,6}))?'
+                      r'(Z|Z?[+-]\d\d(?::?\d\d)?)?$')
+"""Date, time, optional fraction of a second of up to 6 digits and optional UTC offset"""
+
+_FRACTION_SCALE = (0, 100000, 10000, 1000, 100, 10, 1)
+"""Multiplier that converts a fraction of a second with n digits to microseconds"""
+
+_timezones = {None: None, 'Z': datetime.timezone.utc}  # type: Dict
+"""tzinfo for each UTC offset suffix seen so far"""
+
+
+def _timezone(suffix: str) -> datetime.tzinfo:
+    """Returns the tzinfo for a UTC offset suffix such as +05:30, -0800, +01 or Z-05:00"""
+    try:
+        return _timezones[suffix]
+    except KeyError:
+        pass
+
+    if suffix[0] == 'Z':
+        # dateutil reads Z-05:00 as a POSIX style offset, which is +05:00.
+        # Let dateutil interpret it once.
+        tz = dateutil.parser.parse('2000-01-01T00:00:00' + suffix).tzinfo
+        _timezones[suffix] = tz
+        return tz
+
+    digits = suffix[1:].replace(':', '')
+    minutes = int(digits[:2]) * 60
+    if len(digits) > 2:
+        minutes += int(digits[2:])
+    if suffix[0] == '-':
+        minutes = -minutes
+
+    tz = datetime.timezone(datetime.timedelta(minutes=minutes))
+    _timezones[suffix] = tz
+    return tz
+
+
+def parse(timestamp: str) -> datetime.datetime:
+    """Converts a timestamp string to a datetime
+
+    Args:
+        timestamp: An ISO 8601 timestamp or any other format that dateutil accepts
+
+    Returns:
+        The same value that dateutil.parser.parse returns. The datetime is naive
+        when timestamp does not have a UTC offset.
+
+    Raises:
+        ValueError, TypeError, OverflowError:
+            timestamp is not a valid timestamp. See dateutil.parser.parse.
+    """
+    match = _ISO8601.match(timestamp) if isinstance(timestamp, str) else None
+
+    if match is not None:
+        year, month, day, hour, minute, second, fraction, suffix = match.groups()
+
+        if fraction is None:
+            microsecond = 0
+        else:
+            microsecond = int(fraction) * _FRACTION_SCALE[len(fraction)]
+
+        try:
+            return datetime.datetime(int(year), int(month), int(day), int(hour), int(minute),
+                                     int(second), microsecond, _timezone(suffix))
+        except ValueError:
+            # For example, February 30 or an offset of 24 hours. Let dateutil
+            # decide and report the error.
+            pass
+
+    return dateutil.parser.parse(timestamp)
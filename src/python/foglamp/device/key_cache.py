@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Recently seen readings keys"""
+
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+class KeyCache(object):
+    """Remembers keys for a limited amount of time
+
+    Used to detect readings that are sent more than once before they take
+    space in the readings buffer.
+
+    Keys are forgotten after they have been remembered for ``ttl_seconds``
+    or, when more than ``max_size`` keys are remembered, oldest first.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        """
+        Args:
+            max_size: The maximum number of keys to remember. 0 disables the cache.
+            ttl_seconds: The number of seconds to remember each key
+        """
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._keys = OrderedDict()  # type: OrderedDict
+        """Maps each key to the time it expires. Ordered by expiration time."""
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: Hashable) -> bool:
+        """Remembers a key
+
+        Args:
+            key: The key to remember
+
+        Returns:
+            True - The key was not already remembered
+            False - The key was already remembered. Its expiration time is not
+            extended.
+        """
+        if self._max_size <= 0:
+            return True
+
+        now = time.monotonic()
+        keys = self._keys
+
+        # Forget expired keys
+        while keys:
+            oldest_key, expires = next(iter(keys.items()))
+            if expires > now:
+                break
+            del keys[oldest_key]
+
+        if key in keys:
+            return False
+
+        keys[key] = now + self._ttl_seconds
+
+        if len(keys) > self._max_size:
+            keys.popitem(last=False)
+
+        return True
+
+    def discard(self, key: Hashable) -> None:
+        """Forgets a key if it is remembered
+
+        Used when the reading the key was added for could not be buffered,
+        so that the reading can be sent again.
+        """
+        self._keys.pop(key, None)
+
+    def clear(self) -> None:
+        """Forgets all keys"""
+        self._keys.clear()
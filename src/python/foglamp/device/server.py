@@ -7,7 +7,9 @@
 """FogLAMP device server"""
 
 import asyncio
+import os
 import signal
+from typing import List
 
 from foglamp import configuration_manager
 from foglamp import logger
@@ -34,11 +36,51 @@ class Server:
     _plugin = None
     """The plugin's module'"""
 
+    _plugin_module_name = None  # type: str
+    """Python module name of the plugin, from the category's 'plugin' item"""
+
+    _DEFAULT_PLUGIN_MODULE = 'foglamp.device.coap_device'
+    """The plugin module when the category has no 'plugin' item"""
+
     _plugin_data = None
     """The value that is returned by the plugin_init"""
 
+    _DEFAULT_CONFIG = {
+        'workers': {
+            'description': 'The number of device service processes. Each process runs the '
+                           'plugin and buffers readings. Processes share the plugin\'s '
+                           'listening port. One process is started when the plugin can '
+                           'not share its port.',
+            'type': 'integer',
+            'default': '1'
+        }
+    }
+    """Configuration items for every plugin"""
+
+    _worker = 0
+    """Index of this process. 0 for the process that was started."""
+
+    _worker_pids = None  # type: List[int]
+    """Process ids of the other workers, in the first worker"""
+
+    _worker_statistics_fds = None  # type: List[int]
+    """Read ends of the statistics pipes from the other workers, in the first worker"""
+
+    _statistics_fd = None  # type: int
+    """Write end of the statistics pipe to the first worker, in the other workers"""
+
+    _worker_exits = None  # type: List[asyncio.Future]
+    """Futures that complete when each of the other workers exits, in the first worker"""
+
+    _stopping = False
+    """True when :meth:`_stop` has been called"""
+
     @classmethod
     async def _stop(cls, loop):
+        if cls._stopping:
+            return
+        cls._stopping = True
+
         if cls._plugin is not None:
             try:
                 cls._plugin.plugin_shutdown(cls._plugin_data)
@@ -48,12 +90,24 @@ class Server:
                 cls._plugin = None
                 cls._plugin_data = None
 
+        # The other workers send their final statistics while Ingest stops
+        for pid in cls._worker_pids or ():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
         try:
             await Ingest.stop()
         except Exception:
             _LOGGER.exception('Unable to stop the Ingest server')
             return
 
+        if cls._worker_exits:
+            await asyncio.wait(cls._worker_exits)
+        cls._worker_exits = None
+        cls._worker_pids = None
+
         # Stop all pending asyncio tasks
         for task in asyncio.Task.all_tasks():
             task.cancel()
@@ -73,16 +127,10 @@ class Server:
             # This needs to be increased
             category = plugin
 
-            config = {}
-
-            await configuration_manager.create_category(category, config,
+            await configuration_manager.create_category(category, {},
                                                         '{} Device'.format(plugin), True)
 
-            try:
-                plugin_module = config['plugin']
-            except KeyError:
-                # TODO: Delete me
-                plugin_module = 'foglamp.device.coap_device'
+            plugin_module = await cls._read_plugin_module_name(plugin)
 
             try:
                 cls._plugin = __import__(plugin_module, fromlist=[''])
@@ -91,7 +139,8 @@ class Server:
                                                                                plugin)
                 raise
 
-            default_config = cls._plugin.plugin_info()['config']
+            default_config = dict(cls._DEFAULT_CONFIG)
+            default_config.update(cls._plugin.plugin_info()['config'])
 
             await configuration_manager.create_category(category, default_config,
                                                         '{} Device'.format(plugin))
@@ -103,7 +152,12 @@ class Server:
             cls._plugin_data = cls._plugin.plugin_init(config)
             cls._plugin.plugin_run(cls._plugin_data)
 
-            await Ingest.start()
+            # A plugin that listens in a task tells when it is listening.
+            # For example, the port can not be shared with the other workers.
+            if isinstance(cls._plugin_data, dict) and 'started' in cls._plugin_data:
+                await cls._plugin_data['started']
+
+            await Ingest.start(cls._worker, cls._statistics_fd, cls._worker_statistics_fds or ())
         except Exception:
             if error is None:
                 error = 'Failed to initialize plugin {}'.format(plugin)
@@ -111,6 +165,98 @@ class Server:
             print(error)
             asyncio.ensure_future(cls._stop(loop))
 
+    @classmethod
+    def _watch_workers(cls, loop) -> None:
+        """Stops the device service when one of the other workers exits
+
+        A worker that exits was not able to start or has failed. Its readings
+        would not be received, so the service stops rather than run without it.
+        """
+        cls._worker_exits = []
+
+        for worker, pid in enumerate(cls._worker_pids or (), 1):
+            def exited(future, worker=worker):
+                if cls._stopping:
+                    return
+                try:
+                    status = future.result()[1]
+                except OSError:
+                    status = None
+                _LOGGER.error('Device worker %s exited with status %s. Stopping.', worker, status)
+                asyncio.ensure_future(cls._stop(loop))
+
+            exit_future = loop.run_in_executor(None, os.waitpid, pid, 0)
+            exit_future.add_done_callback(exited)
+            cls._worker_exits.append(exit_future)
+
+    @classmethod
+    async def _read_plugin_module_name(cls, plugin: str) -> str:
+        """Returns the Python module name of the plugin
+
+        The name is read once so that the workers and the plugin that is started agree.
+        """
+        if cls._plugin_module_name is None:
+            cls._plugin_module_name = (
+                await configuration_manager.get_category_item_value_entry(plugin, 'plugin')
+                or cls._DEFAULT_PLUGIN_MODULE)
+        return cls._plugin_module_name
+
+    @classmethod
+    async def _read_workers(cls, plugin: str) -> int:
+        """Returns the number of workers to start
+
+        Also creates the DEVICE category so that workers do not race to create it
+        """
+        await configuration_manager.create_category(plugin, cls._DEFAULT_CONFIG,
+                                                    '{} Device'.format(plugin), True)
+        workers = max(1, int(await configuration_manager.get_category_item_value_entry(
+            plugin, 'workers')))
+
+        plugin_module_name = await cls._read_plugin_module_name(plugin)
+
+        # pylint: disable=protected-access
+        await Ingest._read_config()
+
+        if workers > 1:
+            plugin_module = __import__(plugin_module_name, fromlist=[''])
+
+            if not plugin_module.plugin_info().get('shared_port', False):
+                _LOGGER.warning('Device plugin %s can not share its port among %s workers. '
+                                'Starting one worker.', plugin, workers)
+                workers = 1
+
+        return workers
+
+    @classmethod
+    def _fork_workers(cls, workers: int) -> None:
+        """Forks the other workers
+
+        Sets :attr:`_worker` in each process. Must be called before the event loop
+        is created because a forked process can not share it.
+        """
+        cls._worker_pids = []
+        cls._worker_statistics_fds = []
+
+        for worker in range(1, workers):
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+
+            if pid == 0:
+                os.close(read_fd)
+                for fd in cls._worker_statistics_fds:
+                    os.close(fd)
+                cls._worker = worker
+                cls._worker_pids = None
+                cls._worker_statistics_fds = None
+                cls._statistics_fd = write_fd
+                return
+
+            os.close(write_fd)
+            cls._worker_pids.append(pid)
+            cls._worker_statistics_fds.append(read_fd)
+
+        _LOGGER.info('Started %s device workers', workers)
+
     @classmethod
     def start(cls, plugin, core_mgt_host, core_mgt_port):
         """Starts the device server
@@ -118,7 +264,21 @@ class Server:
         Args:
             plugin: Specifies which device plugin to start
         """
-        loop = asyncio.get_event_loop()
+        config_loop = asyncio.new_event_loop()
+
+        try:
+            workers = config_loop.run_until_complete(cls._read_workers(plugin))
+        except Exception:
+            _LOGGER.exception('Unable to read the number of workers. Starting one worker.')
+            workers = 1
+        finally:
+            config_loop.close()
+
+        if workers > 1:
+            cls._fork_workers(workers)
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
 
         # Register signal handlers
         # Registering SIGTERM causes an error at shutdown. See
@@ -128,6 +288,9 @@ class Server:
                 signal_name,
                 lambda: asyncio.ensure_future(cls._stop(loop)))
 
+        if cls._worker_pids:
+            cls._watch_workers(loop)
+
         asyncio.ensure_future(cls._start(plugin, core_mgt_host, core_mgt_port, loop))
         loop.run_forever()
 
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Disk buffer for readings that do not fit in memory"""
+
+import collections
+import json
+import logging
+import os
+import uuid
+from typing import Iterable, List, Sequence, Tuple
+
+from foglamp import logger
+from foglamp.device import iso8601
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_LOGGER = logger.setup(__name__)  # type: logging.Logger
+
+
+class SpilledReading(tuple):
+    """An (asset, timestamp, key, readings) tuple returned by :meth:`SpillBuffer.read`
+
+    :attr:`token` is passed to :meth:`SpillBuffer.acknowledge` once the reading
+    has been inserted into storage.
+    """
+    token = None  # type: int
+
+
+class SpillBuffer(object):
+    """A first-in first-out queue of readings stored in append-only files
+
+    Readings are appended to the newest segment file in a directory. When a
+    segment reaches ``segment_bytes``, a new segment is started. Readings are
+    read from the oldest segment.
+
+    Reading a reading does not remove it. The caller acknowledges each reading
+    once it has been inserted into storage. The position after the oldest
+    reading that has not been acknowledged is written to a checkpoint file, and
+    a segment is deleted once all of its readings have been acknowledged.
+
+    Segments that are left over from a previous run are read from the
+    checkpoint. Only readings that were inserted but not yet acknowledged when
+    the process stopped are read again. After a graceful stop there are none.
+
+    Each reading is one line of JSON: [asset, timestamp, key, readings]
+    where readings is the JSON-encoded readings dictionary.
+    """
+
+    _SEGMENT_PREFIX = 'readings-'
+    _SEGMENT_SUFFIX = '.spill'
+    _CHECKPOINT = 'checkpoint'
+
+    def __init__(self, directory: str, max_bytes: int, segment_bytes: int = 4*1024*1024):
+        """
+        Args:
+            directory: Where to store segment files. Created when missing.
+            max_bytes: The maximum size of all segment files
+            segment_bytes: The size at which a new segment is started
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+
+        self._segments = collections.deque()  # type: collections.deque
+        """Sequence numbers of the segment files, oldest first"""
+
+        self._unread_segments = collections.deque()  # type: collections.deque
+        """Sequence numbers of the segments that have not been read to the end, oldest first"""
+
+        self._last_sequence = 0
+        """The sequence number of the newest segment that was ever started"""
+
+        self._bytes = 0
+        """Total size of the segment files"""
+
+        self._depth = 0
+        """Number of readings that have not been read"""
+
+        self._next_token = 0
+        """Token of the next line read"""
+
+        self._unacknowledged = collections.deque()  # type: collections.deque
+        """(token, sequence, offset after the line) of each line read and not yet
+        committed to the checkpoint, in the order they were read"""
+
+        self._acknowledged = set()
+        """Tokens in :attr:`_unacknowledged` that have been acknowledged"""
+
+        self._write_file = None
+        self._write_bytes = 0
+        self._read_file = None
+
+        os.makedirs(directory, exist_ok=True)
+
+        checkpoint_sequence, checkpoint_offset = self._read_checkpoint()
+        self._last_sequence = checkpoint_sequence
+
+        sequences = []
+        for file_name in os.listdir(directory):
+            if (file_name.startswith(self._SEGMENT_PREFIX) and
+                    file_name.endswith(self._SEGMENT_SUFFIX)):
+                try:
+                    sequences.append(int(file_name[len(self._SEGMENT_PREFIX):
+                                                   -len(self._SEGMENT_SUFFIX)]))
+                except ValueError:
+                    pass
+
+        for sequence in sorted(sequences):
+            path = self._path(sequence)
+
+            if sequence < checkpoint_sequence:
+                # Every reading was committed before the segment could be deleted
+                self._remove_file(path)
+                continue
+
+            self._segments.append(sequence)
+            self._unread_segments.append(sequence)
+            self._last_sequence = max(self._last_sequence, sequence)
+            self._bytes += os.path.getsize(path)
+            with open(path, 'rb') as segment:
+                if sequence == checkpoint_sequence:
+                    segment.seek(checkpoint_offset)
+                for line in segment:
+                    if line.endswith(b'\n'):
+                        self._depth += 1
+
+        if self._unread_segments and self._unread_segments[0] == checkpoint_sequence:
+            self._read_file = open(self._path(checkpoint_sequence), 'rb')
+            self._read_file.seek(checkpoint_offset)
+
+        if self._depth:
+            _LOGGER.warning('Found %s spilled readings in %s', self._depth, directory)
+        else:
+            # Delete the segments that were read and acknowledged before
+            self.read(0)
+
+    @property
+    def depth(self) -> int:
+        """The number of readings that have not been read"""
+        return self._depth
+
+    def has_room(self) -> bool:
+        """Whether at least one more reading can be appended"""
+        return self._bytes < self._max_bytes
+
+    def _path(self, sequence: int) -> str:
+        return os.path.join(self._directory, '{}{:010d}{}'.format(
+            self._SEGMENT_PREFIX, sequence, self._SEGMENT_SUFFIX))
+
+    def _read_checkpoint(self) -> Tuple[int, int]:
+        """Returns the (sequence, offset) to start reading at"""
+        try:
+            with open(os.path.join(self._directory, self._CHECKPOINT)) as checkpoint:
+                sequence, offset = json.load(checkpoint)
+            return int(sequence), int(offset)
+        except FileNotFoundError:
+            return 0, 0
+        except (OSError, ValueError, TypeError):
+            _LOGGER.exception('Ignoring the spill checkpoint in %s', self._directory)
+            return 0, 0
+
+    def _write_checkpoint(self, sequence: int, offset: int) -> None:
+        path = os.path.join(self._directory, self._CHECKPOINT)
+        try:
+            # Replace the checkpoint atomically
+            with open(path + '.tmp', 'w') as checkpoint:
+                json.dump([sequence, offset], checkpoint)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            _LOGGER.exception('Unable to write %s', path)
+
+    def _start_segment(self) -> None:
+        if self._write_file is not None:
+            self._write_file.close()
+
+        self._last_sequence += 1
+        sequence = self._last_sequence
+        self._segments.append(sequence)
+        self._unread_segments.append(sequence)
+        self._write_file = open(self._path(sequence), 'ab')
+        self._write_bytes = 0
+
+    def append(self, items: Sequence[Tuple]) -> int:
+        """Appends readings
+
+        Args:
+            items:
+                (asset, timestamp, key, readings) tuples as produced by
+                Ingest._validate_readings
+
+        Returns:
+            The number of items that were appended. This is less than len(items)
+            when the buffer is full.
+        """
+        appended = 0
+
+        for asset, timestamp, key, readings in items:
+            line = json.dumps([asset, timestamp.isoformat(),
+                               None if key is None else str(key), readings])
+            line = (line + '\n').encode('utf-8')
+
+            if self._bytes + len(line) > self._max_bytes:
+                break
+
+            if self._write_file is None or self._write_bytes >= self._segment_bytes:
+                self._start_segment()
+
+            self._write_file.write(line)
+            self._write_bytes += len(line)
+            self._bytes += len(line)
+            appended += 1
+
+        if appended:
+            # Make the readings visible to read()
+            self._write_file.flush()
+            self._depth += appended
+
+        return appended
+
+    def read(self, count: int) -> List[SpilledReading]:
+        """Returns up to count readings from the front of the buffer
+
+        The readings stay on disk until they are acknowledged. See :meth:`acknowledge`.
+
+        Returns:
+            (asset, timestamp, key, readings) tuples ready to be appended to a
+            readings list
+        """
+        items = []
+        undecodable = False
+
+        # Once every reading has been read, go on to the end of the segment so that
+        # it can be deleted when its readings are acknowledged
+        while self._unread_segments and (len(items) < count or not self._depth):
+            sequence = self._unread_segments[0]
+
+            if self._read_file is None:
+                self._read_file = open(self._path(sequence), 'rb')
+
+            line = self._read_file.readline()
+
+            if line.endswith(b'\n'):
+                token = self._next_token
+                self._next_token += 1
+                self._unacknowledged.append((token, sequence, self._read_file.tell()))
+                self._depth -= 1
+
+                try:
+                    asset, timestamp, key, readings = json.loads(line.decode('utf-8'))
+                    item = SpilledReading((asset, iso8601.parse(timestamp),
+                                           None if key is None else uuid.UUID(key), readings))
+                except Exception:
+                    _LOGGER.exception('Discarding a spilled reading that can not be decoded')
+                    self._acknowledged.add(token)
+                    undecodable = True
+                    continue
+
+                item.token = token
+                items.append(item)
+                continue
+
+            # End of the segment. Older segments are complete. A partial line
+            # at the end of an older segment was cut short when the process
+            # stopped and is not counted in depth.
+            if len(self._unread_segments) > 1 or not (line or self._depth):
+                self._finish_read_segment()
+                continue
+
+            # The newest segment is still being written
+            if line:
+                self._read_file.seek(-len(line), os.SEEK_CUR)
+            break
+
+        if undecodable:
+            self._commit()
+
+        return items
+
+    def acknowledge(self, tokens: Iterable[int]) -> None:
+        """Indicates that readings returned by :meth:`read` have been inserted into storage
+
+        Args:
+            tokens: The :attr:`SpilledReading.token` of each reading, in any order
+        """
+        self._acknowledged.update(tokens)
+        self._commit()
+
+    def _commit(self) -> None:
+        """Moves the checkpoint past the acknowledged readings at the front and
+        deletes the segments that have been committed"""
+        unacknowledged = self._unacknowledged
+        acknowledged = self._acknowledged
+        position = None
+
+        while unacknowledged and unacknowledged[0][0] in acknowledged:
+            token, sequence, offset = unacknowledged.popleft()
+            acknowledged.discard(token)
+            position = sequence, offset
+
+        if position is not None:
+            self._write_checkpoint(*position)
+            self._remove_committed_segments()
+
+    def _finish_read_segment(self) -> None:
+        self._unread_segments.popleft()
+
+        self._read_file.close()
+        self._read_file = None
+
+        if not self._unread_segments and self._write_file is not None:
+            # Start a new segment for the next append so that this one can be deleted
+            self._write_file.close()
+            self._write_file = None
+
+        self._remove_committed_segments()
+
+    def _remove_committed_segments(self) -> None:
+        """Deletes the segments that have been read to the end and whose readings
+        have all been acknowledged"""
+        while self._segments:
+            sequence = self._segments[0]
+
+            if self._unread_segments and self._unread_segments[0] == sequence:
+                break  # Not read to the end
+
+            if self._unacknowledged and self._unacknowledged[0][1] == sequence:
+                break  # Not acknowledged
+
+            self._segments.popleft()
+            path = self._path(sequence)
+            try:
+                self._bytes -= os.path.getsize(path)
+            except OSError:
+                _LOGGER.exception('Unable to remove %s', path)
+                continue
+            self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            _LOGGER.exception('Unable to remove %s', path)
+
+    def close(self) -> None:
+        """Closes open segment files. Readings that have not been acknowledged are kept."""
+        for spill_file in (self._read_file, self._write_file):
+            if spill_file is not None:
+                spill_file.close()
+        self._read_file = None
+        self._write_file = None
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Validation of sensor readings payloads against JSON schemas
+
+Device plugins validate payloads before they are passed to Ingest so that
+invalid readings do not take buffer space. Schemas are compiled once into
+functions when a plugin starts.
+
+The compiler supports the subset of JSON Schema draft 4 that describes
+readings: type, enum, properties, required, additionalProperties, items,
+minimum, maximum, exclusiveMinimum, exclusiveMaximum, minLength, maxLength,
+minItems and maxItems. Other keywords are ignored.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional
+
+from foglamp import logger
+
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_LOGGER = logger.setup(__name__)  # type: logging.Logger
+
+_FOGLAMP_ROOT = os.getenv("FOGLAMP_ROOT", default='/home/foglamp/foglamp/FogLAMP')
+
+DEFAULT_CONFIG = {
+    'schema_file': {
+        'description': 'JSON schema file that reading payloads must match. An empty value '
+                       'disables payload validation.',
+        'type': 'string',
+        'default': os.path.join(_FOGLAMP_ROOT, 'src', 'json-schema', 'sensor-values.json'),
+    },
+    'reading_schemas': {
+        'description': 'A dictionary that maps asset codes to JSON schemas that the readings '
+                       'of the asset must match',
+        'type': 'JSON',
+        'default': '{}',
+    }
+}
+"""Configuration items for device plugins that validate readings"""
+
+Validator = Callable[[Any], Optional[str]]
+"""Returns None when a value is valid and otherwise the reason it is not"""
+
+_TYPES = {
+    'string': lambda value: isinstance(value, str),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'null': lambda value: value is None,
+}
+
+
+class InvalidReading(ValueError):
+    """A reading does not match a schema"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+        """Identifies the schema keyword that failed, such as 'payload.asset: type'"""
+
+
+def _compile_type(schema_type, path: str) -> Validator:
+    types = [schema_type] if isinstance(schema_type, str) else schema_type
+
+    try:
+        checks = tuple(_TYPES[name] for name in types)
+    except KeyError as e:
+        raise ValueError('Unknown type {} at {}'.format(e, path))
+
+    reason = '{}: type'.format(path)
+
+    if len(checks) == 1:
+        check = checks[0]
+        return lambda value: None if check(value) else reason
+
+    return lambda value: None if any(check(value) for check in checks) else reason
+
+
+def _enum_key(value) -> Any:
+    """Returns a hashable key that is equal for two values only when they are equal
+    JSON values. Unlike in Python, true and false are not equal to 1 and 0."""
+    if isinstance(value, bool):
+        return bool, value
+    if isinstance(value, (int, float)):
+        return float, value  # 1 and 1.0 are the same number
+    if isinstance(value, list):
+        return list, tuple(_enum_key(item) for item in value)
+    if isinstance(value, dict):
+        return dict, frozenset((name, _enum_key(item)) for name, item in value.items())
+    return type(value), value
+
+
+def _compile_enum(enum: list, path: str) -> Validator:
+    keys = frozenset(_enum_key(item) for item in enum)
+    reason = '{}: enum'.format(path)
+
+    def validate(value):
+        try:
+            return None if _enum_key(value) in keys else reason
+        except TypeError:
+            return reason  # Not hashable, so not a JSON value
+
+    return validate
+
+
+def _compile_bound(schema: dict, keyword: str, path: str) -> Validator:
+    """Compiles minimum or maximum. Values that are not numbers are ignored."""
+    bound = schema[keyword]
+    reason = '{}: {}'.format(path, keyword)
+    numeric = _TYPES['number']
+
+    if keyword == 'minimum':
+        if schema.get('exclusiveMinimum'):
+            return lambda value: reason if numeric(value) and value <= bound else None
+        return lambda value: reason if numeric(value) and value < bound else None
+
+    if schema.get('exclusiveMaximum'):
+        return lambda value: reason if numeric(value) and value >= bound else None
+    return lambda value: reason if numeric(value) and value > bound else None
+
+
+def _compile_length(schema: dict, keyword: str, path: str) -> Validator:
+    """Compiles minLength, maxLength, minItems or maxItems. Values of other types
+    are ignored."""
+    limit = schema[keyword]
+    reason = '{}: {}'.format(path, keyword)
+    kind = str if keyword.endswith('Length') else list
+
+    if keyword.startswith('min'):
+        return lambda value: reason if isinstance(value, kind) and len(value) < limit else None
+    return lambda value: reason if isinstance(value, kind) and len(value) > limit else None
+
+
+def _compile_object(schema: dict, path: str) -> Validator:
+    properties = {name: compile_schema(property_schema, '{}.{}'.format(path, name))
+                  for name, property_schema in schema.get('properties', {}).items()}
+    required = tuple(schema.get('required', ()))
+    additional = schema.get('additionalProperties', True)
+    if isinstance(additional, dict):
+        additional = compile_schema(additional, '{}.*'.format(path))
+    additional_reason = '{}: additionalProperties'.format(path)
+
+    def validate(value):
+        if not isinstance(value, dict):
+            return None  # See type
+
+        for name in required:
+            if name not in value:
+                return '{}.{}: required'.format(path, name)
+
+        for name, item in value.items():
+            check = properties.get(name)
+            if check is None:
+                if additional is True:
+                    continue
+                if additional is False:
+                    return additional_reason
+                check = additional
+            error = check(item)
+            if error is not None:
+                return error
+
+        return None
+
+    return validate
+
+
+def compile_schema(schema: dict, path: str = 'payload') -> Validator:
+    """Compiles a JSON schema into a function
+
+    Args:
+        schema: A JSON schema
+        path: Where the schema applies. Used to build rejection reasons.
+
+    Returns:
+        A function that returns None when its argument matches schema. Otherwise it
+        returns a reason such as 'payload.asset: type'.
+
+    Raises:
+        ValueError: The schema is invalid
+    """
+    if not isinstance(schema, dict):
+        raise ValueError('The schema at {} must be a dictionary'.format(path))
+
+    checks = []
+
+    if 'type' in schema:
+        checks.append(_compile_type(schema['type'], path))
+
+    if 'enum' in schema:
+        checks.append(_compile_enum(schema['enum'], path))
+
+    for keyword in ('minimum', 'maximum'):
+        if keyword in schema:
+            checks.append(_compile_bound(schema, keyword, path))
+
+    for keyword in ('minLength', 'maxLength', 'minItems', 'maxItems'):
+        if keyword in schema:
+            checks.append(_compile_length(schema, keyword, path))
+
+    if 'items' in schema:
+        items = compile_schema(schema['items'], '{}[]'.format(path))
+
+        def validate_items(value):
+            if isinstance(value, list):
+                for item in value:
+                    error = items(item)
+                    if error is not None:
+                        return error
+            return None
+
+        checks.append(validate_items)
+
+    if 'properties' in schema or 'required' in schema or 'additionalProperties' in schema:
+        checks.append(_compile_object(schema, path))
+
+    if not checks:
+        return lambda value: None
+
+    if len(checks) == 1:
+        return checks[0]
+
+    checks = tuple(checks)
+
+    def validate(value):
+        for check in checks:
+            error = check(value)
+            if error is not None:
+                return error
+        return None
+
+    return validate
+
+
+class ReadingsValidator(object):
+    """Validates reading payloads and the readings of each asset"""
+
+    def __init__(self, payload_schema: Optional[dict] = None,
+                 reading_schemas: Dict[str, dict] = None):
+        """
+        Args:
+            payload_schema:
+                The schema of a reading payload such as
+                ``{"asset": ..., "timestamp": ..., "readings": {...}}``
+            reading_schemas:
+                Maps asset codes to the schemas of their readings dictionaries.
+                Readings of other assets are not validated.
+
+        Raises:
+            ValueError: A schema is invalid
+        """
+        self._validate_payload = None if payload_schema is None else compile_schema(
+            payload_schema)
+        self._reading_validators = {asset: compile_schema(schema, 'readings')
+                                    for asset, schema in (reading_schemas or {}).items()}
+
+    def validate(self, payload) -> None:
+        """Validates a reading payload including its readings
+
+        Raises:
+            InvalidReading: payload does not match a schema
+        """
+        if self._validate_payload is not None:
+            error = self._validate_payload(payload)
+            if error is not None:
+                raise InvalidReading(error)
+
+        if self._reading_validators and isinstance(payload, dict):
+            try:
+                readings = payload['readings']
+            except KeyError:
+                readings = payload.get('sensor_values')  # sensor_values is deprecated
+            self.validate_readings(payload.get('asset'), readings)
+
+    def validate_readings(self, asset: str, readings) -> None:
+        """Validates the readings dictionary of an asset
+
+        Raises:
+            InvalidReading: readings does not match the asset's schema
+        """
+        validate = self._reading_validators.get(asset)
+        if validate is not None:
+            error = validate(readings)
+            if error is not None:
+                raise InvalidReading(error)
+
+
+def create_validator(config: dict) -> ReadingsValidator:
+    """Creates a validator from a plugin configuration that includes :data:`DEFAULT_CONFIG`
+
+    Raises:
+        ValueError: A schema is invalid
+    """
+    payload_schema = None
+    schema_file = config['schema_file']['value']
+
+    if schema_file:
+        try:
+            with open(schema_file) as schema:
+                payload_schema = json.load(schema)
+        except FileNotFoundError:
+            _LOGGER.warning('Schema file %s was not found. Reading payloads are not validated.',
+                            schema_file)
+
+    reading_schemas = config['reading_schemas']['value']
+    if isinstance(reading_schemas, str):
+        reading_schemas = json.loads(reading_schemas)
+
+    return ReadingsValidator(payload_schema, reading_schemas)
@@ -216,6 +216,13 @@ class SendingProcess:
         self._storage = Storage()
         """" The interface to the FogLAMP Storage Layer """
 
+        self._block_query = payload_builder.PayloadBuilder() \
+            .WHERE(['id', '>', payload_builder.Placeholder('last')]) \
+            .LIMIT(payload_builder.Placeholder('count')) \
+            .ORDER_BY(['id', 'ASC']) \
+            .compile()
+        """ The query of the next block of data to send, built once and rendered for each block """
+
     def _retrieve_configuration(self, stream_id):
         """ Retrieves the configuration from the Configuration Manager
 
@@ -424,11 +431,7 @@ class SendingProcess:
 
         try:
             # Loads data
-            payload = payload_builder.PayloadBuilder() \
-                .WHERE(['id', '>', last_object_id]) \
-                .LIMIT(self._config['blockSize']) \
-                .ORDER_BY(['id', 'ASC']) \
-                .payload()
+            payload = self._block_query.render(last=last_object_id, count=self._config['blockSize'])
 
             readings = Readings().query(payload)
             raw_data = readings['rows']
@@ -458,11 +461,7 @@ class SendingProcess:
         _logger.debug("{0} - position |{1}| ".format("_load_data_into_memory_statistics", last_object_id))
 
         try:
-            payload = payload_builder.PayloadBuilder() \
-                .WHERE(['id', '>', last_object_id]) \
-                .LIMIT(self._config['blockSize']) \
-                .ORDER_BY(['id', 'ASC']) \
-                .payload()
+            payload = self._block_query.render(last=last_object_id, count=self._config['blockSize'])
 
             statistics_history = self._storage.query_tbl_with_payload('statistics_history', payload)
 
@@ -9,6 +9,7 @@
 # import logging
 import aiopg.sa
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 import os
 
 from foglamp import logger
@@ -62,6 +63,33 @@ async def update_statistics_value(statistics_key, value_increment):
             'Unable to update statistics value based on statistics_key %s and value_increment %s', statistics_key, value_increment)
         raise
 
+async def _create_statistics(statistics_key, description):
+    async with aiopg.sa.create_engine(_connection_string) as engine:
+        async with engine.acquire() as conn:
+            await conn.execute(postgresql.insert(_statistics_tbl).values(
+                key=statistics_key, description=description, value=0,
+                previous_value=0).on_conflict_do_nothing(index_elements=['key']))
+
+
+async def create_statistics(statistics_key, description):
+    """Insert a statistics row unless a row with the key exists
+
+    Databases created before a statistics key was added to the init data
+    do not have its row, and updates to the row would change nothing.
+
+    Keyword Arguments:
+    statistics_key -- statistics key value (required)
+    description -- description of the statistics (required)
+
+    Return Values:
+    None
+    """
+    try:
+        return await _create_statistics(statistics_key, description)
+    except:
+        _logger.exception('Unable to create statistics row for statistics_key %s', statistics_key)
+        raise
+
 # async def main():
 #     await update_statistics_value('READINGS',10)
 #
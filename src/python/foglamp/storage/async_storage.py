@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+""" Storage layer python client for coroutines
+
+    AsyncStorage and AsyncReadings have the same methods as Storage and Readings
+    but they are coroutines, so they do not block the event loop. Requests share
+    a pool of keep-alive connections instead of opening a connection per call.
+
+    :Example:
+        async with AsyncStorage() as storage:
+            result = await storage.query_tbl('statistics')
+"""
+
+import asyncio
+import json
+
+import aiohttp
+import cbor2
+
+from foglamp import logger
+from foglamp.storage.exceptions import *
+from foglamp.storage.storage import _CBOR_CONTENT_TYPE, _storage_service_cache, Storage
+from foglamp.storage.utils import Utils
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+_LOGGER = logger.setup(__name__)
+
+_DEFAULT_CONCURRENCY = 10
+"""Maximum number of simultaneous connections to the storage service"""
+
+_DEFAULT_KEEPALIVE_SECONDS = 30
+"""Seconds an idle connection stays in the pool"""
+
+
+class AsyncStorage(object):
+    """ Storage layer client for coroutines """
+
+    def __init__(self, concurrency=_DEFAULT_CONCURRENCY, keepalive_timeout=_DEFAULT_KEEPALIVE_SECONDS):
+        """
+        :param concurrency: maximum number of simultaneous requests; further requests wait for a connection
+        :param keepalive_timeout: seconds an idle connection is kept open for the next request
+        :raises InvalidServiceInstance: the storage service is not registered
+        """
+        # Storage finds the registered storage service
+        storage = Storage()
+        if storage.service_address == storage.base_url:
+            # TODO: need to set http / https based on service protocol
+            self.base_url = 'http://{}'.format(storage.base_url)
+            self._socket_path = None
+        else:
+            # The service is local and listens on a Unix domain socket
+            self.base_url = 'http://localhost'
+            self._socket_path = storage.service_address
+        self._concurrency = concurrency
+        self._keepalive_timeout = keepalive_timeout
+        self._session = None
+
+    def _get_session(self):
+        # The session is created in a coroutine so that it belongs to the running event loop
+        if self._session is None or self._session.closed:
+            if self._socket_path:
+                connector = aiohttp.UnixConnector(self._socket_path, limit=self._concurrency,
+                                                  keepalive_timeout=self._keepalive_timeout)
+            else:
+                connector = aiohttp.TCPConnector(limit=self._concurrency,
+                                                 keepalive_timeout=self._keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """ close the pooled connections """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # Allow async with context
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def _request(self, method, url, body=None, headers=None):
+        try:
+            async with self._get_session().request(method, self.base_url + url, data=body,
+                                                   headers=headers) as r:
+                # TODO: FOGL-615
+                # log error with message if status is 4xx or 5xx
+                if r.status in range(400, 500):
+                    _LOGGER.error("Client error code: %d", r.status)
+                if r.status in range(500, 600):
+                    _LOGGER.error("Server error code: %d", r.status)
+
+                res = await r.read()
+        except aiohttp.ClientConnectionError:
+            # The storage service may have moved
+            _storage_service_cache.invalidate()
+            raise
+
+        if r.content_type == _CBOR_CONTENT_TYPE:
+            return cbor2.loads(res)
+        return json.loads(res.decode(), strict=False)
+
+    async def insert_into_tbl(self, tbl_name, data):
+        """ insert json payload into given table
+
+        :param tbl_name:
+        :param data: JSON payload of a row, or of an array of rows that are inserted together
+        :return:
+        """
+        if not data:
+            raise ValueError("Data to insert is missing")
+
+        if not Utils.is_json(data):
+            raise TypeError("Provided data to insert must be a valid JSON")
+
+        return await self._request('POST', '/storage/table/{tbl_name}'.format(tbl_name=tbl_name), data)
+
+    async def update_tbl(self, tbl_name, data):
+        """ update json payload for specified condition into given table
+
+        :param tbl_name:
+        :param data: JSON payload
+        :return:
+        """
+        if not data:
+            raise ValueError("Data to update is missing")
+
+        if not Utils.is_json(data):
+            raise TypeError("Provided data to update must be a valid JSON")
+
+        return await self._request('PUT', '/storage/table/{tbl_name}'.format(tbl_name=tbl_name), data)
+
+    async def delete_from_tbl(self, tbl_name, condition=None):
+        """ Delete for specified condition from given table
+
+        :param tbl_name:
+        :param condition: JSON payload
+        :return:
+        """
+        if condition and (not Utils.is_json(condition)):
+            raise TypeError("condition payload must be a valid JSON")
+
+        return await self._request('DELETE', '/storage/table/{tbl_name}'.format(tbl_name=tbl_name), condition)
+
+    async def query_tbl(self, tbl_name, query=None):
+        """ Simple SELECT query for the specified table with optional query params
+
+        :param tbl_name:
+        :param query: query params in format k1=v1&k2=v2
+        :return:
+        """
+        get_url = '/storage/table/{tbl_name}'.format(tbl_name=tbl_name)
+
+        if query:  # else SELECT * FROM <tbl_name>
+            get_url += '?{}'.format(query)
+
+        return await self._request('GET', get_url)
+
+    async def query_tbl_with_payload(self, tbl_name, query_payload):
+        """ Complex SELECT query for the specified table with a payload
+
+        :param tbl_name:
+        :param query_payload: payload in valid JSON format
+        :return:
+        """
+        return await self._request('PUT', '/storage/table/{tbl_name}/query'.format(tbl_name=tbl_name),
+                                   query_payload)
+
+
+class AsyncReadings(AsyncStorage):
+    """ Readings table operations for coroutines """
+
+    def __init__(self, concurrency=_DEFAULT_CONCURRENCY, keepalive_timeout=_DEFAULT_KEEPALIVE_SECONDS,
+                 binary=False):
+        """
+        :param binary: exchange readings with the storage service as CBOR rather than JSON text. CBOR
+            is about a fifth smaller. It is only as fast to encode and decode as JSON with the C
+            extension of cbor2 5 or later; the pure Python cbor2 4 is several times slower.
+        """
+        super().__init__(concurrency, keepalive_timeout)
+        self._accept = {'Accept': _CBOR_CONTENT_TYPE} if binary else None
+        self._binary = binary
+
+    async def append(self, readings):
+        """
+        :param readings: JSON payload with a "readings" array, or a dict with the same content,
+            which is sent as CBOR when binary is set. Values in the dict must be JSON types.
+        :return:
+        """
+        if not readings:
+            raise ValueError("Readings payload is missing")
+
+        headers = None
+        if isinstance(readings, dict):
+            if self._binary:
+                readings = cbor2.dumps(readings)
+                headers = {'Content-Type': _CBOR_CONTENT_TYPE}
+            else:
+                readings = json.dumps(readings)
+        elif not Utils.is_json(readings):
+            raise TypeError("Readings payload must be a valid JSON")
+
+        return await self._request('POST', '/storage/reading', readings, headers)
+
+    async def fetch(self, reading_id, count):
+        """
+        :param reading_id: the first reading ID in the block that is retrieved
+        :param count: the number of readings to return, if available
+        :return:
+        """
+        return await self._request('GET', '/storage/reading?id={}&count={}'.format(reading_id, count),
+                                   headers=self._accept)
+
+    def iter_blocks(self, start_id, block_size):
+        """ Iterates over blocks of readings in id order until no readings are left
+
+        The next block is fetched while the caller processes the current one.
+
+        :param start_id: the first reading ID to retrieve
+        :param block_size: the maximum number of readings in a block
+        :return: an async iterator of lists of readings as returned in "rows" by fetch(). Call its
+            aclose() to cancel the prefetch when stopping early.
+        :Example:
+            async for readings in AsyncReadings().iter_blocks(last_sent_id + 1, 1000):
+                await send(readings)
+        """
+        return _BlockIterator(self, start_id, block_size)
+
+    async def query(self, query_payload):
+        """
+        :param query_payload:
+        :return:
+        """
+        return await self._request('PUT', '/storage/reading/query', query_payload, self._accept)
+
+    async def purge(self, age, sent_id, flag=None):
+        """ Purge readings based on the age of the readings
+
+        :param age: the maximum age of data to retain, expressed in hours
+        :param sent_id: the id of the last reading to be sent out of FogLAMP
+        :param flag: define what to do about unsent readings. Valid options are retain or purge
+        :return: a JSON with the number of readings removed, the number of unsent readings removed
+            and the number of readings that remain
+        """
+        valid_flags = ['retain', 'purge']
+
+        if flag and flag.lower() not in valid_flags:
+            raise InvalidReadingsPurgeFlagParameters
+
+        put_url = '/storage/reading/purge?age={}&sent={}'.format(int(age), int(sent_id))
+        if flag:
+            put_url += "&flags={}".format(flag.lower())
+
+        return await self._request('PUT', put_url)
+
+
+class _BlockIterator(object):
+    """ Async iterator for AsyncReadings.iter_blocks """
+
+    def __init__(self, readings, start_id, block_size):
+        self._readings = readings
+        self._block_size = block_size
+        self._block = asyncio.ensure_future(readings.fetch(start_id, block_size))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._block is None:
+            raise StopAsyncIteration
+
+        try:
+            rows = (await self._block)['rows']
+        except BaseException:
+            self._block = None
+            raise
+
+        if not rows:
+            self._block = None
+            raise StopAsyncIteration
+
+        self._block = asyncio.ensure_future(
+            self._readings.fetch(max(row['id'] for row in rows) + 1, self._block_size))
+        return rows
+
+    async def aclose(self):
+        """ Cancels the prefetched block """
+        if self._block is not None:
+            self._block.cancel()
+            self._block = None
@@ -14,18 +14,74 @@ __version__ = "${VERSION}"
 
 from collections import OrderedDict
 import json
+import re
 import urllib.parse
 import numbers
+import uuid
 
 from foglamp import logger
 
 
 _LOGGER = logger.setup(__name__)
 
+class Placeholder(object):
+    """ A value that is given each time a compiled payload is rendered, see PayloadBuilder.compile """
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Placeholder({!r})'.format(self.name)
+
+
+class PayloadTemplate(object):
+    """ A payload serialized once, with placeholders that are replaced by values when it is rendered
+
+    :Example:
+        template = PayloadBuilder().WHERE(['id', '>', Placeholder('last')]).LIMIT(Placeholder('count')).compile()
+        payload = template.render(last=100, count=50)
+    """
+
+    def __init__(self, payload):
+        """
+        :param payload: the payload of a PayloadBuilder, which may contain Placeholder values
+        """
+        names = []
+        # Stands in for each placeholder while serializing; random so that no string value can match it
+        marker = uuid.uuid4().hex
+
+        def placeholder(value):
+            if not isinstance(value, Placeholder):
+                raise TypeError('{!r} is not JSON serializable'.format(value))
+            names.append(value.name)
+            return '{}{}'.format(marker, len(names) - 1)
+
+        # The serialized payload split into text and placeholder names, which alternate
+        self._parts = re.split('"{}([0-9]+)"'.format(marker), json.dumps(payload, default=placeholder))
+        self._parts[1::2] = [names[int(index)] for index in self._parts[1::2]]
+
+    @property
+    def placeholders(self):
+        return set(self._parts[1::2])
+
+    def render(self, **values):
+        """
+        :param values: a JSON serializable value for each placeholder name
+        :return: the payload with the values in place of the placeholders
+        :raises KeyError: a placeholder has no value
+        """
+        parts = list(self._parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = json.dumps(values[parts[i]])
+        return ''.join(parts)
+
 
 class PayloadBuilder(object):
     """ Payload Builder to be used in Python client  for Storage Service
 
+    A Placeholder value is replaced by a value each time a payload compiled into a PayloadTemplate is rendered.
     """
 
     # TODO: Add json validator
@@ -35,11 +91,9 @@ class PayloadBuilder(object):
     '''
     # TODO: Add tests
 
-    query_payload = None
-
-    def __init__(self, initial_payload=OrderedDict()):
-        # TODO: Investigate why simple "self.__class__.query_payload = initial_payload" is not working
-        self.__class__.query_payload = initial_payload if len(initial_payload) else OrderedDict()
+    def __init__(self, initial_payload=None):
+        # Each builder has its own payload, so builders can be used from concurrent coroutines
+        self.query_payload = initial_payload if initial_payload else OrderedDict()
 
     @staticmethod
     def verify_select(arg):
@@ -89,71 +143,61 @@ class PayloadBuilder(object):
             return False
         return True
 
-    @classmethod
-    def ALIAS(cls, *args):
+    def ALIAS(self, *args):
         raise NotImplementedError("To be implemented")
 
-    @classmethod
-    def SELECT(cls, *args):
+    def SELECT(self, *args):
         for arg in args:
-            if cls.verify_select(arg):
-                if 'return' not in cls.query_payload:
-                    cls.query_payload["return"] = list()
+            if self.verify_select(arg):
+                if 'return' not in self.query_payload:
+                    self.query_payload["return"] = list()
                 if isinstance(arg, tuple):
                     for a in arg:
-                        select = json.loads(a) if cls.is_json(a) else a
-                        cls.query_payload["return"].append(select)
+                        select = json.loads(a) if self.is_json(a) else a
+                        self.query_payload["return"].append(select)
                 else:
-                    select = json.loads(arg) if cls.is_json(arg) else arg
-                    cls.query_payload["return"].append(select)
-        return cls
+                    select = json.loads(arg) if self.is_json(arg) else arg
+                    self.query_payload["return"].append(select)
+        return self
 
-    @classmethod
-    def FROM(cls, tbl_name):
-        cls.query_payload["table"] = tbl_name
-        return cls
+    def FROM(self, tbl_name):
+        self.query_payload["table"] = tbl_name
+        return self
 
-    @classmethod
-    def UPDATE_TABLE(cls, tbl_name):
-        return cls.FROM(tbl_name)
+    def UPDATE_TABLE(self, tbl_name):
+        return self.FROM(tbl_name)
 
-    @classmethod
-    def COLS(cls, kwargs):
+    def COLS(self, kwargs):
         values = OrderedDict()
         for key, value in kwargs.items():
             values[key] = value
         return values
 
-    @classmethod
-    def SET(cls, **kwargs):
-        if 'values' in cls.query_payload:
-            cls.query_payload["values"].update(cls.COLS(kwargs))
+    def SET(self, **kwargs):
+        if 'values' in self.query_payload:
+            self.query_payload["values"].update(self.COLS(kwargs))
         else:
-            cls.query_payload["values"] = cls.COLS(kwargs)
-        return cls
+            self.query_payload["values"] = self.COLS(kwargs)
+        return self
 
-    @classmethod
-    def INSERT(cls, **kwargs):
-        cls.query_payload.update(cls.COLS(kwargs))
-        return cls
+    def INSERT(self, **kwargs):
+        self.query_payload.update(self.COLS(kwargs))
+        return self
 
-    @classmethod
-    def INSERT_INTO(cls, tbl_name):
-        return cls.FROM(tbl_name)
+    def INSERT_INTO(self, tbl_name):
+        return self.FROM(tbl_name)
 
-    @classmethod
-    def DELETE(cls, tbl_name):
-        return cls.FROM(tbl_name)
+    def DELETE(self, tbl_name):
+        return self.FROM(tbl_name)
 
-    @classmethod
-    def add_new_clause(cls, and_or, main, new):
+    def add_new_clause(self, and_or, main, new):
         """
-        Recursively searches for the innermost and/or block, or cls.query_payload["where"] if none, in "main" to add
+        Recursively searches for the innermost and/or block, or self.query_payload["where"] if none, in "main" to add
         the 'new' condition block under "and_or" key.
 
         Args:
             and_or: one of 'and', 'or'
-            main: Dict (cls.query_payload["where"] or the innermost and/or subset of it) where
+            main: Dict (self.query_payload["where"] or the innermost and/or subset of it) where
                   the new condition block is to be added
             new: condition block to be added
 
@@ -163,130 +207,125 @@ class PayloadBuilder(object):
             if 'or' not in main:
                 main[and_or] = new
             else:
-                cls.add_new_clause(and_or, main['or'], new)
+                self.add_new_clause(and_or, main['or'], new)
         else:
-            cls.add_new_clause(and_or, main['and'], new)
+            self.add_new_clause(and_or, main['and'], new)
 
-    @classmethod
-    def WHERE(cls, arg, *args):
+    def WHERE(self, arg, *args):
         # Pass multiple arguments in a single tuple also. Useful when called from external process i.e. api, test.
         args = (arg,) + args if not isinstance(arg, tuple) else arg
         for arg in args:
             condition = OrderedDict()
-            if cls.verify_condition(arg):
+            if self.verify_condition(arg):
                 condition["column"] = arg[0]
                 condition["condition"] = arg[1]
                 condition["value"] = arg[2]
-                if 'where' not in cls.query_payload:
-                    cls.query_payload["where"] = condition
+                if 'where' not in self.query_payload:
+                    self.query_payload["where"] = condition
                 else:
-                    cls.add_new_clause('and', cls.query_payload['where'], condition)
-        return cls
+                    self.add_new_clause('and', self.query_payload['where'], condition)
+        return self
 
-    @classmethod
-    def AND_WHERE(cls, arg, *args):
+    def AND_WHERE(self, arg, *args):
         # Pass multiple arguments in a single tuple also. Useful when called from external process i.e. api, test.
         args = (arg,) + args if not isinstance(arg, tuple) else arg
         for arg in args:
             condition = OrderedDict()
-            if cls.verify_condition(arg):
+            if self.verify_condition(arg):
                 condition["column"] = arg[0]
                 condition["condition"] = arg[1]
                 condition["value"] = arg[2]
-                if 'where' not in cls.query_payload:
-                    cls.query_payload["where"] = condition
+                if 'where' not in self.query_payload:
+                    self.query_payload["where"] = condition
                 else:
-                    cls.add_new_clause('and', cls.query_payload['where'], condition)
-        return cls
+                    self.add_new_clause('and', self.query_payload['where'], condition)
+        return self
 
-    @classmethod
-    def OR_WHERE(cls, arg, *args):
+    def OR_WHERE(self, arg, *args):
         # Pass multiple arguments in a single tuple also. Useful when called from external process i.e. api, test.
         args = (arg,) + args if not isinstance(arg, tuple) else arg
         for arg in args:
             condition = OrderedDict()
-            if cls.verify_condition(arg):
+            if self.verify_condition(arg):
                 condition["column"] = arg[0]
                 condition["condition"] = arg[1]
                 condition["value"] = arg[2]
-                if 'where' not in cls.query_payload:
-                    cls.query_payload["where"] = condition
+                if 'where' not in self.query_payload:
+                    self.query_payload["where"] = condition
                 else:
-                    cls.add_new_clause('or', cls.query_payload['where'], condition)
-        return cls
+                    self.add_new_clause('or', self.query_payload['where'], condition)
+        return self
 
-    @classmethod
-    def GROUP_BY(cls, *args):
-        cls.query_payload["group"] = ', '.join(args)
-        return cls
+    def GROUP_BY(self, *args):
+        self.query_payload["group"] = ', '.join(args)
+        return self
 
-    @classmethod
-    def AGGREGATE(cls, arg, *args):
+    def AGGREGATE(self, arg, *args):
         # Pass multiple arguments in a single tuple also. Useful when called from external process i.e. api, test.
         args = (arg,) + args if not isinstance(arg, tuple) else arg
         for arg in args:
             aggregate = OrderedDict()
-            if cls.verify_aggregation(arg):
+            if self.verify_aggregation(arg):
                 aggregate["operation"] = arg[0]
                 aggregate["column"] = arg[1]
-                if 'aggregate' in cls.query_payload:
-                    if not isinstance(cls.query_payload['aggregate'], list):
-                        cls.query_payload['aggregate'] = [cls.query_payload.get('aggregate')]
-                    cls.query_payload['aggregate'].append(aggregate)
+                if 'aggregate' in self.query_payload:
+                    if not isinstance(self.query_payload['aggregate'], list):
+                        self.query_payload['aggregate'] = [self.query_payload.get('aggregate')]
+                    self.query_payload['aggregate'].append(aggregate)
                 else:
-                    cls.query_payload["aggregate"] = aggregate
-        return cls
+                    self.query_payload["aggregate"] = aggregate
+        return self
 
-    @classmethod
-    def HAVING(cls):
+    def HAVING(self):
         raise NotImplementedError("To be implemented")
 
-    @classmethod
-    def LIMIT(cls, arg):
-        if isinstance(arg, numbers.Real):
-            cls.query_payload["limit"] = arg
-        return cls
+    def LIMIT(self, arg):
+        if isinstance(arg, (numbers.Real, Placeholder)):
+            self.query_payload["limit"] = arg
+        return self
 
-    @classmethod
-    def OFFSET(cls, arg):
-        if isinstance(arg, numbers.Real):
-            cls.query_payload["skip"] = arg
-        return cls
+    def OFFSET(self, arg):
+        if isinstance(arg, (numbers.Real, Placeholder)):
+            self.query_payload["skip"] = arg
+        return self
 
     SKIP = OFFSET
 
-    @classmethod
-    def ORDER_BY(cls, arg, *args):
+    def ORDER_BY(self, arg, *args):
         # Pass multiple arguments in a single tuple also. Useful when called from external process i.e. api, test.
         args = (arg,) + args if not isinstance(arg, tuple) else arg
         for arg in args:
             sort = OrderedDict()
-            if cls.verify_orderby(arg):
+            if self.verify_orderby(arg):
                 sort["column"] = arg[0]
                 sort["direction"] = arg[1]
-                if 'sort' in cls.query_payload:
-                    if not isinstance(cls.query_payload['sort'], list):
-                        cls.query_payload['sort'] = [cls.query_payload.get('sort')]
-                    cls.query_payload['sort'].append(sort)
+                if 'sort' in self.query_payload:
+                    if not isinstance(self.query_payload['sort'], list):
+                        self.query_payload['sort'] = [self.query_payload.get('sort')]
+                    self.query_payload['sort'].append(sort)
                 else:
-                    cls.query_payload["sort"] = sort
-        return cls
+                    self.query_payload["sort"] = sort
+        return self
+
+    def payload(self):
+        return json.dumps(self.query_payload, sort_keys=False)
 
-    @classmethod
-    def payload(cls):
-        return json.dumps(cls.query_payload, sort_keys=False)
+    def compile(self):
+        """ Serialize the payload once for a query that is repeated with different values
+
+        :return: a PayloadTemplate that is rendered with a value for each Placeholder
+        """
+        return PayloadTemplate(self.query_payload)
 
-    @classmethod
-    def chain_payload(cls):
+    def chain_payload(self):
         """
         Sometimes, we may want to create payload incremently, based upon some conditions, this method will come
         handy in such Use cases.
         """
-        return cls.query_payload
+        return self.query_payload
 
-    @classmethod
-    def query_params(cls):
-        where = cls.query_payload['where']
+    def query_params(self):
+        where = self.query_payload['where']
         query_params = OrderedDict({where['column']: where['value']})
         for key, value in where.items():
             if key == 'and':
@@ -13,8 +13,18 @@ __license__ = "Apache 2.0"
 __version__ = "${VERSION}"
 
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import http.client
+import ipaddress
 import json
+import os
+import select
+import socket
+import stat
+import threading
+import time
+
+import cbor2
 
 from foglamp import logger
 from foglamp.core.service_registry.service_registry import Service
@@ -24,6 +34,245 @@ from foglamp.storage.utils import Utils
 
 _LOGGER = logger.setup(__name__)
 
+_CBOR_CONTENT_TYPE = 'application/cbor'
+"""Compact binary encoding of readings that the storage service accepts in place of JSON"""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP connection over the Unix domain socket at path """
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(self.path)
+        except OSError:
+            self.sock.close()
+            self.sock = None
+            raise
+
+
+def _connection(address):
+    """ a new connection to host:port or, for an absolute path, to a Unix domain socket """
+    if address.startswith('/'):
+        return _UnixHTTPConnection(address)
+    # TODO: need to set http / https based on service protocol
+    return http.client.HTTPConnection(address)
+
+
+_IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+"""Methods whose requests can be sent again if the service may have processed them"""
+
+
+def _is_idempotent(method, url):
+    """ whether a request can be sent again if the service may have processed it
+
+    Updates are not: a PUT to a table can hold expressions such as value = value + 1.
+    Queries are sent as PUT with a payload but do not change anything.
+    """
+    if method in _IDEMPOTENT_METHODS:
+        return True
+    return method == 'PUT' and url.split('?', 1)[0].endswith('/query')
+
+
+def _is_dropped(conn):
+    """ whether the other end closed an idle connection; an idle connection is readable
+    only when it has been closed """
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (OSError, ValueError):
+        return True
+
+
+def _is_local(host):
+    if host in ('localhost', socket.gethostname()):
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _local_socket(service):
+    """ the Unix domain socket of a service on this host, which avoids the loopback TCP stack
+
+    :return: the path of the socket, or None if the service is remote or has no socket
+    """
+    path = service._socket
+    if not path or not _is_local(service._address):
+        return None
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            return path
+    except OSError:
+        pass
+    return None
+
+
+class _ConnectionPool(object):
+    """ Keeps a persistent connection per thread to each address
+
+    http.client connections are not thread safe, so every thread has its own.
+    A connection that was idle for longer than idle_timeout, or that the service has
+    closed, is replaced before it is used. A request that still fails on a reused
+    connection is retried once on a new connection only when sending it again is safe:
+    the request is a read, and either the request could not be sent or the service
+    closed the connection without responding.
+    """
+
+    def __init__(self, idle_timeout=30):
+        self.idle_timeout = idle_timeout
+        self._local = threading.local()
+
+    def _connections(self):
+        try:
+            return self._local.connections
+        except AttributeError:
+            self._local.connections = dict()
+            return self._local.connections
+
+    def request(self, address, method, url, body=None, headers=None):
+        """
+        :param address: host:port, or the path of a Unix domain socket
+        :return: response status, content type and body
+        """
+        connections = self._connections()
+        conn, last_used = connections.pop(address, (None, 0))
+
+        if conn is not None and (time.monotonic() - last_used > self.idle_timeout or
+                                 _is_dropped(conn)):
+            conn.close()
+            conn = None
+
+        retry = conn is not None and _is_idempotent(method, url)
+        if conn is None:
+            conn = _connection(address)
+
+        while True:
+            try:
+                conn.request(method, url=url, body=body, headers=headers or {})
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if not retry:
+                    raise
+                retry = False
+                conn = _connection(address)
+                continue
+
+            try:
+                r = conn.getresponse()
+                res = r.read()
+                break
+            except http.client.RemoteDisconnected:
+                # Closed before a response. The service may not have read the request.
+                conn.close()
+                if not retry:
+                    raise
+                retry = False
+                conn = _connection(address)
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                raise
+
+        if r.will_close:
+            conn.close()
+        else:
+            connections[address] = (conn, time.monotonic())
+
+        return r.status, r.getheader('Content-Type', ''), res
+
+    def close(self):
+        """ close the connections of the calling thread """
+        connections = self._connections()
+        for conn, _ in connections.values():
+            conn.close()
+        connections.clear()
+
+
+_connection_pool = _ConnectionPool()
+
+
+class _StorageServiceCache(object):
+    """ Process-wide cache of the storage service instance found in the service registry
+
+    Storage clients are created freely, so the registry is only searched again when the
+    entry is older than ttl seconds or after a request failed to reach the service. The
+    address that requests are sent to, which is its Unix domain socket when the service
+    is local, is kept with the instance.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._entry = None
+        """(service instance, service address)"""
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def _get_entry(self):
+        entry = self._entry
+        if entry is not None and time.monotonic() < self._expires:
+            return entry
+
+        with self._lock:
+            if self._entry is None or time.monotonic() >= self._expires:
+                service = Service.Instances.get(name="FogLAMP Storage")[0]
+                address = _local_socket(service) or '{}:{}'.format(service._address, service._port)
+                self._entry = (service, address)
+                self._expires = time.monotonic() + self.ttl
+            return self._entry
+
+    def get(self):
+        """
+        :return: the storage service instance
+        :raises Service.DoesNotExist: the storage service is not registered
+        """
+        return self._get_entry()[0]
+
+    def get_with_address(self):
+        """
+        :return: the storage service instance, and the path of its Unix domain socket when it
+            is local and has one, otherwise its host:port
+        :raises Service.DoesNotExist: the storage service is not registered
+        """
+        return self._get_entry()
+
+    def invalidate(self):
+        """ find the storage service in the registry again the next time it is needed """
+        with self._lock:
+            self._entry = None
+
+
+_storage_service_cache = _StorageServiceCache()
+
+
+def _request(address, method, url, body=None, headers=None):
+    """ send a request over the calling thread's persistent connection to address
+
+    :return: the response body decoded from JSON or, if the service sent it, CBOR
+    """
+    try:
+        status, content_type, res = _connection_pool.request(address, method, url, body, headers)
+    except (ConnectionError, FileNotFoundError, http.client.HTTPException):
+        # The storage service may have moved
+        _storage_service_cache.invalidate()
+        raise
+
+    # TODO: FOGL-615
+    # log error with message if status is 4xx or 5xx
+    if status in range(400, 500):
+        _LOGGER.error("Client error code: %d", status)
+    if status in range(500, 600):
+        _LOGGER.error("Server error code: %d", status)
+
+    if content_type.startswith(_CBOR_CONTENT_TYPE):
+        return cbor2.loads(res)
+    return json.loads(res.decode(), strict=False)
+
 
 class AbstractStorage(ABC):
     """ abstract class for storage client """
@@ -87,43 +336,13 @@ class Storage(AbstractStorage):
     def check_service_availibility(self):
         """ ping Storage service """
 
-        conn = http.client.HTTPConnection(self.management_api_url)
-        # TODO: need to set http / https based on service protocol
-
-        conn.request('GET', url='/foglamp/service/ping')
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res)
+        return _request(self.management_api_url, 'GET', url='/foglamp/service/ping')
 
     # TODO: remove me, and allow this call in service registry API
     def shutdown(self):
         """ stop Storage service """
 
-        conn = http.client.HTTPConnection(self.management_api_url)
-        # TODO: need to set http / https based on service protocol
-
-        conn.request('POST', url='/foglamp/service/shutdown', body=None)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res)
+        return _request(self.management_api_url, 'POST', url='/foglamp/service/shutdown', body=None)
 
     def _get_storage_service(self):
         """ get Storage service """
@@ -155,12 +374,13 @@ class Storage(AbstractStorage):
         #     raise InvalidServiceInstance
         # self.service = Service(s_id=svc["id"], s_name=svc["name"], s_type=svc["type"], s_port=svc["service_port"],
         #                        m_port=svc["management_port"], s_address=svc["address"], s_protocol=svc["protocol"])
-        found_services = Service.Instances.get(name="FogLAMP Storage")
-        svc = found_services[0]
+        svc, service_address = _storage_service_cache.get_with_address()
         # retry for a while?
         if svc is None:
             raise InvalidServiceInstance
         self.service = svc
+        # A local service is reached through its Unix domain socket when it has one
+        self.service_address = service_address
         return self
 
     def disconnect(self):
@@ -173,8 +393,10 @@ class Storage(AbstractStorage):
         """ insert json payload into given table
 
         :param tbl_name:
-        :param data: JSON payload
-        :return:
+        :param data: JSON payload of a row, or of an array of rows that are inserted together
+            by one statement; either all of the rows are inserted or none are
+        :return: {"response": "inserted", "rows_affected": <number of rows>}, or an error whose
+            message starts with "Row <index>:" when a row of an array can not be inserted
 
         :Example:
             curl -X POST http://0.0.0.0:8080/storage/table/statistics_history -d @payload2.json
@@ -185,10 +407,14 @@ class Storage(AbstractStorage):
                 "history_ts" : "now()",
                 "value" : 1
             }
-        """
-        conn = http.client.HTTPConnection(self.base_url)
-        # TODO: need to set http / https based on service protocol
 
+            or
+
+            [
+                { "key" : "SENT_1", "history_ts" : "now()", "value" : 1 },
+                { "key" : "SENT_2", "history_ts" : "now()", "value" : 2 }
+            ]
+        """
         post_url = '/storage/table/{tbl_name}'.format(tbl_name=tbl_name)
         if not data:
             raise ValueError("Data to insert is missing")
@@ -196,19 +422,7 @@ class Storage(AbstractStorage):
         if not Utils.is_json(data):
             raise TypeError("Provided data to insert must be a valid JSON")
 
-        conn.request('POST', url=post_url, body=data)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self.service_address, 'POST', url=post_url, body=data)
 
     def update_tbl(self, tbl_name, data):
         """ update json payload for specified condition into given table
@@ -231,8 +445,6 @@ class Storage(AbstractStorage):
                 }
             }
         """
-        conn = http.client.HTTPConnection(self.base_url)
-        # TODO: need to set http / https based on service protocol
         put_url = '/storage/table/{tbl_name}'.format(tbl_name=tbl_name)
 
         if not data:
@@ -241,19 +453,7 @@ class Storage(AbstractStorage):
         if not Utils.is_json(data):
             raise TypeError("Provided data to update must be a valid JSON")
 
-        conn.request('PUT', url=put_url, body=data)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self.service_address, 'PUT', url=put_url, body=data)
 
     def delete_from_tbl(self, tbl_name, condition=None):
         """ Delete for specified condition from given table
@@ -271,26 +471,12 @@ class Storage(AbstractStorage):
                     "value" : "SENT_test"
             }
         """
-        conn = http.client.HTTPConnection(self.base_url)
-        # TODO: need to set http / https based on service protocol
         del_url = '/storage/table/{tbl_name}'.format(tbl_name=tbl_name)
 
         if condition and (not Utils.is_json(condition)):
             raise TypeError("condition payload must be a valid JSON")
 
-        conn.request('DELETE', url=del_url, body=condition)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self.service_address, 'DELETE', url=del_url, body=condition)
 
     def query_tbl(self, tbl_name, query=None):
         """ Simple SELECT query for the specified table with optional query params
@@ -303,27 +489,13 @@ class Storage(AbstractStorage):
             curl -X GET http://0.0.0.0:8080/storage/table/statistics_history
             curl -X GET http://0.0.0.0:8080/storage/table/statistics_history?key=PURGE
         """
-        conn = http.client.HTTPConnection(self.base_url)
-        # TODO: need to set http / https based on service protocol
 
         get_url = '/storage/table/{tbl_name}'.format(tbl_name=tbl_name)
 
         if query:  # else SELECT * FROM <tbl_name>
             get_url += '?{}'.format(query)
 
-        conn.request('GET', url=get_url)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self.service_address, 'GET', url=get_url)
 
     def query_tbl_with_payload(self, tbl_name, query_payload):
         """ Complex SELECT query for the specified table with a payload
@@ -341,39 +513,35 @@ class Storage(AbstractStorage):
                     "value" : "SENT_test"
             }
         """
-        conn = http.client.HTTPConnection(self.base_url)
-        # TODO: need to set http / https based on service protocol
         put_url = '/storage/table/{tbl_name}/query'.format(tbl_name=tbl_name)
 
-        conn.request('PUT', url=put_url, body=query_payload)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self.service_address, 'PUT', url=put_url, body=query_payload)
 
 
 class Readings(Storage):
     """ Readings table operations """
 
-    _base_url = ""
+    _service_address = ""
 
-    def __init__(self):
+    def __init__(self, binary=False):
+        """
+        :param binary: exchange readings with the storage service as CBOR rather than JSON text. CBOR
+            is about a fifth smaller. It is only as fast to encode and decode as JSON with the C
+            extension of cbor2 5 or later; the pure Python cbor2 4 is several times slower.
+        """
         super().__init__()
         # FIXME: WTH?
-        self.__class__._base_url = self.base_url
+        self.__class__._service_address = self.service_address
+        self._binary = binary
 
-    @classmethod
-    def append(cls, readings):
+    def _accept(self):
+        """ headers that ask for readings in CBOR; the service may still answer with JSON """
+        return {'Accept': _CBOR_CONTENT_TYPE} if self._binary else None
+
+    def append(self, readings):
         """
-        :param readings:
+        :param readings: JSON payload, or a dict with the same content, which is sent as CBOR when
+            binary is set. Values in the dict must be JSON types.
         :return:
 
         :Example:
@@ -398,31 +566,22 @@ class Readings(Storage):
 
         """
 
-        conn = http.client.HTTPConnection(cls._base_url)
-        # TODO: need to set http / https based on service protocol
-
         if not readings:
             raise ValueError("Readings payload is missing")
 
-        if not Utils.is_json(readings):
+        headers = None
+        if isinstance(readings, dict):
+            if self._binary:
+                readings = cbor2.dumps(readings)
+                headers = {'Content-Type': _CBOR_CONTENT_TYPE}
+            else:
+                readings = json.dumps(readings)
+        elif not Utils.is_json(readings):
             raise TypeError("Readings payload must be a valid JSON")
 
-        conn.request('POST', url='/storage/reading', body=readings)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
+        return _request(self._service_address, 'POST', url='/storage/reading', body=readings, headers=headers)
 
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
-
-    @classmethod
-    def fetch(cls, reading_id, count):
+    def fetch(self, reading_id, count):
         """
 
         :param reading_id: the first reading ID in the block that is retrieved
@@ -433,27 +592,33 @@ class Readings(Storage):
 
         """
 
-        conn = http.client.HTTPConnection(cls._base_url)
-        # TODO: need to set http / https based on service protocol
-
         get_url = '/storage/reading?id={}&count={}'.format(reading_id, count)
 
-        conn.request('GET', url=get_url)
-        r = conn.getresponse()
+        return _request(self._service_address, 'GET', url=get_url, headers=self._accept())
 
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
+    def iter_blocks(self, start_id, block_size):
+        """ Yields blocks of readings in id order until no readings are left
 
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        The next block is fetched and decoded in another thread while the caller
+        processes the current one, so at most three blocks are in memory at once.
 
-    @classmethod
-    def query(cls, query_payload):
+        :param start_id: the first reading ID to retrieve
+        :param block_size: the maximum number of readings in a block
+        :return: a generator of lists of readings as returned in "rows" by fetch()
+        :Example:
+            for readings in Readings().iter_blocks(last_sent_id + 1, 1000):
+                send(readings)
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            block = executor.submit(self.fetch, start_id, block_size)
+            while True:
+                rows = block.result()['rows']
+                if not rows:
+                    return
+                block = executor.submit(self.fetch, max(row['id'] for row in rows) + 1, block_size)
+                yield rows
+
+    def query(self, query_payload):
         """
 
         :param query_payload:
@@ -470,22 +635,9 @@ class Readings(Storage):
                 }
             }
         """
-        conn = http.client.HTTPConnection(cls._base_url)
-        # TODO: need to set http / https based on service protocol
 
-        conn.request('PUT', url='/storage/reading/query', body=query_payload)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(self._service_address, 'PUT', url='/storage/reading/query', body=query_payload,
+                        headers=self._accept())
 
     @classmethod
     def purge(cls, age, sent_id, flag=None):
@@ -516,25 +668,10 @@ class Readings(Storage):
         except TypeError:
             raise
 
-        conn = http.client.HTTPConnection(cls._base_url)
-        # TODO: need to set http / https based on service protocol
-
         put_url = '/storage/reading/purge?age={}&sent={}'.format(_age, _sent_id)
         if flag:
             put_url += "&flags={}".format(flag.lower())
 
-        conn.request('PUT', url=put_url, body=None)
-        r = conn.getresponse()
-
-        # TODO: FOGL-615
-        # log error with message if status is 4xx or 5xx
-        if r.status in range(400, 500):
-            _LOGGER.error("Client error code: %d", r.status)
-        if r.status in range(500, 600):
-            _LOGGER.error("Server error code: %d", r.status)
-
         # NOTE: If the data could not be deleted because of a conflict,
         #       then the error “409 Conflict” will be returned.
-        res = r.read().decode()
-        conn.close()
-        return json.loads(res, strict=False)
+        return _request(cls._service_address, 'PUT', url=put_url, body=None)
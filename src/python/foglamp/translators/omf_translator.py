@@ -514,24 +514,24 @@ def _retrieve_omf_types_already_created(configuration_key, type_id):
     return rows
 
 
-def _flag_created_omf_type(configuration_key, type_id, asset_code):
-    """ Stores into the Storage layer the successfully creation of the type into PICROMF.
+def _flag_created_omf_types(configuration_key, type_id, asset_codes):
+    """ Stores into the Storage layer the successfully creation of the types into PICROMF,
+        using a single request for all the types.
      Args:
-         configuration_key - part of the key to identify the type
-         type_id           - part of the key to identify the type
-         asset_code        - asset code defined into PICROMF
+         configuration_key - part of the key to identify the types
+         type_id           - part of the key to identify the types
+         asset_codes       - asset codes defined into PICROMF
      Returns:
      Raises:
      Todo:
      """
 
-    payload = payload_builder.PayloadBuilder()\
-        .INSERT(configuration_key=configuration_key,
-                asset_code=asset_code,
-                type_id=type_id)\
-        .payload()
+    rows = [{"configuration_key": configuration_key,
+             "asset_code": asset_code,
+             "type_id": type_id}
+            for asset_code in asset_codes]
 
-    _storage.insert_into_tbl("omf_created_objects", payload)
+    _storage.insert_into_tbl("omf_created_objects", json.dumps(rows))
 
 
 def _generate_omf_asset_id(asset_code):
@@ -848,6 +848,28 @@ def _create_omf_objects(raw_data, config_category_name, type_id):
 
     asset_codes_already_created = _retrieve_omf_types_already_created(config_category_name, type_id)
 
+    asset_codes_created = []
+
+    try:
+        _create_omf_types(asset_codes_to_evaluate, asset_codes_already_created, asset_codes_created)
+    finally:
+        # Flags the types created so far, also when the creation of a type fails
+        if asset_codes_created:
+            _flag_created_omf_types(config_category_name, type_id, asset_codes_created)
+
+
+def _create_omf_types(asset_codes_to_evaluate, asset_codes_already_created, asset_codes_created):
+    """ Creates into PICROMF the types not already created
+
+    Args:
+        asset_codes_to_evaluate:     unique asset codes of the data block
+        asset_codes_already_created: asset codes whose types were already created
+        asset_codes_created:         list to which the asset code of each type created is appended
+    Returns:
+    Raises:
+    Todo:
+    """
+
     for item in asset_codes_to_evaluate:
 
         asset_code = item["asset_code"]
@@ -874,7 +896,7 @@ def _create_omf_objects(raw_data, config_category_name, type_id):
 
                 _create_omf_objects_automatic(item)
 
-            _flag_created_omf_type(config_category_name, type_id, asset_code)
+            asset_codes_created.append(asset_code)
 
         else:
             _logger.debug("asset already created - asset |{0}| ".format(asset_code))
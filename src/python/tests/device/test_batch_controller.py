@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.batch_controller"""
+
+import pytest
+
+from foglamp.device.batch_controller import BatchController
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestBatchController(object):
+    """Unit tests for foglamp.device.batch_controller.BatchController
+    """
+
+    def test_initial(self):
+        controller = BatchController(10, 100, 5, 0.2)
+        assert 100 == controller.batch_size
+        assert 1 == controller.inserts
+
+    def test_slow_inserts_shrink_batch(self):
+        controller = BatchController(10, 100, 5, 0.2)
+        controller.record(1, 0)
+        assert 75 == controller.batch_size
+        for _ in range(20):
+            controller.record(1, 0)
+        assert 10 == controller.batch_size
+        assert 1 == controller.inserts
+
+    def test_backlog_adds_inserts(self):
+        controller = BatchController(10, 100, 3, 0.2)
+        for _ in range(10):
+            controller.record(0.1, 1000)
+        assert 100 == controller.batch_size
+        assert 3 == controller.inserts
+
+    def test_backlog_grows_batch(self):
+        controller = BatchController(10, 100, 3, 0.2)
+        controller.record(1, 0)
+        # Wait for the latency moving average to fall below the target
+        while controller.latency_seconds > 0.2:
+            controller.record(0, 1000)
+        batch_size = controller.batch_size
+        controller.record(0, 1000)
+        assert controller.batch_size > batch_size
+        assert 1 == controller.inserts
+
+    def test_idle_removes_inserts(self):
+        controller = BatchController(10, 100, 3, 0.2)
+        for _ in range(10):
+            controller.record(0.1, 1000)
+        assert 3 == controller.inserts
+        controller.record(0.1, 0)
+        controller.record(0.1, 0)
+        assert 1 == controller.inserts
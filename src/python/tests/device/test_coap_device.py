@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.coap_device"""
+
+import datetime
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from aiocoap.numbers.codes import Code as CoAP_CODES
+from cbor2 import dumps
+
+from foglamp.device.coap_device import CoAPIngest, CoAPSession
+from foglamp.device.ingest import Ingest
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+async def _add_readings_many(items):
+    """Accepts items whose readings are dictionaries"""
+    return [None if isinstance(item[3], (dict, type(None))) else TypeError('bad readings')
+            for item in items]
+
+
+async def _post(payload):
+    request = MagicMock()
+    request.payload = dumps(payload)
+    with patch.object(Ingest, 'get_credits', return_value=(10, 0)), \
+            patch.object(Ingest, 'increment_discarded_readings'), \
+            patch.object(Ingest, 'add_readings_many', side_effect=_add_readings_many) as add:
+        return_val = await CoAPIngest().render_post(request)
+    return return_val, add
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestCoAPIngest(object):
+    """Unit tests for foglamp.device.coap_device.CoAPIngest
+    """
+
+    @pytest.mark.asyncio
+    async def test_array(self):
+        readings = [{'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test', 'readings': {'a': 1}},
+                    5,
+                    {'timestamp': '2017-01-01T00:00:00Z', 'asset': 'test', 'readings': 5}]
+        return_val, add = await _post(readings)
+        assert return_val.code == CoAP_CODES.VALID
+        assert json.loads(return_val.payload.decode()) == {
+            'accepted': 1, 'errors': [[1, 'Each reading must be a dictionary'],
+                                      [2, 'bad readings']], 'credits': 10, 'backoff': 0}
+        assert 1 == add.call_count
+        assert 2 == len(add.call_args[0][0])
+
+    @pytest.mark.asyncio
+    async def test_samples(self):
+        payload = {'asset': 'vibration', 'samples': [['2017-01-01T00:00:00Z', {'x': 1}],
+                                                      ['2017-01-01T00:00:01Z', {'x': 2}]]}
+        return_val, add = await _post(payload)
+        assert return_val.code == CoAP_CODES.VALID
+        assert json.loads(return_val.payload.decode()) == {'accepted': 2, 'credits': 10,
+                                                           'backoff': 0}
+        assert [('vibration', '2017-01-01T00:00:00Z', None, {'x': 1}),
+                ('vibration', '2017-01-01T00:00:01Z', None, {'x': 2})] == add.call_args[0][0]
+
+    @pytest.mark.asyncio
+    async def test_samples_rejected(self):
+        return_val, _ = await _post({'asset': 'vibration', 'samples': [['2017-01-01']]})
+        assert return_val.code == CoAP_CODES.BAD_REQUEST
+
+        return_val, _ = await _post({'asset': 'vibration', 'samples': 5})
+        assert return_val.code == CoAP_CODES.BAD_REQUEST
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestCoAPSession(object):
+    """Unit tests for foglamp.device.coap_device.CoAPSession
+    """
+
+    @staticmethod
+    async def _post(resource, payload):
+        request = MagicMock()
+        request.payload = dumps(payload)
+        with patch.object(Ingest, 'get_credits', return_value=(10, 0)), \
+                patch.object(Ingest, 'increment_discarded_readings'), \
+                patch.object(Ingest, 'add_readings_many',
+                             side_effect=_add_readings_many) as add:
+            return_val = await resource.render_post(request)
+        return return_val, add
+
+    @pytest.mark.asyncio
+    async def test_frames(self):
+        resource = CoAPSession(60, 2)
+        return_val, _ = await self._post(resource, {
+            'asset': 'vibration', 'schema': ['x', 'y'], 'interval_ms': 1,
+            'key_prefix': '80a43623-ebe5-40d6-8d80-3f892da9b3b4'})
+        assert return_val.code == CoAP_CODES.CREATED
+        session = json.loads(return_val.payload.decode())['session']
+
+        return_val, add = await self._post(resource, [session, 1, 1500000000, [1, 2], [3]])
+        assert return_val.code == CoAP_CODES.VALID
+        assert json.loads(return_val.payload.decode()) == {
+            'ack': 1, 'accepted': 1, 'errors': [[1, 'Expected 2 values']],
+            'credits': 10, 'backoff': 0}
+        asset, timestamp, key, readings = add.call_args[0][0][0]
+        assert ('vibration', {'x': 1, 'y': 2}) == (asset, readings)
+        assert 1500000000 == timestamp.timestamp()
+
+        # Not acknowledged
+        return_val, add = await self._post(resource, [session, 3, None, [1, 2], [3, 4]])
+        assert return_val.code == CoAP_CODES.VALID
+        assert b'' == return_val.payload
+        items = add.call_args[0][0]
+        assert items[1][1] - items[0][1] == datetime.timedelta(milliseconds=1)
+        assert items[0][2] != key
+
+        return_val, _ = await self._post(resource, [session, 4, None, [1, 2]])
+        assert json.loads(return_val.payload.decode()) == {'ack': 4, 'accepted': 1,
+                                                           'credits': 10, 'backoff': 0}
+
+    @pytest.mark.asyncio
+    async def test_unknown_session(self):
+        return_val, _ = await self._post(CoAPSession(60, 1), [5, 1, None, [1]])
+        assert return_val.code == CoAP_CODES.NOT_FOUND
+
+    @pytest.mark.asyncio
+    async def test_bad_session(self):
+        return_val, _ = await self._post(CoAPSession(60, 1), {'asset': 'a', 'schema': []})
+        assert return_val.code == CoAP_CODES.BAD_REQUEST
+
+    @pytest.mark.asyncio
+    async def test_keys_differ_between_sessions(self):
+        resource = CoAPSession(60, 1)
+        keys = []
+        for _ in range(2):
+            return_val, _ = await self._post(resource, {
+                'asset': 'a', 'schema': ['x'], 'key_prefix': '80a43623-ebe5-40d6-8d80-3f892da9b3b4'})
+            session = json.loads(return_val.payload.decode())['session']
+            _, add = await self._post(resource, [session, 1, None, [1]])
+            keys.append(add.call_args[0][0][0][2])
+        # A client that restarts its sequence numbers in a new session is not discarded
+        assert keys[0] != keys[1]
+
+    @pytest.mark.asyncio
+    async def test_sessions_expire_and_are_capped(self):
+        resource = CoAPSession(60, 1, max_sessions=2)
+        sessions = []
+        with patch('foglamp.device.coap_device.time.monotonic', return_value=100):
+            for _ in range(2):
+                return_val, _ = await self._post(resource, {'asset': 'a', 'schema': ['x']})
+                sessions.append(json.loads(return_val.payload.decode())['session'])
+            return_val, _ = await self._post(resource, {'asset': 'a', 'schema': ['x']})
+            assert return_val.code == CoAP_CODES.SERVICE_UNAVAILABLE
+
+        with patch('foglamp.device.coap_device.time.monotonic', return_value=130):
+            return_val, _ = await self._post(resource, [sessions[1], 1, None, [1]])
+            assert return_val.code == CoAP_CODES.VALID
+
+        # Frames expire idle sessions too
+        with patch('foglamp.device.coap_device.time.monotonic', return_value=170):
+            return_val, _ = await self._post(resource, [sessions[1], 2, None, [1]])
+            assert return_val.code == CoAP_CODES.VALID
+            assert [sessions[1]] == list(resource._sessions)
+
+    @pytest.mark.asyncio
+    async def test_timestamp_out_of_range(self):
+        resource = CoAPSession(60, 1)
+        return_val, _ = await self._post(resource, {'asset': 'a', 'schema': ['x']})
+        session = json.loads(return_val.payload.decode())['session']
+        return_val, _ = await self._post(resource, [session, 1, 1e300, [1]])
+        assert return_val.code == CoAP_CODES.BAD_REQUEST
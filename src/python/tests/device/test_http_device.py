@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.http_device"""
+
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+
+from foglamp.device import http_device
+from foglamp.device.http_device import HttpIngest
+from foglamp.device.ingest import Ingest
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+class _Content(object):
+    """A request body that arrives a few bytes at a time"""
+
+    def __init__(self, body: bytes, chunk_size: int = 3):
+        self._body = body
+        self._chunk_size = chunk_size
+
+    async def read(self, size):
+        chunk = self._body[:min(size, self._chunk_size)]
+        self._body = self._body[len(chunk):]
+        return chunk
+
+    async def readline(self):
+        index = self._body.find(b'\n') + 1 or len(self._body)
+        line = self._body[:index]
+        self._body = self._body[index:]
+        return line
+
+
+async def _add_readings_many(items):
+    """Accepts items whose readings are dictionaries"""
+    return [None if isinstance(item[3], (dict, type(None))) else TypeError('bad readings')
+            for item in items]
+
+
+async def _post(body, content_type='application/json', credits=10):
+    request = MagicMock()
+    request.content_type = content_type
+    request.content = _Content(body)
+    with patch.object(Ingest, 'get_credits', return_value=(credits, 1.5)), \
+            patch.object(Ingest, 'increment_discarded_readings'), \
+            patch.object(Ingest, 'add_readings_many', side_effect=_add_readings_many) as add:
+        response = await HttpIngest(2).render_post(request)
+    return response, add
+
+
+async def _values(iterator):
+    values = []
+    async for value in iterator:
+        values.append(value)
+    return values
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestHttpIngest(object):
+    """Unit tests for foglamp.device.http_device.HttpIngest
+    """
+
+    @pytest.mark.asyncio
+    async def test_iter_array(self):
+        body = '[ {"a": "é"}, 12345 , [1, 2],"x"]'.encode('utf-8')
+        assert [{'a': 'é'}, 12345, [1, 2], 'x'] == await _values(
+            http_device._ArrayIterator(_Content(body)))
+        assert [] == await _values(http_device._ArrayIterator(_Content(b' [ ] ')))
+
+    @pytest.mark.parametrize("body", [b'{}', b'[1, 2', b'[{"a": }]', b'[1 2]', b'[,1]', b'[1,]',
+                                      b'[1,,2]'])
+    @pytest.mark.asyncio
+    async def test_iter_array_invalid(self, body):
+        with pytest.raises(ValueError):
+            await _values(http_device._ArrayIterator(_Content(body)))
+
+    @pytest.mark.asyncio
+    async def test_iter_array_element_too_long(self):
+        content = _Content(b'[1, {"a": "' + b'x' * 100, chunk_size=10)
+        values = []
+        with pytest.raises(ValueError):
+            async for value in http_device._ArrayIterator(content, 50):
+                values.append(value)
+        assert [1] == values
+        # Failed before reading the rest of the body
+        assert content._body
+
+    @pytest.mark.asyncio
+    async def test_array(self):
+        body = json.dumps([{'asset': 'a', 'readings': {'x': 1}}, 5,
+                           {'asset': 'a', 'readings': 5}]).encode('utf-8')
+        response, add = await _post(body)
+        assert 200 == response.status
+        assert {'accepted': 1, 'errors': [[1, 'Each reading must be a dictionary'],
+                                          [2, 'bad readings']],
+                'credits': 10, 'backoff': 1.5} == json.loads(response.text)
+        # Batches of 2
+        assert 2 == add.call_count
+
+    @pytest.mark.asyncio
+    async def test_ndjson(self):
+        body = b'{"asset": "a"}\n\n{"asset": "b"}\n{"asset": \n'
+        response, _ = await _post(body, 'application/x-ndjson')
+        assert 400 == response.status
+        result = json.loads(response.text)
+        assert 2 == result['accepted']
+        assert 2 == result['errors'][0][0]
+
+    @pytest.mark.asyncio
+    async def test_busy(self):
+        response, add = await _post(b'[]', credits=0)
+        assert 429 == response.status
+        assert '2' == response.headers['Retry-After']
+        assert {'accepted': 0, 'credits': 0, 'backoff': 1.5} == json.loads(response.text)
+        assert not add.called
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.ingest"""
+
+import asyncio
+import json
+import os
+import uuid
+import pytest
+from unittest.mock import patch
+
+from foglamp.device.ingest import Ingest
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_TIMESTAMP = '2017-01-02T03:04:05.006Z'
+
+
+class _Connection(object):
+    """Stands in for an asyncpg connection. Keeps the rows in its _Pool."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.temp_rows = []
+
+    async def copy_records_to_table(self, table_name, records, schema_name=None, columns=None):
+        await self._pool.unblocked.wait()
+        self._pool.check()
+        self._pool.copies.append(table_name)
+        if table_name == 't_readings':
+            self.temp_rows.extend(records)
+        else:
+            self._pool.rows.extend(records)
+        return 'COPY {}'.format(len(records))
+
+    async def execute(self, sql):
+        self._pool.check()
+        if sql.startswith('truncate'):
+            self.temp_rows = []
+            return 'TRUNCATE TABLE'
+        if sql.startswith('insert'):
+            keys = {row[2] for row in self._pool.rows}
+            new_rows = [row for row in self.temp_rows if row[2] is None or row[2] not in keys]
+            self._pool.rows.extend(new_rows)
+            return 'INSERT 0 {}'.format(len(new_rows))
+        return 'CREATE TABLE'
+
+    async def fetchval(self, sql):
+        self._pool.check()
+        self._pool.health_checks += 1
+        return 1
+
+
+class _Acquire(object):
+    def __init__(self, pool):
+        self._pool = pool
+        self._connection = None
+
+    def __await__(self):
+        return self._pool.get().__await__()
+
+    async def __aenter__(self):
+        self._connection = await self._pool.get()
+        return self._connection
+
+    async def __aexit__(self, *exc):
+        await self._pool.release(self._connection)
+
+
+class _Pool(object):
+    """Stands in for the pool that asyncpg.create_pool returns"""
+
+    def __init__(self):
+        self.init = None
+        self.idle = []
+        self.rows = []
+        self.copies = []
+        self.failures = 0
+        """Number of storage calls that fail from now on"""
+        self.health_checks = 0
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+
+    def check(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError('connection lost')
+
+    async def create(self, **kwargs):
+        self.init = kwargs['init']
+        return self
+
+    async def get(self):
+        if self.idle:
+            return self.idle.pop()
+        connection = _Connection(self)
+        await self.init(connection)
+        return connection
+
+    def acquire(self, timeout=None):
+        return _Acquire(self)
+
+    async def release(self, connection):
+        self.idle.append(connection)
+
+    async def close(self):
+        pass
+
+
+async def _no_config():
+    pass
+
+
+class _Server(object):
+    """Runs Ingest against a _Pool with the given configuration
+
+    Statistics written to storage are added to :attr:`statistics`. Rows that
+    are created have a count of 0.
+    """
+
+    def __init__(self, **config):
+        self.pool = _Pool()
+        self.statistics = {}
+        config.setdefault('readings_insert_batch_timeout_seconds', 0.01)
+        self._patches = [
+            patch.object(Ingest, '_read_config', new=_no_config),
+            patch('asyncpg.create_pool', side_effect=self.pool.create),
+            patch('foglamp.statistics.update_statistics_value', side_effect=self._update_statistics),
+            patch('foglamp.statistics.create_statistics', side_effect=self._create_statistics),
+            patch.multiple(Ingest, **{'_' + name: value for name, value in config.items()}),
+        ]
+
+    async def _update_statistics(self, key, value):
+        self.statistics[key] = self.statistics.get(key, 0) + value
+
+    async def _create_statistics(self, key, description):
+        self.statistics.setdefault(key, 0)
+
+    async def __aenter__(self):
+        for p in self._patches:
+            p.start()
+        for _, attribute in Ingest._STATISTICS:
+            setattr(Ingest, attribute, 0)
+        await Ingest.start()
+        # Let the tasks that start() created begin
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.pool.unblocked.set()
+        try:
+            await Ingest.stop()
+        finally:
+            for p in reversed(self._patches):
+                p.stop()
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestIngest(object):
+    """Unit tests for foglamp.device.ingest.Ingest
+    """
+
+    @pytest.mark.asyncio
+    async def test_key_forgotten_when_wait_cancelled(self):
+        async with _Server(readings_buffer_size=1, max_concurrent_readings_inserts=1,
+                           readings_insert_batch_size=1) as server:
+            server.pool.unblocked.clear()
+            # Fills the buffer until the insert is unblocked
+            await Ingest.add_readings('a', _TIMESTAMP, uuid.uuid4(), {'x': 1})
+
+            key = uuid.uuid4()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(Ingest.add_readings('a', _TIMESTAMP, key, {'x': 2}), 0.05)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(Ingest.add_readings_many([('a', _TIMESTAMP, key, {'x': 2})]),
+                                       0.05)
+
+            server.pool.unblocked.set()
+            # Not discarded as a duplicate of the cancelled calls
+            await Ingest.add_readings('a', _TIMESTAMP, key, {'x': 2})
+
+        assert 2 == len(server.pool.rows)
+        assert 0 == server.statistics.get('DISCARDED', 0)
+
+    @pytest.mark.asyncio
+    async def test_keyless_batch_copied_to_readings(self):
+        async with _Server(readings_insert_batch_size=3) as server:
+            await Ingest.add_readings_many([('a', _TIMESTAMP, None, {'x': x}) for x in range(3)])
+
+        assert ['readings'] == server.pool.copies
+        assert 3 == len(server.pool.rows)
+        assert 3 == server.statistics['READINGS']
+
+    @pytest.mark.asyncio
+    async def test_keyed_batch_inserted_on_conflict(self):
+        key = uuid.uuid4()
+        async with _Server(readings_insert_batch_size=2) as server:
+            # Already in storage, for example sent to another worker
+            server.pool.rows.append(('a', None, key, '{}'))
+            await Ingest.add_readings_many([('a', _TIMESTAMP, key, {'x': 1}),
+                                            ('a', _TIMESTAMP, None, {'x': 2})])
+
+        assert ['t_readings'] == server.pool.copies
+        assert 2 == len(server.pool.rows)
+        assert 1 == server.statistics['READINGS']
+        assert 1 == server.statistics['DISCARDED']
+
+    def test_may_conflict(self):
+        assert not Ingest._may_conflict([('a', None, None, '{}')] * 2)
+        assert Ingest._may_conflict([('a', None, None, '{}'), ('a', None, uuid.uuid4(), '{}')])
+
+    @pytest.mark.asyncio
+    async def test_spilled_readings_inserted_once(self, tmpdir):
+        config = dict(readings_buffer_size=2, max_concurrent_readings_inserts=1,
+                      readings_insert_batch_size=2, readings_spill_max_megabytes=1,
+                      readings_spill_directory=str(tmpdir))
+        async with _Server(**config) as server:
+            server.pool.unblocked.clear()
+            await Ingest.add_readings_many([('a', _TIMESTAMP, None, {'x': x}) for x in range(6)])
+            assert 4 == Ingest._spill_buffer.depth
+        # Spilled readings stay on disk when stopping
+        rows = server.pool.rows
+
+        async with _Server(**config) as server:
+            while len(server.pool.rows) < 4:
+                await asyncio.sleep(0.01)
+        rows += server.pool.rows
+
+        assert [{'x': x} for x in range(6)] == [json.loads(row[3]) for row in rows]
+        assert ['checkpoint'] == os.listdir(str(tmpdir))
+
+        # Nothing is read again after a restart
+        async with _Server(**config) as server:
+            assert 0 == Ingest._spill_buffer.depth
+        assert [] == server.pool.rows
+
+    @pytest.mark.asyncio
+    async def test_readings_wait_behind_full_spill(self, tmpdir):
+        async with _Server(readings_buffer_size=2, max_concurrent_readings_inserts=1,
+                           readings_insert_batch_size=2, readings_spill_max_megabytes=1,
+                           readings_spill_directory=str(tmpdir)) as server:
+            # Room for two readings
+            Ingest._spill_buffer._max_bytes = 130
+            server.pool.unblocked.clear()
+            add_many = asyncio.ensure_future(
+                Ingest.add_readings_many([('a', _TIMESTAMP, None, {'x': x}) for x in range(6)]))
+            await asyncio.sleep(0.05)
+            assert 2 == Ingest._spill_buffer.depth
+            add = asyncio.ensure_future(Ingest.add_readings('a', _TIMESTAMP, None, {'x': 6}))
+            await asyncio.sleep(0.05)
+            # Neither went to memory ahead of the spilled readings
+            assert not add_many.done()
+            assert not add.done()
+
+            server.pool.unblocked.set()
+            await asyncio.wait_for(add_many, 5)
+            await asyncio.wait_for(add, 5)
+            while len(server.pool.rows) < 7:
+                await asyncio.sleep(0.01)
+
+        assert [{'x': x} for x in range(7)] == [json.loads(row[3]) for row in server.pool.rows]
+
+    @pytest.mark.asyncio
+    async def test_missing_statistics_created(self):
+        async with _Server() as server:
+            pass
+        assert {'INGESTCONN': 0, 'INGESTFAIL': 0, 'SPILLDEPTH': 0} == server.statistics
+
+    @pytest.mark.asyncio
+    async def test_insert_retried(self):
+        with patch('foglamp.device.ingest.random.uniform', return_value=0) as uniform:
+            async with _Server(readings_insert_batch_size=1) as server:
+                server.pool.failures = 2
+                await Ingest.add_readings('a', _TIMESTAMP, None, {'x': 1})
+                while not server.pool.rows:
+                    await asyncio.sleep(0.01)
+
+        assert 1 == len(server.pool.rows)
+        assert 2 == server.statistics['INGESTFAIL']
+        assert 1 == server.statistics['READINGS']
+        assert [(1, 2), (1, 4)] == [args for args, _ in uniform.call_args_list]
+
+    @pytest.mark.asyncio
+    async def test_reconnect_wait(self):
+        with patch.object(Ingest, '_insert_readings_wait_tasks', [None]), \
+                patch.object(Ingest, '_max_readings_insert_batch_reconnect_wait_seconds', 10), \
+                patch('foglamp.device.ingest.random.uniform', return_value=0) as uniform:
+            for attempt in range(1, 6):
+                await Ingest._reconnect_wait(0, attempt)
+        # Doubles until the maximum
+        assert [2, 4, 8, 10, 10] == [args[1] for args, _ in uniform.call_args_list]
+        assert all(1 == args[0] for args, _ in uniform.call_args_list)
+
+    @pytest.mark.asyncio
+    async def test_connection_pool_checked(self):
+        async with _Server(max_readings_insert_batch_connection_idle_seconds=0.02,
+                           min_readings_insert_connections=2) as server:
+            while server.pool.health_checks < 4:
+                await asyncio.sleep(0.01)
+            server.pool.failures = 1
+            while server.pool.failures:
+                await asyncio.sleep(0.01)
+
+        # One query on each of the minimum number of connections
+        assert 2 == server.statistics['INGESTCONN']
+        assert 1 == server.statistics['INGESTFAIL']
+
+    @pytest.mark.asyncio
+    async def test_readings_lists_filled_in_order(self):
+        async with _Server(readings_buffer_size=12, max_concurrent_readings_inserts=3,
+                           readings_insert_batch_size=2) as server:
+            server.pool.unblocked.clear()
+            sizes = []
+            for x in range(12):
+                await Ingest.add_readings('a', _TIMESTAMP, None, {'x': x})
+                sizes.append([len(readings_list) for readings_list in Ingest._readings_lists])
+
+            # Full batches first, then the rest of each list's room
+            assert [[1, 0, 0], [2, 0, 0], [2, 1, 0], [2, 2, 0], [2, 2, 1], [2, 2, 2],
+                    [2, 2, 3], [2, 2, 4], [3, 2, 4], [4, 2, 4], [4, 3, 4], [4, 4, 4]] == sizes
+            assert 0 == Ingest._readings_free_slots
+
+    @pytest.mark.asyncio
+    async def test_wrong_free_slots_recounted(self):
+        async with _Server(readings_buffer_size=4, max_concurrent_readings_inserts=2,
+                           readings_insert_batch_size=2) as server:
+            server.pool.unblocked.clear()
+            await Ingest.add_readings_many([('a', _TIMESTAMP, None, {'x': x}) for x in range(4)])
+
+            Ingest._readings_free_slots = 3
+            item = Ingest._validate_readings('a', _TIMESTAMP)
+            assert 0 == Ingest._append_readings([item])
+            assert 0 == Ingest._readings_free_slots
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.iso8601"""
+
+import pytest
+import dateutil.parser
+
+from foglamp.device import iso8601
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestParse(object):
+    """Unit tests for foglamp.device.iso8601.parse
+    """
+
+    @pytest.mark.parametrize("timestamp", [
+        '2017-01-02T01:02:03.23232Z-05:00',
+        '2017-01-02T01:02:03.23232Z+0530',
+        '2017-01-01T00:00:00Z',
+        '2017-01-02T01:02:03.23232-05:00',
+        '2017-01-02T01:02:03+01',
+        '2017-01-02T01:02:03-0830',
+        '2017-08-04 06:59:57.503123+00:00',
+        '2017-09-21 15:00:09.025655',
+        '2017-01-02T01:02:03',
+        '2017-01-02T01:02:03.1234567Z',
+        '2017-01-02',
+        'Jan 2 2017 1:02:03',
+    ])
+    def test_same_as_dateutil(self, timestamp):
+        expected = dateutil.parser.parse(timestamp)
+        actual = iso8601.parse(timestamp)
+        assert expected == actual
+        assert expected.utcoffset() == actual.utcoffset()
+
+    @pytest.mark.parametrize("timestamp, exception", [
+        ('bad timestamp', ValueError),
+        ('2017-02-30T00:00:00Z', ValueError),
+        (5, TypeError),
+    ])
+    def test_invalid(self, timestamp, exception):
+        with pytest.raises(exception):
+            iso8601.parse(timestamp)
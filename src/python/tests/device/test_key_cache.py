@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.key_cache"""
+
+import uuid
+import pytest
+from unittest.mock import patch
+
+from foglamp.device.key_cache import KeyCache
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestKeyCache(object):
+    """Unit tests for foglamp.device.key_cache.KeyCache
+    """
+
+    def test_duplicate(self):
+        cache = KeyCache(10, 60)
+        key = uuid.uuid4()
+        assert cache.add(key)
+        assert not cache.add(key)
+        assert cache.add(uuid.uuid4())
+        assert 2 == len(cache)
+
+    def test_max_size(self):
+        cache = KeyCache(2, 60)
+        keys = [uuid.uuid4() for _ in range(3)]
+        for key in keys:
+            assert cache.add(key)
+        assert 2 == len(cache)
+        # The oldest key was forgotten
+        assert cache.add(keys[0])
+        assert not cache.add(keys[2])
+
+    def test_expired(self):
+        cache = KeyCache(10, 60)
+        key = uuid.uuid4()
+        with patch('time.monotonic', return_value=100):
+            assert cache.add(key)
+        with patch('time.monotonic', return_value=159):
+            assert not cache.add(key)
+        with patch('time.monotonic', return_value=160):
+            assert cache.add(key)
+
+    def test_discard(self):
+        cache = KeyCache(10, 60)
+        key = uuid.uuid4()
+        cache.add(key)
+        cache.discard(key)
+        cache.discard(uuid.uuid4())
+        assert 0 == len(cache)
+        assert cache.add(key)
+
+    def test_disabled(self):
+        cache = KeyCache(0, 60)
+        key = uuid.uuid4()
+        assert cache.add(key)
+        assert cache.add(key)
+        assert 0 == len(cache)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.server"""
+
+import asyncio
+import builtins
+import os
+import pytest
+from unittest.mock import MagicMock, patch
+
+from foglamp.device.ingest import Ingest
+from foglamp.device.server import Server
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+def _server_state():
+    return patch.multiple(Server, _worker=0, _worker_pids=None, _worker_statistics_fds=None,
+                          _statistics_fd=None, _worker_exits=None, _stopping=False,
+                          _plugin_module_name=None)
+
+
+def _ingest_statistics():
+    return patch.multiple(Ingest, _readings_stats=0, _discarded_readings_stats=0,
+                          _connections_opened_stats=0, _insert_failures_stats=0,
+                          _spill_depth_stats=0)
+
+
+async def _config_value(category, item):
+    return {'workers': '3', 'plugin': 'foglamp.device.coap_device'}[item]
+
+
+async def _http_config_value(category, item):
+    return {'workers': '1', 'plugin': 'foglamp.device.http_device'}[item]
+
+
+async def _no_config(*args):
+    pass
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestServer(object):
+    """Unit tests for foglamp.device.server.Server
+    """
+
+    @pytest.mark.asyncio
+    async def test_fork_workers(self):
+        with _server_state(), _ingest_statistics():
+            Server._fork_workers(3)
+
+            if Server._worker:
+                # Each of the other workers sends its statistics and exits
+                try:
+                    Ingest._statistics_fd = Server._statistics_fd
+                    Ingest._readings_stats = Server._worker
+                    Ingest._discarded_readings_stats = 10
+                    Ingest._send_statistics()
+                finally:
+                    os._exit(0)
+
+            assert 2 == len(Server._worker_pids)
+            await asyncio.wait_for(asyncio.gather(*[
+                Ingest._read_worker_statistics(fd) for fd in Server._worker_statistics_fds]), 10)
+            for pid in Server._worker_pids:
+                assert 0 == os.waitpid(pid, 0)[1]
+
+            assert 1 + 2 == Ingest._readings_stats
+            assert 20 == Ingest._discarded_readings_stats
+
+    @pytest.mark.asyncio
+    async def test_worker_exit_stops_service(self):
+        loop = asyncio.get_event_loop()
+        with _server_state(), patch.object(Server, '_stop', side_effect=_no_config) as stop:
+            pid = os.fork()
+            if pid == 0:
+                os._exit(1)
+
+            Server._worker_pids = [pid]
+            Server._watch_workers(loop)
+            await asyncio.wait_for(asyncio.wait(Server._worker_exits), 10)
+            await asyncio.sleep(0)
+
+        stop.assert_called_once_with(loop)
+
+    @pytest.mark.asyncio
+    async def test_one_worker_without_shared_port(self):
+        with _server_state(), \
+                patch('foglamp.configuration_manager.create_category', side_effect=_no_config), \
+                patch('foglamp.configuration_manager.get_category_item_value_entry',
+                      side_effect=_config_value), \
+                patch.object(Ingest, '_read_config', side_effect=_no_config):
+            with patch('foglamp.device.coap_device._shares_port', return_value=False):
+                assert 1 == await Server._read_workers('COAP')
+            with patch('foglamp.device.coap_device._shares_port', return_value=True):
+                assert 3 == await Server._read_workers('COAP')
+
+    @pytest.mark.asyncio
+    async def test_listen_failure_stops_worker(self):
+        async def listen():
+            raise OSError('Address already in use')
+
+        plugin = MagicMock()
+        plugin.plugin_info.return_value = {'config': {}}
+        plugin.plugin_init.return_value = {'started': asyncio.ensure_future(listen())}
+        loop = asyncio.get_event_loop()
+        real_import = builtins.__import__
+
+        def import_plugin(name, *args, **kwargs):
+            if name == 'foglamp.device.coap_device':
+                return plugin
+            return real_import(name, *args, **kwargs)
+
+        with _server_state(), patch.object(Server, '_stop', side_effect=_no_config) as stop, \
+                patch('foglamp.configuration_manager.create_category', side_effect=_no_config), \
+                patch('foglamp.configuration_manager.get_category_all_items',
+                      side_effect=_no_config), \
+                patch('foglamp.configuration_manager.get_category_item_value_entry',
+                      side_effect=_config_value), \
+                patch('builtins.__import__', side_effect=import_plugin), \
+                patch.object(Ingest, 'start', side_effect=_no_config) as start:
+            await Server._start('COAP', None, None, loop)
+            await asyncio.sleep(0)
+
+        stop.assert_called_once_with(loop)
+        assert not start.called
+
+    @pytest.mark.asyncio
+    async def test_configured_plugin_started(self):
+        plugin = MagicMock()
+        plugin.plugin_info.return_value = {'config': {}}
+        plugin.plugin_init.return_value = {}
+        imported = []
+        real_import = builtins.__import__
+
+        def import_plugin(name, *args, **kwargs):
+            if name.startswith('foglamp.device.') and name.endswith('_device'):
+                imported.append(name)
+                return plugin
+            return real_import(name, *args, **kwargs)
+
+        with _server_state(), \
+                patch('foglamp.configuration_manager.create_category', side_effect=_no_config), \
+                patch('foglamp.configuration_manager.get_category_all_items',
+                      side_effect=_no_config), \
+                patch('foglamp.configuration_manager.get_category_item_value_entry',
+                      side_effect=_http_config_value) as value_entry, \
+                patch.object(Ingest, '_read_config', side_effect=_no_config), \
+                patch('builtins.__import__', side_effect=import_plugin), \
+                patch.object(Ingest, 'start', side_effect=_no_config) as start:
+            assert 1 == await Server._read_workers('HTTP')
+            await Server._start('HTTP', None, None, asyncio.get_event_loop())
+
+        assert ['foglamp.device.http_device'] == imported
+        assert start.called
+        # The module name is read once for both
+        assert 1 == len([c for c in value_entry.call_args_list if c[0][1] == 'plugin'])
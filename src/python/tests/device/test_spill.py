@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.spill"""
+
+import datetime
+import json
+import os
+import uuid
+import pytest
+
+from foglamp.device.spill import SpillBuffer
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+def _items(count):
+    timestamp = datetime.datetime(2017, 1, 2, 3, 4, 5, 6000, datetime.timezone.utc)
+    return [('asset{}'.format(index), timestamp, uuid.uuid4(), json.dumps({'x': index}))
+            for index in range(count)]
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestSpillBuffer(object):
+    """Unit tests for foglamp.device.spill.SpillBuffer
+    """
+
+    def test_fifo(self, tmpdir):
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        items = _items(10)
+        assert 10 == spill.append(items)
+        assert 10 == spill.depth
+        first = spill.read(3)
+        rest = spill.read(100)
+        assert items[:3] == first
+        assert items[3:] == rest
+        assert 0 == spill.depth
+        assert [] == spill.read(1)
+
+        # Segments are deleted once their readings are acknowledged, in any order
+        spill.acknowledge(item.token for item in rest)
+        assert 1 < len(os.listdir(str(tmpdir)))
+        spill.acknowledge(item.token for item in first)
+        assert ['checkpoint'] == os.listdir(str(tmpdir))
+
+    def test_max_bytes(self, tmpdir):
+        spill = SpillBuffer(str(tmpdir), 300)
+        appended = spill.append(_items(10))
+        assert 0 < appended < 10
+        assert not spill.has_room() or appended == spill.append(_items(10)) + appended
+        spill.acknowledge(item.token for item in spill.read(appended))
+        assert spill.has_room()
+
+    def test_reopen(self, tmpdir):
+        items = _items(5)
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        spill.append(items)
+        read = spill.read(3)
+        spill.acknowledge([read[0].token, read[2].token])
+        spill.close()
+
+        # Reading resumes after the last reading of the acknowledged prefix
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        assert 4 == spill.depth
+        spill.append(items[:1])
+        assert items[1:] + items[:1] == spill.read(100)
+        assert 0 == spill.depth
+
+    def test_reopen_without_acknowledge(self, tmpdir):
+        items = _items(5)
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        spill.append(items)
+        assert items == spill.read(100)
+        spill.close()
+
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        assert 5 == spill.depth
+        read = spill.read(100)
+        assert items == read
+        spill.acknowledge(item.token for item in read)
+        spill.close()
+
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024, segment_bytes=200)
+        assert 0 == spill.depth
+
+    def test_partial_line(self, tmpdir):
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024)
+        items = _items(2)
+        spill.append(items)
+        spill.close()
+
+        path = os.path.join(str(tmpdir), os.listdir(str(tmpdir))[0])
+        with open(path, 'ab') as segment:
+            segment.write(b'["asset", "2017')
+
+        spill = SpillBuffer(str(tmpdir), 1024 * 1024)
+        assert 2 == spill.depth
+        spill.append(items[:1])
+        assert items + items[:1] == spill.read(100)
+        assert 0 == spill.depth
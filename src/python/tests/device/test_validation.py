@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.device.validation"""
+
+import datetime
+import json
+import os
+import uuid
+import pytest
+
+from foglamp.device import validation
+from foglamp.device.validation import InvalidReading, ReadingsValidator, compile_schema
+
+__author__ = "Terris Linenbach"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_SCHEMA_FILE = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'json-schema',
+                            'sensor-values.json')
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("device")
+class TestValidation(object):
+    """Unit tests for foglamp.device.validation
+    """
+
+    @pytest.mark.parametrize("schema, value, expected", [
+        ({'type': 'integer'}, 5, None),
+        ({'type': 'integer'}, True, 'payload: type'),
+        ({'type': ['number', 'null']}, None, None),
+        ({'type': 'number', 'minimum': 0}, -1, 'payload: minimum'),
+        ({'type': 'number', 'maximum': 5, 'exclusiveMaximum': True}, 5, 'payload: maximum'),
+        ({'enum': ['a', 'b']}, 'c', 'payload: enum'),
+        ({'enum': [0, 1]}, True, 'payload: enum'),
+        ({'enum': [0, 1]}, False, 'payload: enum'),
+        ({'enum': [True]}, 1, 'payload: enum'),
+        ({'enum': [[0], {'a': 1}]}, [False], 'payload: enum'),
+        ({'enum': [[0], {'a': 1}]}, {'a': True}, 'payload: enum'),
+        ({'enum': [True, 1]}, True, None),
+        ({'enum': [1]}, 1.0, None),
+        ({'enum': [{'a': [1, 'x']}]}, {'a': [1, 'x']}, None),
+        ({'type': 'string', 'maxLength': 2}, 'abc', 'payload: maxLength'),
+        ({'type': 'array', 'items': {'type': 'string'}, 'minItems': 1}, [], 'payload: minItems'),
+        ({'type': 'array', 'items': {'type': 'string'}}, ['a', 1], 'payload[]: type'),
+        ({'properties': {'a': {'type': 'number'}}, 'additionalProperties': False},
+         {'a': 1, 'b': 2}, 'payload: additionalProperties'),
+        ({'properties': {'a': {'type': 'number'}}, 'required': ['a']}, {}, 'payload.a: required'),
+        ({'additionalProperties': {'type': 'number'}}, {'a': 'x'}, 'payload.*: type'),
+    ])
+    def test_compile_schema(self, schema, value, expected):
+        assert expected == compile_schema(schema)(value)
+
+    def test_invalid_schema(self):
+        with pytest.raises(ValueError):
+            compile_schema({'type': 'decimal'})
+
+    def test_sensor_values_schema(self):
+        with open(_SCHEMA_FILE) as schema_file:
+            validator = ReadingsValidator(json.load(schema_file),
+                                          {'pump': {'properties': {'rpm': {'type': 'integer'}}}})
+
+        validator.validate({'asset': 'pump', 'timestamp': '2017-01-01T00:00:00Z',
+                            'key': '123e4567-e89b-12d3-a456-426655440000',
+                            'readings': {'rpm': 500}})
+        validator.validate({'asset': 'other', 'timestamp': '2017-01-01T00:00:00Z',
+                            'readings': {'rpm': 'fast'}})
+        # CBOR payloads can carry datetime (tags 0 and 1) and UUID values, and
+        # clients may send properties that Ingest ignores
+        validator.validate({'asset': 'pump', 'key': uuid.uuid4(), 'x': 1,
+                            'timestamp': datetime.datetime.now(datetime.timezone.utc)})
+
+        for payload, reason in (({'asset': 'pump'}, 'payload.timestamp: required'),
+                                ({'asset': 5, 'timestamp': 't'}, 'payload.asset: type'),
+                                ({'asset': 'pump', 'timestamp': 't',
+                                  'readings': {'rpm': 'fast'}}, 'readings.rpm: type')):
+            with pytest.raises(InvalidReading) as excinfo:
+                validator.validate(payload)
+            assert reason == excinfo.value.reason
+
+    def test_create_validator(self):
+        config = {'schema_file': {'value': _SCHEMA_FILE},
+                  'reading_schemas': {'value': '{"pump": {"type": "object"}}'}}
+        validator = validation.create_validator(config)
+        with pytest.raises(InvalidReading):
+            validator.validate_readings('pump', 5)
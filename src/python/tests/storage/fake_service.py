@@ -0,0 +1,559 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+""" In-process stand-in for the storage service
+
+    FakeStorageService keeps tables and readings in memory and serves the /storage/table/... and
+    /storage/reading/... REST API of the storage service on a thread of its own. It registers
+    itself as "FogLAMP Storage" in Service.Instances, so Storage, Readings, AsyncStorage and
+    AsyncReadings use it without a storage service or a database. It is meant for tests of the
+    Python side.
+
+    Queries support where, and/or, return with alias, aggregate, group, sort, skip, limit and
+    the distinct modifier. Other query features of the storage plugins are rejected with an error.
+
+    :Example:
+        with FakeStorageService(tables={'streams': [{'id': 1, 'last_object': 0}]}):
+            Readings().append(json.dumps({'readings': readings}))
+            SendingProcess().start()
+"""
+
+import asyncio
+from bisect import bisect_left
+from datetime import datetime, timezone
+import itertools
+import json
+import operator
+import re
+import threading
+import time
+
+from aiohttp import web
+import cbor2
+
+from foglamp.core.service_registry.instance import Service
+from foglamp.storage.storage import _CBOR_CONTENT_TYPE, _storage_service_cache
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_SERVICE_NAME = "FogLAMP Storage"
+
+_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+_FUNCTION = re.compile(r'[a-zA-Z][a-zA-Z0-9_]*\(.*\)')
+"""A string value that the storage plugins pass to the database as a function call"""
+
+_CONDITIONS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<>': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+}
+
+_AGGREGATES = {
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'avg': lambda values: sum(values) / len(values),
+    'count': len,
+}
+
+
+class _StorageError(Exception):
+    """ an error that the storage service reports as a plugin error """
+
+    def __init__(self, entry_point, message):
+        super().__init__(message)
+        self.entry_point = entry_point
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime(_TIMESTAMP_FORMAT) + '+00'
+
+
+def _epoch(timestamp):
+    """ seconds since the epoch of a timestamp in one of the forms FogLAMP uses, or None """
+    text = re.sub(r'([+-]\d\d):?(\d\d)?$', lambda m: m.group(1) + (m.group(2) or '00'), timestamp.strip())
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f%z', '%Y-%m-%d %H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f%z',
+                '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            parsed = datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+    return None
+
+
+def _value(entry_point, value):
+    """ the stored value of a value in a payload; now() is the only function that is evaluated """
+    if isinstance(value, str) and _FUNCTION.fullmatch(value):
+        if value.replace(' ', '').lower() == 'now()':
+            return _now()
+        raise _StorageError(entry_point, "Function {} is not supported by the fake storage service".format(value))
+    return value
+
+
+def _coerce(stored, value):
+    # Values from query strings are text, as the database would cast them compare them as the column type
+    if isinstance(stored, (int, float)) and not isinstance(stored, bool) and isinstance(value, str):
+        try:
+            return type(stored)(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _matches(row, clause):
+    """ evaluate a where clause the way the storage plugins write it as SQL: the conditions in an
+    "and" chain bind tighter than those in an "or" chain """
+    # The clause as "A AND B OR C ...", grouped into the terms of the OR
+    terms = [[]]
+
+    def flatten(where):
+        if not isinstance(where, dict) or not {'column', 'condition', 'value'} <= where.keys():
+            raise _StorageError('where clause', 'The "where" object must have column, condition and value')
+        terms[-1].append(where)
+        if 'and' in where:
+            flatten(where['and'])
+        if 'or' in where:
+            terms.append([])
+            flatten(where['or'])
+
+    flatten(clause)
+    return any(all(_condition(row, where) for where in term) for term in terms)
+
+
+def _condition(row, where):
+    compare = _CONDITIONS.get(where['condition'])
+    if compare is None:
+        raise _StorageError('where clause', 'Condition {} is not supported by the fake storage service'.format(
+            where['condition']))
+    stored = row.get(where['column'])
+    if stored is None:
+        return False
+    try:
+        return compare(stored, _coerce(stored, where['value']))
+    except TypeError:
+        return False
+
+
+def _json_property(row, json_path):
+    value = row.get(json_path['column'])
+    properties = json_path['properties']
+    for prop in properties if isinstance(properties, list) else [properties]:
+        value = value.get(prop) if isinstance(value, dict) else None
+    return value
+
+
+class _Table(object):
+    """ The rows of a table, in insertion order """
+
+    def __init__(self, rows=None):
+        self.rows = [dict(row) for row in rows or []]
+
+    def insert(self, payload):
+        rows = payload if isinstance(payload, list) else [payload]
+        if not rows:
+            raise _StorageError('insert', 'Payload must be an object or a non-empty array of objects')
+        new_rows = []
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict):
+                raise _StorageError('insert', 'Row {}: each row must be an object'.format(index))
+            new_rows.append({column: _value('insert', value) for column, value in row.items()})
+        self.rows.extend(new_rows)
+        return len(new_rows)
+
+    def update(self, payload):
+        where = payload.get('where', payload.get('condition'))
+        if 'json_properties' in payload:
+            raise _StorageError('update', 'json_properties is not supported by the fake storage service')
+        values = {column: _value('update', value) for column, value in payload.get('values', {}).items()}
+        expressions = payload.get('expressions', [])
+        count = 0
+        for row in self.rows:
+            if where is None or _matches(row, where):
+                row.update(values)
+                for expression in expressions:
+                    row[expression['column']] = self._apply(row.get(expression['column']), expression)
+                count += 1
+        return count
+
+    @staticmethod
+    def _apply(current, expression):
+        operators = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+        if expression['operator'] not in operators:
+            raise _StorageError('update', 'Operator {} is not supported'.format(expression['operator']))
+        return operators[expression['operator']](current or 0, expression['value'])
+
+    def delete(self, payload):
+        before = len(self.rows)
+        if payload is None:
+            self.rows = []
+        else:
+            if 'where' not in payload:
+                raise _StorageError('delete', 'JSON does not contain where clause')
+            self.rows = [row for row in self.rows if not _matches(row, payload['where'])]
+        return before - len(self.rows)
+
+    def query(self, payload):
+        if 'timebucket' in payload:
+            raise _StorageError('retrieve', 'timebucket is not supported by the fake storage service')
+
+        rows = self.rows
+        if 'where' in payload:
+            rows = [row for row in rows if _matches(row, payload['where'])]
+
+        if 'aggregate' in payload:
+            rows = self._aggregate(rows, payload)
+        elif 'return' in payload:
+            rows = [self._select(row, payload['return']) for row in rows]
+        else:
+            rows = [dict(row) for row in rows]
+
+        if payload.get('modifier', '').lower() == 'distinct':
+            unique = []
+            for row in rows:
+                if row not in unique:
+                    unique.append(row)
+            rows = unique
+
+        sort = payload.get('sort')
+        for order in reversed(sort if isinstance(sort, list) else [sort] if sort else []):
+            column = order['column']
+            rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)),
+                          reverse=order.get('direction', 'asc').lower() == 'desc')
+
+        skip = payload.get('skip', 0)
+        limit = payload.get('limit')
+        rows = rows[skip:] if limit is None else rows[skip:skip + limit]
+        return {'count': len(rows), 'rows': rows}
+
+    @staticmethod
+    def _select(row, columns):
+        if not isinstance(columns, list):
+            raise _StorageError('retrieve', 'The property return must be an array')
+        selected = {}
+        for column in columns:
+            if isinstance(column, str):
+                selected[column] = row.get(column)
+            elif 'column' in column:
+                selected[column.get('alias', column['column'])] = row.get(column['column'])
+            elif 'json' in column:
+                selected[column.get('alias', column['json']['column'])] = _json_property(row, column['json'])
+            else:
+                raise _StorageError('retrieve', 'return object must have either a column or json property')
+        return selected
+
+    @staticmethod
+    def _aggregate(rows, payload):
+        aggregates = payload['aggregate']
+        aggregates = aggregates if isinstance(aggregates, list) else [aggregates]
+        group = [column.strip() for column in payload['group'].split(',')] if 'group' in payload else []
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(row.get(column) for column in group), []).append(row)
+        if not group:
+            groups.setdefault((), [])
+
+        result = []
+        for key, members in groups.items():
+            aggregated = dict(zip(group, key))
+            for aggregate in aggregates:
+                function = _AGGREGATES.get(aggregate.get('operation'))
+                if function is None or 'column' not in aggregate:
+                    raise _StorageError('Select aggregation', 'Aggregates need a supported operation and a column')
+                values = [row[aggregate['column']] for row in members if row.get(aggregate['column']) is not None]
+                alias = aggregate.get('alias', '{}_{}'.format(aggregate['operation'], aggregate['column']))
+                aggregated[alias] = function(values) if values or function is len else None
+            result.append(aggregated)
+        return result
+
+
+class _Readings(object):
+    """ The readings table, in id order """
+
+    def __init__(self):
+        self._next_id = itertools.count(1)
+        self.rows = []
+        self._ids = []
+        self._epochs = []
+        self._keys = set()
+
+    def append(self, payload):
+        readings = payload.get('readings') if isinstance(payload, dict) else None
+        if not isinstance(readings, list):
+            raise _StorageError('appendReadings', 'Payload is missing the readings array')
+        now = _now()
+        keys = set()
+        for reading in readings:
+            if not isinstance(reading, dict):
+                raise _StorageError('appendReadings', 'Each reading in the readings array must be an object')
+            # read_key is unique, and the readings are inserted in one transaction
+            key = reading.get('read_key')
+            if key is not None:
+                if key in self._keys or key in keys:
+                    raise _StorageError('appendReadings', 'ERROR:  duplicate key value violates unique constraint '
+                                                          '"readings_read_key_key"\nDETAIL:  Key (read_key)=({}) '
+                                                          'already exists.\n'.format(key))
+                keys.add(key)
+        self._keys |= keys
+        for reading in readings:
+            user_ts = _value('appendReadings', reading.get('user_ts', 'now()'))
+            reading_id = next(self._next_id)
+            self.rows.append({'id': reading_id, 'asset_code': reading.get('asset_code'),
+                              'read_key': reading.get('read_key'), 'reading': reading.get('reading'),
+                              'user_ts': user_ts, 'ts': now})
+            self._ids.append(reading_id)
+            epoch = _epoch(user_ts) if isinstance(user_ts, str) else None
+            self._epochs.append(time.time() if epoch is None else epoch)
+        return len(readings)
+
+    def fetch(self, reading_id, count):
+        start = bisect_left(self._ids, reading_id)
+        rows = self.rows[start:start + count]
+        return {'count': len(rows), 'rows': rows}
+
+    def purge(self, age, sent, retain):
+        """ mirrors the storage plugins: age is in seconds and compared with user_ts """
+        oldest = time.time() - age
+        unsent_purged = 0
+        if not retain:
+            unsent_purged = sum(1 for row, epoch in zip(self.rows, self._epochs)
+                                if epoch < oldest and row['id'] > sent)
+        kept = [(row, epoch) for row, epoch in zip(self.rows, self._epochs)
+                if not (epoch < oldest and (not retain or row['id'] < sent))]
+        removed = len(self.rows) - len(kept)
+        self.rows = [row for row, _ in kept]
+        self._keys = {row['read_key'] for row in self.rows if row['read_key'] is not None}
+        self._ids = [row['id'] for row in self.rows]
+        self._epochs = [epoch for _, epoch in kept]
+        return {'removed': removed, 'unsentPurged': unsent_purged,
+                'unsentRetained': sum(1 for row in self.rows if row['id'] > sent),
+                'readings': len(self.rows)}
+
+
+class FakeStorageService(object):
+    """ An in-memory storage service for tests and benchmarks
+
+    The service runs an event loop on a thread of its own, so it serves blocking clients such as
+    Storage as well as coroutines on any event loop.
+    """
+
+    def __init__(self, tables=None, name=_SERVICE_NAME):
+        """
+        :param tables: optional initial rows, a list of row dicts for each table name; other
+            tables start empty when they are first used
+        :param name: the name of the service in the service registry
+        """
+        self.name = name
+        self.tables = {table: _Table(rows) for table, rows in (tables or {}).items()}
+        self.readings = _Readings()
+        self.port = None
+        self._service_id = None
+        self._loop = None
+        self._thread = None
+        self._started = time.time()
+
+    def _table(self, request):
+        name = request.match_info['table']
+        if name not in self.tables:
+            self.tables[name] = _Table()
+        return self.tables[name]
+
+    def rows(self, table):
+        """
+        :return: the rows of a table, or the readings for the table name "readings"
+        """
+        if table == 'readings':
+            return self.readings.rows
+        return self.tables[table].rows if table in self.tables else []
+
+    # Starting and stopping
+
+    def start(self, timeout=10):
+        """ serve on a free port of the loopback interface and register the service
+
+        :param timeout: seconds to wait for the service to listen
+        :return: self
+        :raises TimeoutError: the service did not listen in time
+        :raises Exception: the error that stopped the service from listening
+        """
+        started = threading.Event()
+        errors = []
+        self._thread = threading.Thread(target=self._run, args=(started, errors), daemon=True)
+        self._thread.start()
+        if not started.wait(timeout):
+            raise TimeoutError('The fake storage service did not start in {} seconds'.format(timeout))
+        if errors:
+            self._thread.join()
+            self._loop = None
+            raise errors[0]
+        self._service_id = Service.Instances.register(self.name, 'Storage', '127.0.0.1', self.port, self.port)
+        # Clients find this service rather than one they found before
+        _storage_service_cache.invalidate()
+        return self
+
+    def stop(self):
+        """ unregister the service and stop serving """
+        if self._service_id is not None:
+            Service.Instances.unregister(self._service_id)
+            self._service_id = None
+            _storage_service_cache.invalidate()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _run(self, started, errors):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            handler, server = self._listen()
+        except Exception as ex:
+            errors.append(ex)
+            self._loop.close()
+            started.set()
+            return
+        started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.run_until_complete(handler.shutdown(1))
+            self._loop.close()
+
+    def _listen(self):
+        app = web.Application()
+        app.router.add_route('POST', '/storage/table/{table}', self._insert)
+        app.router.add_route('PUT', '/storage/table/{table}', self._update)
+        app.router.add_route('DELETE', '/storage/table/{table}', self._delete)
+        app.router.add_route('GET', '/storage/table/{table}', self._simple_query)
+        app.router.add_route('PUT', '/storage/table/{table}/query', self._query)
+        app.router.add_route('POST', '/storage/reading', self._append)
+        app.router.add_route('GET', '/storage/reading', self._fetch)
+        app.router.add_route('PUT', '/storage/reading/query', self._reading_query)
+        app.router.add_route('PUT', '/storage/reading/purge', self._purge)
+        app.router.add_route('GET', '/foglamp/service/ping', self._ping)
+        handler = app.make_handler()
+        server = self._loop.run_until_complete(self._loop.create_server(handler, '127.0.0.1', 0))
+        self.port = server.sockets[0].getsockname()[1]
+        return handler, server
+
+    # Request handling
+
+    @staticmethod
+    async def _payload(request, entry_point):
+        body = await request.read()
+        if not body:
+            return None
+        try:
+            if request.content_type == _CBOR_CONTENT_TYPE:
+                return cbor2.loads(body)
+            return json.loads(body.decode())
+        except ValueError:
+            raise _StorageError(entry_point, 'Failed to parse JSON payload')
+
+    @staticmethod
+    def _respond(request, payload, binary=False):
+        if binary and _CBOR_CONTENT_TYPE in request.headers.get('Accept', ''):
+            return web.Response(body=cbor2.dumps(payload), content_type=_CBOR_CONTENT_TYPE)
+        return web.json_response(payload)
+
+    @staticmethod
+    def _error(error):
+        return web.json_response({'entryPoint': error.entry_point, 'message': str(error), 'retryable': False},
+                                 status=400)
+
+    @staticmethod
+    def _bad_request(message):
+        return web.json_response({'error': message}, status=400)
+
+    async def _insert(self, request):
+        try:
+            count = self._table(request).insert(await self._payload(request, 'insert'))
+        except _StorageError as ex:
+            return self._error(ex)
+        return web.json_response({'response': 'inserted', 'rows_affected': count})
+
+    async def _update(self, request):
+        try:
+            count = self._table(request).update(await self._payload(request, 'update') or {})
+        except _StorageError as ex:
+            return self._error(ex)
+        return web.json_response({'response': 'updated', 'rows_affected': count})
+
+    async def _delete(self, request):
+        try:
+            count = self._table(request).delete(await self._payload(request, 'delete'))
+        except _StorageError as ex:
+            return self._error(ex)
+        return web.json_response({'response': 'deleted', 'rows_affected': count})
+
+    async def _simple_query(self, request):
+        payload = {}
+        for column, value in request.query.items():
+            payload['where'] = {'column': column, 'condition': '=', 'value': value}
+        try:
+            return web.json_response(self._table(request).query(payload))
+        except _StorageError as ex:
+            return self._error(ex)
+
+    async def _query(self, request):
+        try:
+            return web.json_response(self._table(request).query(await self._payload(request, 'retrieve') or {}))
+        except _StorageError as ex:
+            return self._error(ex)
+
+    async def _append(self, request):
+        try:
+            count = self.readings.append(await self._payload(request, 'appendReadings'))
+        except _StorageError as ex:
+            return self._error(ex)
+        return web.json_response({'response': 'appended', 'readings_added': count})
+
+    async def _fetch(self, request):
+        for param in ('id', 'count'):
+            if param not in request.query:
+                return self._bad_request('Missing query parameter {}'.format(param))
+        result = self.readings.fetch(int(request.query['id']), int(request.query['count']))
+        return self._respond(request, result, binary=True)
+
+    async def _reading_query(self, request):
+        # The readings table shares the rows, queries do not change them
+        table = _Table()
+        table.rows = self.readings.rows
+        try:
+            result = table.query(await self._payload(request, 'retrieve') or {})
+        except _StorageError as ex:
+            return self._error(ex)
+        return self._respond(request, result, binary=True)
+
+    async def _purge(self, request):
+        for param in ('age', 'sent'):
+            if param not in request.query:
+                return self._bad_request('Missing query parameter {}'.format(param))
+        retain = request.query.get('flags') == 'retain'
+        return web.json_response(self.readings.purge(int(request.query['age']), int(request.query['sent']),
+                                                     retain))
+
+    async def _ping(self, request):
+        return web.json_response({'uptime': time.time() - self._started})
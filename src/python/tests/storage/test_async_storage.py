@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for foglamp.storage.async_storage"""
+
+import asyncio
+import json
+import cbor2
+import pytest
+from aiohttp import web
+
+from foglamp.core.service_registry.instance import Service
+from foglamp.storage.async_storage import AsyncReadings, AsyncStorage
+from foglamp.storage.exceptions import InvalidReadingsPurgeFlagParameters
+from foglamp.storage.storage import _storage_service_cache
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+class _StorageService(object):
+    """Serves /storage/... by echoing each request and the client port that sent it.
+    Responds with CBOR when the client accepts it."""
+
+    @staticmethod
+    async def _echo(request):
+        body = await request.read()
+        if request.content_type == 'application/cbor':
+            body = cbor2.loads(body)
+        else:
+            body = body.decode()
+        response = {'method': request.method, 'path': request.path_qs, 'body': body,
+                    'client_port': request.transport.get_extra_info('peername')[1]}
+        if request.headers.get('Accept') == 'application/cbor':
+            return web.Response(body=cbor2.dumps(response), content_type='application/cbor')
+        return web.json_response(response)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_route('*', '/storage/{tail:.*}', self._echo)
+        self._handler = app.make_handler()
+        self._server = await asyncio.get_event_loop().create_server(self._handler, '127.0.0.1', 0)
+        port = self._server.sockets[0].getsockname()[1]
+        self._service_id = Service.Instances.register('FogLAMP Storage', 'Storage', '127.0.0.1',
+                                                      port, port + 1)
+        # Each test has its own service
+        _storage_service_cache.invalidate()
+        return self
+
+    async def __aexit__(self, *args):
+        Service.Instances.unregister(self._service_id)
+        self._server.close()
+        await self._handler.shutdown()
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestAsyncStorage(object):
+    """Unit tests for foglamp.storage.async_storage
+    """
+
+    @pytest.mark.asyncio
+    async def test_table_calls(self):
+        async with _StorageService(), AsyncStorage() as storage:
+            result = await storage.insert_into_tbl('statistics', '{"key": "A"}')
+            assert ('POST', '/storage/table/statistics', '{"key": "A"}') == (
+                result['method'], result['path'], result['body'])
+
+            result = await storage.query_tbl('statistics', 'key=A')
+            assert '/storage/table/statistics?key=A' == result['path']
+
+            result = await storage.query_tbl_with_payload('statistics', '{}')
+            assert ('PUT', '/storage/table/statistics/query') == (result['method'], result['path'])
+
+            result = await storage.delete_from_tbl('statistics')
+            assert 'DELETE' == result['method']
+
+            with pytest.raises(TypeError):
+                await storage.update_tbl('statistics', 'not json')
+
+    @pytest.mark.asyncio
+    async def test_keep_alive(self):
+        async with _StorageService(), AsyncReadings(concurrency=1) as readings:
+            ports = {(await readings.fetch(1, 2))['client_port'] for _ in range(5)}
+            # One connection serves every request
+            assert 1 == len(ports)
+
+            results = await asyncio.gather(*[readings.query('{}') for _ in range(5)])
+            assert ports == {result['client_port'] for result in results}
+
+    @pytest.mark.asyncio
+    async def test_readings_calls(self):
+        async with _StorageService(), AsyncReadings() as readings:
+            result = await readings.append(json.dumps({'readings': []}))
+            assert ('POST', '/storage/reading') == (result['method'], result['path'])
+
+            result = await readings.purge('24', 100, 'RETAIN')
+            assert '/storage/reading/purge?age=24&sent=100&flags=retain' == result['path']
+
+            with pytest.raises(InvalidReadingsPurgeFlagParameters):
+                await readings.purge(24, 100, 'keep')
+
+    @pytest.mark.asyncio
+    async def test_cbor(self):
+        async with _StorageService(), AsyncReadings(binary=True) as readings:
+            payload = {'readings': [{'asset_code': 'a', 'reading': {'x': 1.5}}]}
+            result = await readings.append(payload)
+            assert payload == result['body']
+
+            result = await readings.query('{}')
+            assert 'PUT' == result['method']
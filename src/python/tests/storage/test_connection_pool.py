@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for the persistent connections of foglamp.storage.storage"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import http.client
+import json
+import cbor2
+import threading
+import pytest
+
+from foglamp.storage.storage import _ConnectionPool, _request
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers with the client port, in CBOR if the client accepts it; a request to /close
+    closes the connection afterwards and a request to /drop... closes it without responding"""
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    closed = threading.Event()
+    """Set when the server has closed a connection"""
+
+    def do_GET(self):
+        self.requests.append((self.command, self.path))
+        if self.path.startswith('/drop'):
+            self.close_connection = True
+            return
+        response = {'client_port': self.client_address[1]}
+        self.send_response(200)
+        if self.headers.get('Accept') == 'application/cbor':
+            body = cbor2.dumps(response)
+            self.send_header('Content-Type', 'application/cbor')
+        else:
+            body = json.dumps(response).encode()
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/close':
+            self.close_connection = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.do_GET()
+
+    do_PUT = do_POST
+    do_DELETE = do_POST
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingHTTPServer(HTTPServer):
+    def process_request(self, request, client_address):
+        threading.Thread(target=self.process_request_thread, args=(request, client_address),
+                         daemon=True).start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            _Handler.closed.set()
+
+
+@pytest.fixture
+def address():
+    _Handler.requests = []
+    _Handler.closed = threading.Event()
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield '127.0.0.1:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+def _client_port(pool, address, url='/'):
+    status, _, res = pool.request(address, 'GET', url)
+    assert 200 == status
+    return json.loads(res)['client_port']
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestConnectionPool(object):
+    """Unit tests for foglamp.storage.storage._ConnectionPool
+    """
+
+    def test_reuse(self, address):
+        pool = _ConnectionPool()
+        assert 1 == len({_client_port(pool, address) for _ in range(3)})
+
+    def test_reconnect(self, address):
+        pool = _ConnectionPool()
+        port = _client_port(pool, address, '/close')
+        # The server closed the connection after responding
+        assert port != _client_port(pool, address)
+
+    def test_idle_timeout(self, address):
+        pool = _ConnectionPool(idle_timeout=0)
+        assert _client_port(pool, address) != _client_port(pool, address)
+
+    def test_per_thread(self, address):
+        pool = _ConnectionPool()
+        ports = []
+        thread = threading.Thread(target=lambda: ports.append(_client_port(pool, address)))
+        thread.start()
+        thread.join()
+        assert ports[0] != _client_port(pool, address)
+        pool.close()
+
+    def test_cbor(self, address):
+        assert isinstance(_request(address, 'GET', '/')['client_port'], int)
+        assert isinstance(_request(address, 'GET', '/', headers={'Accept': 'application/cbor'})[
+            'client_port'], int)
+
+    def test_closed_connection_replaced(self, address):
+        pool = _ConnectionPool()
+        port = _client_port(pool, address, '/close')
+        # The server closes the connection after it has responded
+        assert _Handler.closed.wait(5)
+        status, _, res = pool.request(address, 'POST', '/', body='{}')
+        assert 200 == status
+        assert port != json.loads(res)['client_port']
+        # Sent once, on a new connection
+        assert [('GET', '/close'), ('POST', '/')] == _Handler.requests
+
+    @pytest.mark.parametrize("method, url, count", [
+        ('GET', '/drop', 2),
+        ('PUT', '/drop/query', 2),
+        ('PUT', '/drop', 1),  # An update, which can hold expressions such as value = value + 1
+        ('DELETE', '/drop', 1),
+        ('POST', '/drop', 1)
+    ])
+    def test_retry_only_idempotent(self, address, method, url, count):
+        pool = _ConnectionPool()
+        _client_port(pool, address)
+        with pytest.raises(http.client.RemoteDisconnected):
+            pool.request(address, method, url, body='{}')
+        assert count == len([r for r in _Handler.requests if r[1] == url])
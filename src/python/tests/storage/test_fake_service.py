@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for the fake storage service that other storage client tests use"""
+
+import json
+import pytest
+from unittest.mock import patch
+
+from fake_service import FakeStorageService
+from foglamp.storage.async_storage import AsyncReadings
+from foglamp.storage.payload_builder import PayloadBuilder
+from foglamp.storage.storage import Readings, Storage
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+def _readings(count, user_ts='now()', first=0):
+    return json.dumps({'readings': [{'asset_code': 'fake', 'read_key': str(idx), 'reading': {'x': idx},
+                                     'user_ts': user_ts} for idx in range(first, first + count)]})
+
+
+@pytest.fixture
+def service():
+    with FakeStorageService(tables={'streams': [{'id': 1, 'last_object': 0}]}) as fake:
+        yield fake
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestFakeStorageService(object):
+    """Unit tests for fake_service.FakeStorageService
+    """
+
+    def test_table_calls(self, service):
+        storage = Storage()
+        assert service.port == storage.service._port
+
+        result = storage.insert_into_tbl('statistics', json.dumps([{'key': 'A', 'value': 1},
+                                                                   {'key': 'B', 'value': 2}]))
+        assert {'response': 'inserted', 'rows_affected': 2} == result
+        assert [{'key': 'A', 'value': 1}] == storage.query_tbl('statistics', 'key=A')['rows']
+
+        payload = PayloadBuilder().SET(last_object=10, ts='now()').WHERE(['id', '=', 1]).payload()
+        assert 1 == storage.update_tbl('streams', payload)['rows_affected']
+        assert 10 == service.rows('streams')[0]['last_object']
+
+        payload = PayloadBuilder().WHERE(['key', '=', 'A']).payload()
+        assert 1 == storage.delete_from_tbl('statistics', payload)['rows_affected']
+        assert [{'key': 'B', 'value': 2}] == service.rows('statistics')
+
+    def test_query(self, service):
+        storage = Storage()
+        storage.insert_into_tbl('statistics', json.dumps([{'key': k, 'value': v} for k, v in
+                                                          [('A', 1), ('B', 2), ('A', 3), ('C', 4)]]))
+
+        payload = PayloadBuilder().SELECT('value').WHERE(['key', '=', 'A']).OR_WHERE(['value', '>', 3]) \
+            .ORDER_BY(['value', 'desc']).LIMIT(2).payload()
+        assert [{'value': 4}, {'value': 3}] == storage.query_tbl_with_payload('statistics', payload)['rows']
+
+        payload = PayloadBuilder().AGGREGATE(['sum', 'value']).GROUP_BY('key').ORDER_BY(['key']).payload()
+        assert [{'key': 'A', 'sum_value': 4}, {'key': 'B', 'sum_value': 2}, {'key': 'C', 'sum_value': 4}] == \
+            storage.query_tbl_with_payload('statistics', payload)['rows']
+
+        result = storage.query_tbl_with_payload('statistics', json.dumps({'timebucket': {}}))
+        assert 'retrieve' == result['entryPoint']
+
+    def test_readings(self, service):
+        readings = Readings()
+        assert {'response': 'appended', 'readings_added': 5} == readings.append(_readings(5))
+        # Binary is a setting of each client
+        assert Readings(binary=True)._accept() is not None
+        assert readings._accept() is None
+
+        rows = readings.fetch(2, 2)['rows']
+        assert [2, 3] == [row['id'] for row in rows]
+        assert {'x': 2} == rows[1]['reading']
+
+        payload = PayloadBuilder().WHERE(['id', '>', 3]).payload()
+        assert [4, 5] == [row['id'] for row in readings.query(payload)['rows']]
+
+    def test_purge(self, service):
+        readings = Readings()
+        readings.append(_readings(4, '2017-01-01 00:00:00.000+00'))
+        readings.append(_readings(1, first=4))
+
+        # Readings up to id 2 were sent, retain the old unsent readings
+        assert {'removed': 1, 'unsentPurged': 0, 'unsentRetained': 3, 'readings': 4} == \
+            readings.purge(3600, 2, 'retain')
+        assert {'removed': 3, 'unsentPurged': 2, 'unsentRetained': 1, 'readings': 1} == \
+            readings.purge(3600, 2, 'purge')
+
+    @pytest.mark.asyncio
+    async def test_async_readings(self, service):
+        async with AsyncReadings(binary=True) as readings:
+            await readings.append({'readings': [{'asset_code': 'fake', 'read_key': 'k', 'reading': {'x': 1.5},
+                                                 'user_ts': 'now()'}]})
+            blocks = []
+            async for block in readings.iter_blocks(1, 10):
+                blocks.append(block)
+        assert 1 == len(blocks)
+        assert {'x': 1.5} == blocks[0][0]['reading']
+
+    def test_read_key_unique(self, service):
+        readings = Readings()
+        readings.append(_readings(2))
+        # Like the storage plugins, nothing is appended when a key exists
+        result = readings.append(json.dumps({'readings': [{'asset_code': 'fake', 'read_key': 'new', 'reading': {}},
+                                                          {'asset_code': 'fake', 'read_key': '1', 'reading': {}}]}))
+        assert 'appendReadings' == result['entryPoint']
+        assert 'duplicate key' in result['message']
+        assert not result['retryable']
+        assert 2 == len(service.rows('readings'))
+
+    def test_start_error(self):
+        fake = FakeStorageService()
+        with patch.object(fake, '_listen', side_effect=OSError('Address already in use')):
+            with pytest.raises(OSError):
+                fake.start()
@@ -7,7 +7,7 @@ import pytest
 import json
 import os
 import py
-from foglamp.storage.payload_builder import PayloadBuilder
+from foglamp.storage.payload_builder import PayloadBuilder, Placeholder
 
 __author__ = "Vaibhav Singhal"
 __copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
@@ -296,3 +296,42 @@ class TestPayloadBuilderDelete:
     def test_delete_where_payload(self, input_where, input_table, expected):
         res = PayloadBuilder().DELETE(input_table).WHERE(input_where).payload()
         assert expected == json.loads(res)
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("payload_builder")
+class TestPayloadBuilderTemplate:
+    """
+    This class tests payloads compiled into templates and builders used at the same time
+    """
+    def test_render(self):
+        template = PayloadBuilder() \
+            .WHERE(["id", ">", Placeholder("last")]) \
+            .LIMIT(Placeholder("count")) \
+            .ORDER_BY(["id", "asc"]) \
+            .compile()
+        assert {"last", "count"} == template.placeholders
+
+        expected = PayloadBuilder().WHERE(["id", ">", 10]).LIMIT(5).ORDER_BY(["id", "asc"]).payload()
+        assert json.loads(expected) == json.loads(template.render(last=10, count=5))
+        assert "name" == json.loads(template.render(last="name", count=1))["where"]["value"]
+
+        with pytest.raises(KeyError):
+            template.render(last=10)
+
+    def test_literal_values_not_replaced(self):
+        template = PayloadBuilder().WHERE(["key", "=", ":abc"]).AND_WHERE(["id", ">", Placeholder("abc")]) \
+            .compile()
+        payload = json.loads(template.render(abc=5))
+        assert ":abc" == payload["where"]["value"]
+        assert 5 == payload["where"]["and"]["value"]
+
+    def test_placeholder_needs_compile(self):
+        with pytest.raises(TypeError):
+            PayloadBuilder().LIMIT(Placeholder("count")).payload()
+
+    def test_builders_are_independent(self):
+        first = PayloadBuilder().WHERE(["id", ">", 1])
+        second = PayloadBuilder().FROM("test")
+        assert {"where": {"column": "id", "condition": ">", "value": 1}} == json.loads(first.payload())
+        assert {"table": "test"} == json.loads(second.payload())
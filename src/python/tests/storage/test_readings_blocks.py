@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for iterating over readings in blocks"""
+
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+from foglamp.storage.async_storage import AsyncReadings
+from foglamp.storage.storage import Readings, Storage
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_IDS = [1, 2, 4, 5, 9]
+"""Reading ids with gaps, as left by purges"""
+
+
+def _fetch(reading_id, count):
+    rows = [{'id': idx} for idx in _IDS if idx >= reading_id][:count]
+    return {'count': len(rows), 'rows': rows}
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestReadingsBlocks(object):
+    """Unit tests for Readings.iter_blocks and AsyncReadings.iter_blocks
+    """
+
+    def test_iter_blocks(self):
+        fetched = []
+        prefetched = threading.Event()
+
+        def fetch(reading_id, count):
+            fetched.append(reading_id)
+            if len(fetched) == 2:
+                prefetched.set()
+            return _fetch(reading_id, count)
+
+        with patch.object(Storage, '__init__', new=lambda self: setattr(self, 'service_address', '')):
+            readings = Readings()
+
+        with patch.object(readings, 'fetch', side_effect=fetch):
+            blocks = readings.iter_blocks(2, 2)
+            assert [{'id': 2}, {'id': 4}] == next(blocks)
+            # The next block is fetched before it is requested
+            assert prefetched.wait(5)
+            assert [[{'id': 5}, {'id': 9}]] == list(blocks)
+
+        assert [2, 5, 10] == fetched
+
+    @pytest.mark.asyncio
+    async def test_async_iter_blocks(self):
+        fetched = []
+
+        async def fetch(reading_id, count):
+            fetched.append(reading_id)
+            return _fetch(reading_id, count)
+
+        with patch('foglamp.storage.async_storage.Storage', return_value=MagicMock(base_url='', service_address='')):
+            readings = AsyncReadings()
+
+        with patch.object(readings, 'fetch', side_effect=fetch):
+            blocks = []
+            async for block in readings.iter_blocks(1, 3):
+                blocks.append(block)
+
+        assert [[{'id': 1}, {'id': 2}, {'id': 4}], [{'id': 5}, {'id': 9}]] == blocks
+        assert [1, 5, 10] == fetched
+
+    @pytest.mark.asyncio
+    async def test_async_iter_blocks_aclose(self):
+        started = []
+
+        async def fetch(reading_id, count):
+            started.append(reading_id)
+            if reading_id > 1:
+                await asyncio.sleep(10)
+            return _fetch(reading_id, count)
+
+        with patch('foglamp.storage.async_storage.Storage', return_value=MagicMock(base_url='', service_address='')):
+            readings = AsyncReadings()
+
+        with patch.object(readings, 'fetch', side_effect=fetch):
+            blocks = readings.iter_blocks(1, 3)
+            assert [{'id': 1}, {'id': 2}, {'id': 4}] == await blocks.__anext__()
+            prefetch = blocks._block
+            await blocks.aclose()
+            await asyncio.sleep(0)
+            assert prefetch.cancelled()
+            with pytest.raises(StopAsyncIteration):
+                await blocks.__anext__()
+        # The prefetch was cancelled before it could run
+        assert [1] == started
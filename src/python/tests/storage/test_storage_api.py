@@ -229,6 +229,19 @@ class TestStorageInsert:
         result = Storage().insert_into_tbl("statistics", payload)
         assert "ERROR" in result["message"]
 
+    def test_insert_rows(self):
+        payload = json.dumps([{'key': 'TEST_4', 'description': 'test', 'value': 11, 'previous_value': 2},
+                              {'key': 'TEST_5', 'description': 'test'}])
+        result = Storage().insert_into_tbl("statistics", payload)
+        assert result == {'rows_affected': 2, 'response': 'inserted'}
+
+    def test_invalid_insert_rows(self):
+        payload = json.dumps([{'key': 'TEST_6', 'description': 'test'}, {'key': 'TEST_7'}])
+        result = Storage().insert_into_tbl("statistics", payload)
+        assert result["message"].startswith("Row 1: ERROR")
+        result = Storage().query_tbl("statistics", "key=TEST_6")
+        assert result["count"] == 0
+
     def test_insert_json_data(self):
         payload = PayloadBuilder().INSERT(asset_code='TEST_STORAGE_CLIENT',
                                           read_key='74540500-0ac2-4166-afa7-9dd1a93a10e5'
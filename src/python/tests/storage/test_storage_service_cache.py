@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for the storage service cache of foglamp.storage.storage"""
+
+import socket
+import pytest
+from unittest.mock import patch
+
+from foglamp.core.service_registry.instance import Service
+from foglamp.storage.storage import _StorageServiceCache, _request, _storage_service_cache, Storage
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestStorageServiceCache(object):
+    """Unit tests for foglamp.storage.storage._StorageServiceCache
+    """
+
+    def test_get(self):
+        service = Service('1', 'FogLAMP Storage', 'Storage', 'http', '127.0.0.1', 8080, 1081)
+        cache = _StorageServiceCache()
+        with patch.object(Service.Instances, 'get', return_value=[service]) as get:
+            assert service is cache.get()
+            assert service is cache.get()
+            assert 1 == get.call_count
+
+            cache.invalidate()
+            cache.get()
+            assert 2 == get.call_count
+
+            # Expired
+            cache = _StorageServiceCache(ttl=0)
+            cache.get()
+            cache.get()
+            assert 4 == get.call_count
+
+    def test_storage(self):
+        service = Service('1', 'FogLAMP Storage', 'Storage', 'http', '127.0.0.1', 8080, 1081)
+        _storage_service_cache.invalidate()
+        with patch.object(Service.Instances, 'get', return_value=[service]) as get:
+            assert '127.0.0.1:8080' == Storage().base_url
+            assert '127.0.0.1:8080' == Storage().base_url
+            assert 1 == get.call_count
+
+    def test_invalidate_on_connection_error(self):
+        # A port that nothing listens on
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            address = '127.0.0.1:{}'.format(sock.getsockname()[1])
+
+        with patch.object(_storage_service_cache, 'invalidate') as invalidate:
+            with pytest.raises(ConnectionError):
+                _request(address, 'GET', '/storage/table/statistics')
+        assert invalidate.called
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# FOGLAMP_BEGIN
+# See: http://foglamp.readthedocs.io/
+# FOGLAMP_END
+
+"""Unit test for reaching a local storage service through its Unix domain socket"""
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+import asyncio
+import itertools
+import json
+import os
+import socketserver
+import tempfile
+import threading
+from unittest.mock import patch
+import pytest
+from aiohttp import web
+
+from foglamp.core.service_registry.instance import Service
+from foglamp.storage.async_storage import AsyncStorage
+from foglamp.storage.storage import _ConnectionPool, _storage_service_cache, Storage
+
+__author__ = "Praveen Garg"
+__copyright__ = "Copyright (c) 2017 OSIsoft, LLC"
+__license__ = "Apache 2.0"
+__version__ = "${VERSION}"
+
+_connection_ids = itertools.count()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Answers with the path and a number that identifies the connection"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.connection_id = next(_connection_ids)
+
+    def do_GET(self):
+        body = json.dumps({'path': self.path, 'connection': self.connection_id}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        return 'local'
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def socket_path():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'storage.sock')
+        server = _ThreadingUnixServer(path, _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield path
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def _registered(address, socket_path):
+    service_id = Service.Instances.register('FogLAMP Storage', 'Storage', address, 8080, 1081,
+                                            socket=socket_path)
+    _storage_service_cache.invalidate()
+    try:
+        yield
+    finally:
+        Service.Instances.unregister(service_id)
+        _storage_service_cache.invalidate()
+
+
+def _storage(address, socket_path):
+    with _registered(address, socket_path):
+        return Storage()
+
+
+@pytest.allure.feature("unit")
+@pytest.allure.story("storage client")
+class TestUnixSocket(object):
+    """Unit tests for the Unix domain socket transport of foglamp.storage
+    """
+
+    def test_local_service(self, socket_path):
+        assert socket_path == _storage('localhost', socket_path).service_address
+        assert socket_path == _storage('127.0.0.1', socket_path).service_address
+
+    def test_remote_service(self, socket_path):
+        assert '10.0.0.1:8080' == _storage('10.0.0.1', socket_path).service_address
+
+    def test_missing_socket(self, socket_path):
+        assert 'localhost:8080' == _storage('localhost', None).service_address
+        assert 'localhost:8080' == _storage('localhost', socket_path + '.old').service_address
+
+    def test_socket_checked_once(self, socket_path):
+        with _registered('localhost', socket_path), \
+                patch('foglamp.storage.storage.os.stat', side_effect=os.stat) as stat:
+            assert socket_path == Storage().service_address
+            assert socket_path == Storage().service_address
+            assert 1 == stat.call_count
+
+            # Checked again with the service record
+            _storage_service_cache.invalidate()
+            assert socket_path == Storage().service_address
+            assert 2 == stat.call_count
+
+    def test_pool(self, socket_path):
+        pool = _ConnectionPool()
+        connections = set()
+        for _ in range(3):
+            status, _, res = pool.request(socket_path, 'GET', '/storage/table/statistics')
+            assert 200 == status
+            connections.add(json.loads(res.decode())['connection'])
+        # One connection serves every request
+        assert 1 == len(connections)
+        pool.close()
+
+    def test_query(self, socket_path):
+        storage = _storage('localhost', socket_path)
+        assert '/storage/table/statistics?key=A' == storage.query_tbl('statistics', 'key=A')['path']
+
+    @pytest.mark.asyncio
+    async def test_async_query(self):
+        async def echo(request):
+            return web.json_response({'path': request.path_qs})
+
+        app = web.Application()
+        app.router.add_route('*', '/storage/{tail:.*}', echo)
+        handler = app.make_handler()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'storage.sock')
+            server = await asyncio.get_event_loop().create_unix_server(handler, path)
+            try:
+                with _registered('localhost', path):
+                    storage = AsyncStorage()
+                async with storage:
+                    result = await storage.query_tbl('statistics', 'key=A')
+                    assert '/storage/table/statistics?key=A' == result['path']
+            finally:
+                server.close()
+                await handler.shutdown()
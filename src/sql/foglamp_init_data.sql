@@ -109,7 +109,10 @@ INSERT INTO foglamp.statistics ( key, description, value, previous_value )
             ( 'UNSENT',     'The number of readings filtered out in the send process', 0, 0 ),
             ( 'PURGED',     'The number of readings removed from the buffer by the purge process', 0, 0 ),
             ( 'UNSNPURGED', 'The number of readings that were purged from the buffer before being sent', 0, 0 ),
-            ( 'DISCARDED',  'The number of readings discarded at the input side by FogLAMP, i.e. discarded before being  placed in the buffer. This may be due to some error in the readings themselves.', 0, 0 );
+            ( 'DISCARDED',  'The number of readings discarded at the input side by FogLAMP, i.e. discarded before being  placed in the buffer. This may be due to some error in the readings themselves.', 0, 0 ),
+            ( 'INGESTCONN', 'The number of storage connections opened by the device service to insert readings', 0, 0 ),
+            ( 'INGESTFAIL', 'The number of failed attempts by the device service to insert readings into storage', 0, 0 ),
+            ( 'SPILLDEPTH', 'The number of readings the device service has stored on disk because they did not fit in memory', 0, 0 );
 
 -- Schedules
 -- Use this to create guids: https://www.uuidgenerator.net/version1 */